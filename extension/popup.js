@@ -318,13 +318,14 @@ async function handleProductData(response, url, fromGemini = false) {
       
       // Try to fetch final_output from JSON file if filepath is provided
       let finalOutputData = null;
-      if (result.final_output_file) {
+      const finalOutputId = result.final_output_id || result.final_output_file;
+      if (finalOutputId) {
         try {
-          // Extract filename from filepath (e.g., "final_output_20251109_071249.json")
-          const filename = result.final_output_file.split(/[/\\]/).pop();
-          console.log('Fetching final_output from file:', filename);
+          // Older servers returned a file path; only the last segment is the id
+          const outputId = finalOutputId.split(/[/\\]/).pop();
+          console.log('Fetching final_output:', outputId);
           
-          const fileResponse = await fetch(`${BACKEND_URL}/api/final-output/${filename}`);
+          const fileResponse = await fetch(`${BACKEND_URL}/api/final-output/${encodeURIComponent(outputId)}`);
           if (fileResponse.ok) {
             finalOutputData = await fileResponse.json();
             console.log('Loaded final_output from JSON file:', finalOutputData);
@@ -65,31 +65,18 @@ def _fallback_match_category(product_json: Dict[str, Any], transformed: Dict[str
     return None
 
 
-def _construct_category_prompt(product_json: Dict[str, Any], transformed: Dict[str, Any], categories: List[str]) -> str:
+def _category_prompt_prefix(categories: List[str]) -> str:
     """
-    Build a prompt asking the LLM to choose exactly one of the provided categories (or null)
-    and provide chain-of-thought reasoning in plain text. Ask to output a single JSON object only.
+    The part of the category prompt that depends only on the category list:
+    instructions, the categories and the output rules. It is identical for
+    every product, so it comes first and is cached provider-side.
     """
-    product_summary = {
-        "name": product_json.get("name"),
-        "brand": product_json.get("brand"),
-        "original_category": product_json.get("category"),
-        "short_description": product_json.get("short_description") or product_json.get("description"),
-        "materials": [
-            {"name": m.get("name"), "weight": m.get("weight"), "weight_source": m.get("weight_source")}
-            for m in (transformed.get("materials") or [])
-        ],
-    }
     categories_list_text = ", ".join(categories)
-    prompt = f"""
-You are given a product and a fixed set of EXACT category names (these are canonical labels).
+    return f"""You are given a product and a fixed set of EXACT category names (these are canonical labels).
 Choose exactly ONE of the provided category names that best fits the product, or return null if none apply.
 
 Categories (choose one of these exact strings): [{categories_list_text}]
 
-Product (JSON):
-{json.dumps(product_summary, ensure_ascii=False)}
-
 Output requirement (READ CAREFULLY):
 1) Output ONLY a single JSON object (no other text). The JSON must have two keys:
    - "category": one of the exact category strings above OR null
@@ -102,8 +89,23 @@ Output requirement (READ CAREFULLY):
 
 Return only the JSON object. Example (for format only — do NOT emulate content):
 {{"category":"tshirts","reasoning":"I saw 'tee' in the title, material cotton, ..."}}
+
 """
-    return prompt.strip()
+
+
+def _category_prompt_product(product_json: Dict[str, Any], transformed: Dict[str, Any]) -> str:
+    """The per-product part of the category prompt."""
+    product_summary = {
+        "name": product_json.get("name"),
+        "brand": product_json.get("brand"),
+        "original_category": product_json.get("category"),
+        "short_description": product_json.get("short_description") or product_json.get("description"),
+        "materials": [
+            {"name": m.get("name"), "weight": m.get("weight"), "weight_source": m.get("weight_source")}
+            for m in (transformed.get("materials") or [])
+        ],
+    }
+    return f"Product (JSON):\n{json.dumps(product_summary, ensure_ascii=False)}\n"
 
 
 def _extract_first_json_block(text: str) -> Optional[str]:
@@ -273,44 +275,32 @@ def _build_carbon_cot(transformed: Dict[str, Any], carbon_result: Dict[str, Any]
     return "\n".join(lines)
 
 
-def arrange_product(product_json: Dict[str, Any],
-                    transformed: Dict[str, Any],
-                    carbon_result: Dict[str, Any],
-                    model: Optional[str] = "gemini-2.5-flash-lite",
-                    temperature: float = 0.0,
-                    max_tokens: int = 512) -> Dict[str, Any]:
+def parse_category_response(raw: str, categories: List[str]):
     """
-    Use LLM to choose one of the canonical categories and produce cf_detail containing:
-      - LLM category reasoning (chain-of-thought plaintext)
-      - Deterministic carbon calculation chain-of-thought (plaintext)
-    Return dict suitable for database.insert_product(...)
+    (category, reasoning) from the LLM's JSON answer. A category that is not
+    exactly one of ``categories`` becomes None. Raises ValueError when the
+    answer is not a JSON object.
+    """
+    parsed = _safe_load_json(raw)
+    if not isinstance(parsed, dict):
+        raise ValueError("category response is not a JSON object")
+    cat = parsed.get("category")
+    reasoning = parsed.get("reasoning")
+    # Not an exact match (or an explicit null) -> None
+    category_choice = cat if cat in categories else None
+    return category_choice, reasoning if isinstance(reasoning, str) else None
+
+
+def build_record(product_json: Dict[str, Any],
+                 transformed: Dict[str, Any],
+                 carbon_result: Dict[str, Any],
+                 categories: List[str],
+                 category_choice: Optional[str],
+                 llm_reasoning: Optional[str]) -> Dict[str, Any]:
+    """
+    The database record for a product whose category has been decided (by
+    the LLM, or None to use the token-matching fallback).
     """
-    categories = _load_flat_categories(CATEGORIES_PATH)
-    category_choice = None
-    llm_reasoning = None
-
-    if categories:
-        prompt = _construct_category_prompt(product_json, transformed, categories)
-        try:
-            raw = call_llm(prompt, model=model, temperature=temperature, max_tokens=max_tokens)
-            parsed = _safe_load_json(raw)
-            if isinstance(parsed, dict):
-                cat = parsed.get("category")
-                reasoning = parsed.get("reasoning")
-                if cat in categories:
-                    category_choice = cat
-                else:
-                    # allow explicit null
-                    if cat is None:
-                        category_choice = None
-                    else:
-                        # Not an exact match -> fallback to None
-                        category_choice = None
-                llm_reasoning = reasoning if isinstance(reasoning, str) else None
-        except Exception:
-            logging.exception("LLM category classification failed - will fallback to heuristic.")
-            category_choice = None
-
     if category_choice is None:
         category_choice = _fallback_match_category(product_json, transformed, categories)
 
@@ -361,6 +351,35 @@ def arrange_product(product_json: Dict[str, Any],
     return out
 
 
+def arrange_product(product_json: Dict[str, Any],
+                    transformed: Dict[str, Any],
+                    carbon_result: Dict[str, Any],
+                    model: Optional[str] = "gemini-2.5-flash-lite",
+                    temperature: float = 0.0,
+                    max_tokens: int = 512) -> Dict[str, Any]:
+    """
+    Use LLM to choose one of the canonical categories and produce cf_detail containing:
+      - LLM category reasoning (chain-of-thought plaintext)
+      - Deterministic carbon calculation chain-of-thought (plaintext)
+    Return dict suitable for database.insert_product(...)
+    """
+    categories = _load_flat_categories(CATEGORIES_PATH)
+    category_choice = None
+    llm_reasoning = None
+
+    if categories:
+        prefix = _category_prompt_prefix(categories)
+        try:
+            raw = call_llm(_category_prompt_product(product_json, transformed), model=model,
+                           temperature=temperature, max_tokens=max_tokens, cached_prefix=prefix)
+            category_choice, llm_reasoning = parse_category_response(raw, categories)
+        except Exception:
+            logging.exception("LLM category classification failed - will fallback to heuristic.")
+            category_choice = None
+
+    return build_record(product_json, transformed, carbon_result, categories, category_choice, llm_reasoning)
+
+
 if __name__ == "__main__":
     # Quick local test scaffold
     example_raw = {
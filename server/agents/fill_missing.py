@@ -0,0 +1,62 @@
+import json
+from typing import Any, Dict
+
+
+def construct_fill_prompt(transform_result: Dict[str, Any], analysis_text: str) -> str:
+    """
+    Prompt asking the LLM to fill the null values of a transform result from
+    a product-page analysis, keeping every non-null value as it is.
+    """
+    return f"""You are a data completion agent. Your task is to fill in missing (null) values in a carbon footprint calculation input JSON based on product analysis.
+
+The product analysis provides detailed information about the product:
+{analysis_text}
+
+Current transform result (with some null values):
+{json.dumps(transform_result, indent=2, ensure_ascii=False)}
+
+Your task:
+1. Identify all null values in the transform result
+2. Use the product analysis to estimate reasonable values for these null fields
+3. Return ONLY a valid JSON object with the same structure as the transform result, but with null values filled in based on estimation
+4. Keep all existing non-null values exactly as they are
+5. For numeric fields, provide reasonable estimates (e.g., weight in kg, distances in km, emission factors)
+6. For string fields, provide reasonable values (e.g., material names, locations)
+7. Mark estimated values in the "source" fields as "estimated_from_analysis" or "model_based_estimate"
+
+Return ONLY the JSON object, no explanations or markdown. The JSON must be valid and parseable.
+
+Example structure:
+{{
+  "materials": [
+    {{
+      "name": "material_name",
+      "weight": 0.5,
+      "weight_source": "estimated_from_analysis",
+      "emission_factor": 2.5,
+      "emission_factor_source": "estimated_from_analysis"
+    }}
+  ],
+  "manufacturing_factor": {{
+    "value": 1.2,
+    "source": "estimated_from_analysis"
+  }},
+  "transport": {{
+    "origin": "China",
+    "distance_km": 10000,
+    "mode": "ship",
+    "emission_factor_ton_km": 0.01,
+    "source": "estimated_from_analysis"
+  }},
+  "packaging": {{
+    "weight": 0.1,
+    "emission_factor": 2.0,
+    "source": "estimated_from_analysis"
+  }},
+  "product_weight": {{
+    "value": 1.5,
+    "source": "estimated_from_analysis"
+  }}
+}}
+
+Now fill in the null values in the transform result based on the analysis:"""
@@ -1,29 +1,82 @@
 import os
-import json
 import shutil
 import tempfile
-from google import genai
-from google.genai import types
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from dotenv import load_dotenv
 from datetime import datetime
 
+try:
+    from server.services import fast_json
+    from server.services.artifact_store import get_artifact_store
+    from server.services.image_encoding import EncodingStats, encode_image, describe as describe_encoding
+    from server.services.upload_cache import UploadCache
+    from server.services.prompt_cache import get_prompt_cache
+    from server.services.registry import registry
+except ImportError:
+    from services import fast_json
+    from services.artifact_store import get_artifact_store
+    from services.image_encoding import EncodingStats, encode_image, describe as describe_encoding
+    from services.upload_cache import UploadCache
+    from services.prompt_cache import get_prompt_cache
+    from services.registry import registry
+
 load_dotenv()
 
-# Initialize Gemini client
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
 
-client = genai.Client(api_key=GEMINI_API_KEY)
 
+def _build_client():
+    from google import genai
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    return genai.Client(api_key=GEMINI_API_KEY)
 
-def analyze_product_images(image_paths, product_name=None):
-    if not image_paths:
-        return {"error": "No image paths provided"}
-    
-    try:
-        # Prepare the prompt
-        prompt = f"""Analyze these product images and extract ALL available product information. Please provide a detailed, structured analysis including:
+
+# The Gemini client (and the SDK import) is created on first use, not at import
+registry.register("gemini_client", _build_client)
+
+
+def get_client():
+    client = registry.get("gemini_client")
+    if client is None:
+        raise ImportError("google-genai SDK not installed. Please add it to requirements.")
+    return client
+
+# Bounded pool shared by all requests for image encoding and uploads
+GEMINI_UPLOAD_WORKERS = int(os.getenv("GEMINI_UPLOAD_WORKERS", 4))
+_pool = None
+_pool_lock = threading.Lock()
+
+# Uploaded file handles by content hash, reused until shortly before they expire
+upload_cache = UploadCache()
+# The analysis instructions as Gemini cached content, refreshed before it expires
+prompt_cache = get_prompt_cache("gemini_image", get_client)
+
+
+def _image_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=GEMINI_UPLOAD_WORKERS, thread_name_prefix="gemini-image")
+    return _pool
+
+
+def _upload(data, mime_type):
+    return get_client().files.upload(file=BytesIO(data), config={"mime_type": mime_type})
+
+
+def _inline(encoded):
+    from google.genai import types
+    return types.Part.from_bytes(data=encoded.data, mime_type=encoded.mime_type)
+
+
+IMAGE_ANALYSIS_MODEL = "gemini-2.0-flash-exp"
+
+# Static instructions for every image analysis; registered once as cached content
+IMAGE_ANALYSIS_PROMPT = """Analyze these product images and extract ALL available product information. Please provide a detailed, structured analysis including:
 
 **BASIC INFORMATION:**
 1. Product Name/Title - The exact product name as shown
@@ -53,61 +106,72 @@ def analyze_product_images(image_paths, product_name=None):
 
 Please be thorough and extract every piece of information you can see in these images. Format your response clearly with sections and bullet points where appropriate.
 """
+
+
+def analyze_product_images(image_paths, product_name=None):
+    if not image_paths:
+        return {"error": "No image paths provided"}
+    
+    try:
         
+        # Per-call text; the instructions are sent as the cached prefix
+        prompt = ""
         if product_name:
             prompt += f"\nThe product being searched for is: {product_name}\n"
         
-        # Prepare contents list with prompt and images
-        contents = [prompt]
+        # Encode and upload every image concurrently; identical images reuse earlier uploads
+        encoding_stats = EncodingStats()
         
-        # Upload and add images
-        for idx, image_path in enumerate(image_paths):
+        def prepare(idx, image_path):
             if not os.path.exists(image_path):
                 print(f"Warning: Image not found: {image_path}")
-                continue
-            
-            # For the first image, upload it
-            if idx == 0:
-                try:
-                    uploaded_file = client.files.upload(file=image_path)
-                    contents.append(uploaded_file)
-                    print(f"  Uploaded image {idx + 1}: {os.path.basename(image_path)}")
-                except Exception as e:
-                    print(f"  Error uploading image {idx + 1}: {e}")
-                    # Fallback to inline data
-                    with open(image_path, 'rb') as f:
-                        img_bytes = f.read()
-                    contents.append(
-                        types.Part.from_bytes(
-                            data=img_bytes,
-                            mime_type='image/png'
-                        )
-                    )
-            else:
-                # For subsequent images, use inline data
-                try:
-                    with open(image_path, 'rb') as f:
-                        img_bytes = f.read()
-                    contents.append(
-                        types.Part.from_bytes(
-                            data=img_bytes,
-                            mime_type='image/png'
-                        )
-                    )
-                    print(f"  Added image {idx + 1}: {os.path.basename(image_path)}")
-                except Exception as e:
-                    print(f"  Error reading image {idx + 1}: {e}")
-                    continue
+                return None
+            try:
+                encoded = encode_image(image_path)
+            except Exception as e:
+                print(f"  Error encoding image {idx + 1}: {e}")
+                return None
+            encoding_stats.add(encoded)
+            try:
+                uploaded_file = upload_cache.get_or_upload(encoded.data, encoded.mime_type, _upload)
+                print(f"  Image {idx + 1} ready: {os.path.basename(image_path)} ({len(encoded.data)} bytes)")
+                return encoded, uploaded_file
+            except Exception as e:
+                print(f"  Error uploading image {idx + 1}: {e}")
+                # Fallback to inline data
+                return encoded, _inline(encoded)
+        
+        futures = [_image_pool().submit(prepare, idx, path) for idx, path in enumerate(image_paths)]
+        # Keep the images in page order
+        prepared = [item for item in (f.result() for f in futures) if item is not None]
+        
+        image_bytes = encoding_stats.as_dict()
+        print(f"  Image encoding: {describe_encoding(image_bytes)}")
         
-        if len(contents) == 1:  # Only prompt, no images
+        if not prepared:
             return {"error": "No valid images could be processed"}
         
+        def generate(image_parts):
+            def call(prefix_text, config):
+                text = prefix_text + prompt
+                contents = ([text] if text else []) + image_parts
+                return get_client().models.generate_content(
+                    model=IMAGE_ANALYSIS_MODEL,
+                    contents=contents,
+                    **({"config": config} if config else {})
+                )
+            return prompt_cache.generate(IMAGE_ANALYSIS_MODEL, IMAGE_ANALYSIS_PROMPT, call)
+        
         # Generate content with Gemini
-        print(f"  Sending {len(contents) - 1} images to Gemini for analysis...")
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=contents
-        )
+        print(f"  Sending {len(prepared)} images to Gemini for analysis...")
+        try:
+            response = generate([part for _, part in prepared])
+        except Exception as e:
+            # A cached upload may have been deleted server-side; forget them and retry once inline
+            print(f"  Analysis with uploaded files failed ({e}), retrying with inline images...")
+            for encoded, _ in prepared:
+                upload_cache.invalidate(encoded.data, encoded.mime_type)
+            response = generate([_inline(encoded) for encoded, _ in prepared])
         
         # Extract the response text
         analysis_text = response.text if hasattr(response, 'text') else str(response)
@@ -115,8 +179,11 @@ Please be thorough and extract every piece of information you can see in these i
         return {
             "success": True,
             "analysis": analysis_text,
-            "images_analyzed": len(contents) - 1,
-            "model": "gemini-2.0-flash-exp"
+            "images_analyzed": len(prepared),
+            "image_bytes": image_bytes,
+            "upload_cache": upload_cache.metrics(),
+            "prompt_cache": prompt_cache.metrics(),
+            "model": IMAGE_ANALYSIS_MODEL
         }
         
     except Exception as e:
@@ -154,8 +221,8 @@ def search_and_analyze_product(product_name, save_json=True, output_dir=None):
     
     Args:
         product_name: Name of the product to search for
-        save_json: Whether to save the result as JSON file (default: True)
-        output_dir: Directory to save JSON file (default: current directory)
+        save_json: Whether to save the result as JSON (default: True)
+        output_dir: Directory to write a JSON file to (default: store it in the artifact store)
     
     Returns:
         Dictionary with complete product analysis including screenshots and Gemini analysis
@@ -251,10 +318,7 @@ def search_and_analyze_product(product_name, save_json=True, output_dir=None):
         }
         
         # Save JSON if requested
-        if save_json:
-            if output_dir is None:
-                output_dir = os.path.dirname(os.path.dirname(__file__))
-            
+        if save_json and output_dir is not None:
             os.makedirs(output_dir, exist_ok=True)
             
             # Create filename
@@ -265,11 +329,14 @@ def search_and_analyze_product(product_name, save_json=True, output_dir=None):
             json_filepath = os.path.join(output_dir, json_filename)
             
             # Save JSON
-            with open(json_filepath, 'w', encoding='utf-8') as f:
-                json.dump(json_result, f, indent=2, ensure_ascii=False)
+            fast_json.dump_file(json_result, json_filepath)
             
             print(f"\nJSON result saved to: {json_filepath}")
             json_result["json_filepath"] = json_filepath
+        elif save_json:
+            json_ref = get_artifact_store().put_json(json_result, "product_analysis", product=product_name)
+            print(f"\nJSON result stored as artifact: {json_ref['key']}")
+            json_result["json_artifact_key"] = json_ref["key"]
         
         return json_result
         
@@ -314,6 +381,8 @@ if __name__ == "__main__":
         
         if result.get("json_filepath"):
             print(f"\nJSON saved to: {result.get('json_filepath')}")
+        elif result.get("json_artifact_key"):
+            print(f"\nJSON stored as artifact: {result.get('json_artifact_key')}")
         
         # Print first result analysis
         if result.get("results"):
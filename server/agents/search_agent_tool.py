@@ -1,23 +1,44 @@
 import os
-import json
 import tempfile
 import shutil
 from serpapi import GoogleSearch
 from dotenv import load_dotenv
 from langchain.tools import tool
 from playwright.sync_api import sync_playwright
-import base64
+import time
 from datetime import datetime
-import re
-from PIL import Image
+from typing import Optional
+
+try:
+    from server.services.artifact_store import get_artifact_store
+    from server.services.tiling import REVIEWS_TOP_JS, TILE_CLIP_AT_REVIEWS, capture_height
+    from server.services.screenshot_tiles import split_and_store
+    from server.services.tile_filter import get_tile_filter
+    from server.services.structured_extract import EXTRACTION_MODE, analyze_extraction, extract_product, is_sufficient
+    from server.services.http_fetch import get_http_fetcher
+    from server.services.resource_policy import CaptureMonitor, ResourcePolicy, describe as describe_capture
+    from server.services.page_readiness import READY_LOAD_TIMEOUT_MS, wait_until_ready
+    from server.services.browser_profile import get_browser_profile
+    from server.services.ocr import VISION_MODE, analyze_with_ocr, ocr_available
+except ImportError:
+    from services.artifact_store import get_artifact_store
+    from services.tiling import REVIEWS_TOP_JS, TILE_CLIP_AT_REVIEWS, capture_height
+    from services.screenshot_tiles import split_and_store
+    from services.tile_filter import get_tile_filter
+    from services.structured_extract import EXTRACTION_MODE, analyze_extraction, extract_product, is_sufficient
+    from services.http_fetch import get_http_fetcher
+    from services.resource_policy import CaptureMonitor, ResourcePolicy, describe as describe_capture
+    from services.page_readiness import READY_LOAD_TIMEOUT_MS, wait_until_ready
+    from services.browser_profile import get_browser_profile
+    from services.ocr import VISION_MODE, analyze_with_ocr, ocr_available
 
 load_dotenv()
 SERP_API_KEY = os.getenv("SERPAPI_KEY")
 
 
 @tool("search_product_info", return_direct=False)
-def get_product_data(product_name: str) -> dict:
-    """Search for a product online using SerpAPI and take screenshots of the top search results using Playwright."""
+def get_product_data(product_name: str, analysis_mode: Optional[str] = None) -> dict:
+    """Search for a product online using SerpAPI and read the top results with Playwright: from the page's structured data when it is enough, otherwise from screenshots. analysis_mode (gemini, ocr or auto) overrides VISION_MODE for the screenshots."""
     params = {
         "engine": "google",
         "q": product_name,
@@ -32,151 +53,222 @@ def get_product_data(product_name: str) -> dict:
     if not organic_results:
         return {"error": "No search results found"}
 
-    # Create screenshots directory
-    screenshots_dir = os.path.join(os.path.dirname(__file__), "..", "screenshots")
-    os.makedirs(screenshots_dir, exist_ok=True)
+    # Screenshots and analyses go to the content-addressed artifact store;
+    # an unchanged page produces the same bytes and reuses the stored blobs
+    store = get_artifact_store()
+    tile_filter = get_tile_filter()
     
     screenshot_results = []
+    # Pages whose DOM (JSON-LD, microdata, meta tags, main text) was enough to skip screenshots
+    extracted_results = []
+
+    # Try a plain HTTP GET first: server-rendered pages need no browser at all
+    fetcher = get_http_fetcher()
+    browser_results = []
+    for result in organic_results:
+        link = result.get("link", "")
+        if not link:
+            continue
+        if EXTRACTION_MODE != "vision" and fetcher.should_try_http(link):
+            fetched = fetcher.fetch(link)
+            extraction = None
+            if not fetched.looks_blocked:
+                try:
+                    extraction = extract_product(fetched.html, url=fetched.final_url)
+                except Exception as e:
+                    print(f"  Structured extraction failed: {e}")
+            success = extraction is not None and is_sufficient(extraction)
+            fetcher.record(link, success)
+            if success:
+                extracted_results.append({
+                    "url": link,
+                    "title": result.get("title", ""),
+                    "snippet": result.get("snippet", ""),
+                    "extraction": extraction,
+                    "fetched_with": "http",
+                    "elapsed_ms": fetched.elapsed_ms,
+                })
+                print(f"Fetched {link} over HTTP in {fetched.elapsed_ms} ms ({fetched.bytes} bytes): "
+                      f"{len(extraction['fields'])} fields, {len(extraction['text'])} chars of text")
+                continue
+            print(f"Plain HTTP fetch of {link} was not enough (status {fetched.status}"
+                  f"{', ' + fetched.error if fetched.error else ''}), using the browser")
+        browser_results.append(result)
 
-    with sync_playwright() as p:
-        # Launch browser with additional options
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled']  # Help avoid bot detection
-        )
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            # Add extra headers to look more like a real browser
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            }
-        )
-        page = context.new_page()
+    if browser_results:
+        with sync_playwright() as p:
+            # Reuse cookies and cached retailer assets from earlier captures (see BrowserProfile)
+            policy = ResourcePolicy()
+            session = get_browser_profile().open(
+                p,
+                urls=[result.get("link", "") for result in browser_results],
+                args=['--disable-blink-features=AutomationControlled'],  # Help avoid bot detection
+                context_options=dict(
+                    viewport={'width': 1920, 'height': 1080},
+                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                    locale='en-US',
+                    timezone_id='America/New_York',
+                    # Add extra headers to look more like a real browser
+                    extra_http_headers={
+                        'Accept-Language': 'en-US,en;q=0.9',
+                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                    },
+                ),
+                policy=policy,
+            )
+            try:
+                context = session.context
+                page = session.page()
+            
+                # Abort ads, trackers, third-party scripts, video and fonts, and measure each capture.
+                # Routing would disable the profile's disk cache; there the blocked domains are
+                # enforced through the host resolver instead.
+                monitor = CaptureMonitor(policy)
+                monitor.attach(context, page, intercept=not session.disk_cache)
         
-        # Set additional page properties to avoid detection
-        page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-        """)
+                # Set additional page properties to avoid detection
+                page.add_init_script("""
+                    Object.defineProperty(navigator, 'webdriver', {
+                        get: () => undefined
+                    });
+                """)
 
-        for idx, result in enumerate(organic_results, 1):
-            link = result.get("link", "")
-            title = result.get("title", "")
-            snippet = result.get("snippet", "")
+                for idx, result in enumerate(browser_results, 1):
+                    link = result.get("link", "")
+                    title = result.get("title", "")
+                    snippet = result.get("snippet", "")
 
-            if not link:
-                continue
+                    if not link:
+                        continue
 
-            print(f"\n{'='*80}")
-            print(f"Processing URL {idx}: {link}")
-            print(f"{'='*80}")
+                    print(f"\n{'='*80}")
+                    print(f"Processing URL {idx}: {link}")
+                    print(f"{'='*80}")
 
-            try:
-                # Navigate to the page - use 'load' instead of 'networkidle' for better reliability
-                # Amazon pages often have continuous network activity that never becomes idle
-                print(f"  Navigating to page...")
-                try:
-                    page.goto(link, wait_until='load', timeout=60000)
-                except Exception as nav_error:
-                    # If load times out, try with domcontentloaded (faster, less reliable)
-                    print(f"  'load' timed out, trying 'domcontentloaded'...")
+                    started = time.perf_counter()
+                    monitor.reset(link)
                     try:
-                        page.goto(link, wait_until='domcontentloaded', timeout=60000)
-                    except Exception:
-                        # Last resort: just navigate without waiting
-                        print(f"  Navigation wait failed, proceeding anyway...")
-                        page.goto(link, timeout=60000)
+                        # Navigate and continue as soon as the title and price (or, elsewhere, a settled DOM)
+                        # have rendered, all within one navigation budget
+                        print(f"  Navigating to page...")
+                        readiness = wait_until_ready(page, link, on_navigated=monitor.navigated)
+                        print(f"  Page ready after {readiness['ready_ms']} ms ({readiness['strategy']}"
+                              f"{', ' + readiness['platform'] if readiness['platform'] else ''}; "
+                              f"navigation {readiness['navigation_ms']} ms)")
                 
-                # Wait for page to stabilize and dynamic content to load
-                print(f"  Waiting for page content to load...")
-                page.wait_for_timeout(3000)  # Increased wait time
+                        if EXTRACTION_MODE != "vision":
+                            try:
+                                extraction = extract_product(page.content(), url=link)
+                            except Exception as e:
+                                print(f"  Structured extraction failed: {e}")
+                                extraction = None
+                            if extraction and (EXTRACTION_MODE == "structured" or is_sufficient(extraction)):
+                                extracted_results.append({
+                                    "url": link,
+                                    "title": title,
+                                    "snippet": snippet,
+                                    "extraction": extraction,
+                                    "fetched_with": "browser",
+                                    "elapsed_ms": round((time.perf_counter() - started) * 1000),
+                                    "capture": monitor.summary(),
+                                    "readiness": readiness,
+                                })
+                                print(f"  Capture: {describe_capture(monitor.summary())}")
+                                print(f"  Extracted {len(extraction['fields'])} fields ({', '.join(sorted(extraction['fields']))}) "
+                                      f"and {len(extraction['text'])} chars of text; skipping screenshots")
+                                continue
+                            if extraction:
+                                print(f"  Structured extraction yielded too little ({len(extraction['fields'])} fields, "
+                                      f"{len(extraction['text'])} chars), falling back to screenshots")
                 
-                # Try to wait for common page elements (optional, won't fail if not found)
-                try:
-                    page.wait_for_selector('body', timeout=5000)
-                except:
-                    pass
-                
-                # Create filename base
-                safe_title = re.sub(r'[^\w\s-]', '', title)[:50]  # Sanitize title
-                safe_title = re.sub(r'[-\s]+', '-', safe_title)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                all_screenshots = []
-                
-                # Take one full-page screenshot
-                print(f"Taking full-page screenshot...")
-                filename_full = f"{idx}_{safe_title}_{timestamp}_full.png"
-                filepath_full = os.path.join(screenshots_dir, filename_full)
+                        # Screenshots also need the images; give them a short, bounded wait
+                        try:
+                            page.wait_for_load_state("load", timeout=READY_LOAD_TIMEOUT_MS)
+                        except Exception:
+                            pass
                 
-                screenshot_bytes = page.screenshot(path=filepath_full, full_page=True)
+                        # Measure the page and decide how much of it is worth capturing
+                        viewport = page.viewport_size or {"width": 1920, "height": 1080}
+                        page_height = page.evaluate("() => document.documentElement.scrollHeight") or viewport["height"]
+                        reviews_top = None
+                        if TILE_CLIP_AT_REVIEWS:
+                            try:
+                                # Ignore review widgets above the fold (e.g. the star rating next to the title)
+                                reviews_top = page.evaluate(REVIEWS_TOP_JS, viewport["height"])
+                            except Exception:
+                                reviews_top = None
+                        height_to_capture = capture_height(page_height, reviews_top)
                 
-                print(f"  Full screenshot saved: {filename_full} ({len(screenshot_bytes)} bytes)")
+                        # Take one screenshot of the capture region
+                        print(f"Taking screenshot of the top {height_to_capture}px of a {page_height}px page"
+                              f"{f' (reviews start at {reviews_top}px)' if reviews_top else ''}...")
+                        screenshot_bytes = page.screenshot(
+                            full_page=True,
+                            clip={"x": 0, "y": 0, "width": viewport["width"], "height": height_to_capture},
+                        )
+                        full_ref = store.put_bytes(screenshot_bytes, "screenshot", product=product_name, url=link, ext=".png")
                 
-                # Divide the image into 5 parts
-                print(f"  Dividing image into 5 parts...")
-                image = Image.open(filepath_full)
-                width, height = image.size
-                part_height = height // 5
+                        print(f"  Full screenshot stored: {full_ref['key'][:12]} ({len(screenshot_bytes)} bytes"
+                              f"{', already stored' if full_ref['deduped'] else ''})")
                 
-                print(f"    Image size: {width}x{height} pixels")
-                print(f"    Each part height: {part_height} pixels")
+                        # Divide the image into tiles and store the ones worth analysing; results keep references only
+                        tiled = split_and_store(screenshot_bytes, store, tile_filter, product_name, link)
+                        all_screenshots = tiled["screenshots"]
+                        skipped_tiles = tiled["skipped_tiles"]
+                        del screenshot_bytes
                 
-                for part_num in range(5):
-                    # Calculate crop coordinates
-                    top = part_num * part_height
-                    bottom = (part_num + 1) * part_height if part_num < 4 else height
-                    
-                    # Crop the image
-                    part_image = image.crop((0, top, width, bottom))
-                    
-                    # Save the part
-                    filename_part = f"{idx}_{safe_title}_{timestamp}_part{part_num + 1}.png"
-                    filepath_part = os.path.join(screenshots_dir, filename_part)
-                    part_image.save(filepath_part)
-                    
-                    # Convert to base64 - read the saved file
-                    with open(filepath_part, 'rb') as f:
-                        part_bytes = f.read()
-                    screenshot_base64 = base64.b64encode(part_bytes).decode('utf-8')
-                    
-                    all_screenshots.append({
-                        "screenshot_number": part_num + 1,
-                        "scroll_position": f"part_{part_num + 1}_of_5",
-                        "filepath": filepath_part,
-                        "filename": filename_part,
-                        "screenshot_base64": screenshot_base64,
-                        "screenshot_size_bytes": len(part_bytes),
-                        "crop_coordinates": {"top": top, "bottom": bottom, "left": 0, "right": width}
-                    })
-                    
-                    print(f"    Part {part_num + 1} saved: {filename_part} ({len(part_bytes)} bytes)")
+                        # Store all screenshot data
+                        screenshot_data = {
+                            "url": link,
+                            "title": title,
+                            "snippet": snippet,
+                            "full_screenshot_key": full_ref["key"],
+                            "total_screenshots": len(all_screenshots),
+                            "screenshots": all_screenshots,
+                            "skipped_tiles": skipped_tiles,
+                            "elapsed_ms": round((time.perf_counter() - started) * 1000),
+                            "capture": monitor.summary(),
+                            "readiness": readiness,
+                        }
                 
-                # Store all screenshot data
-                screenshot_data = {
-                    "url": link,
-                    "title": title,
-                    "snippet": snippet,
-                    "total_screenshots": len(all_screenshots),
-                    "screenshots": all_screenshots
-                }
-                
-                screenshot_results.append(screenshot_data)
-                print(f"\nSuccessfully captured and divided screenshot into 5 parts for: {link}")
+                        screenshot_results.append(screenshot_data)
+                        print(f"  Capture: {describe_capture(screenshot_data['capture'])}")
+                        print(f"\nSuccessfully captured and divided screenshot into {tiled['tile_count']} parts for: {link} "
+                              f"({len(skipped_tiles)} skipped)")
 
-            except Exception as e:
-                print(f"Error taking screenshots of {link}: {e}")
-                import traceback
-                traceback.print_exc()
-                continue
+                    except Exception as e:
+                        print(f"Error taking screenshots of {link}: {e}")
+                        import traceback
+                        traceback.print_exc()
+                        continue
+            finally:
+                session.close()
 
-        browser.close()
+    final_results = []
+    gemini_error = None
 
-    # Analyze screenshots with Gemini and save JSON
+    # Pages read from the DOM need at most one text LLM call, and none when the fields are complete
+    for result in extracted_results:
+        analysis = analyze_extraction(result["extraction"], product_name=result.get("title"))
+        print(f"\nAnalyzed extracted data for: {result.get('title')} ({analysis['source']}, "
+              f"{analysis['input_chars']} prompt chars)")
+        final_results.append({
+            "search_result": {
+                "url": result.get("url"),
+                "title": result.get("title"),
+                "snippet": result.get("snippet"),
+                "screenshot_count": 0,
+                "extraction_source": analysis["source"],
+                "fetched_with": result.get("fetched_with"),
+                "elapsed_ms": result.get("elapsed_ms"),
+                "capture": result.get("capture"),
+            },
+            "gemini_analysis": analysis,
+            "success": analysis.get("success", False)
+        })
+
+    # Analyze screenshots with Gemini, or with local OCR and the text LLM
+    vision_mode = (analysis_mode or VISION_MODE).lower()
     if screenshot_results:
         print(f"\n{'='*80}")
         print("ANALYZING SCREENSHOTS WITH GEMINI")
@@ -194,8 +286,6 @@ def get_product_data(product_name: str) -> dict:
             temp_image_paths = []
             
             try:
-                final_results = []
-                
                 for result in screenshot_results:
                     # Copy screenshots to temp directory
                     temp_image_paths = []
@@ -212,11 +302,25 @@ def get_product_data(product_name: str) -> dict:
                         continue
                     
                     # Analyze with Gemini
-                    print(f"\nAnalyzing {len(temp_image_paths)} images for: {result.get('title')}")
-                    gemini_result = analyze_product_images(
-                        image_paths=temp_image_paths,
-                        product_name=result.get("title")
-                    )
+                    gemini_result = None
+                    if vision_mode in ("ocr", "auto") and ocr_available():
+                        # Local OCR plus the text LLM; in auto mode only kept when it found the product details
+                        print(f"\nReading {len(temp_image_paths)} images with OCR for: {result.get('title')}")
+                        ocr_result = analyze_with_ocr(temp_image_paths, product_name=result.get("title"),
+                                                      require_sufficient=vision_mode == "auto")
+                        print(f"  OCR: {ocr_result.get('relevant_chars', 0)} relevant chars in {ocr_result.get('ocr_ms')} ms"
+                              f"{'' if ocr_result.get('sufficient') else ' (incomplete)'}")
+                        if ocr_result.get("success") and (vision_mode == "ocr" or ocr_result.get("sufficient")):
+                            gemini_result = ocr_result
+                    elif vision_mode == "ocr":
+                        print("  OCR requested but Tesseract is not available, using Gemini")
+                    
+                    if gemini_result is None:
+                        print(f"\nAnalyzing {len(temp_image_paths)} images for: {result.get('title')}")
+                        gemini_result = analyze_product_images(
+                            image_paths=temp_image_paths,
+                            product_name=result.get("title")
+                        )
                     
                     # Combine results
                     combined_result = {
@@ -224,7 +328,11 @@ def get_product_data(product_name: str) -> dict:
                             "url": result.get("url"),
                             "title": result.get("title"),
                             "snippet": result.get("snippet"),
-                            "screenshot_count": len(temp_image_paths)
+                            "screenshot_count": len(temp_image_paths),
+                            "extraction_source": gemini_result.get("source", "vision"),
+                            "fetched_with": "browser",
+                            "elapsed_ms": result.get("elapsed_ms"),
+                            "capture": result.get("capture"),
                         },
                         "gemini_analysis": gemini_result,
                         "success": gemini_result.get("success", False)
@@ -240,41 +348,6 @@ def get_product_data(product_name: str) -> dict:
                         except Exception as e:
                             print(f"Warning: Could not delete temp file {temp_path}: {e}")
                 
-                # Prepare JSON result
-                json_result = {
-                    "product_name": product_name,
-                    "timestamp": datetime.now().isoformat(),
-                    "results": final_results,
-                    "total_results": len(final_results)
-                }
-                
-                # Save JSON file
-                base_dir = os.path.dirname(os.path.dirname(__file__))
-                os.makedirs(base_dir, exist_ok=True)
-                
-                safe_product_name = "".join(c for c in product_name if c.isalnum() or c in (' ', '-', '_')).strip()
-                safe_product_name = safe_product_name.replace(' ', '_')[:50]
-                timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-                json_filename = f"product_analysis_{safe_product_name}_{timestamp_str}.json"
-                json_filepath = os.path.join(base_dir, json_filename)
-                
-                with open(json_filepath, 'w', encoding='utf-8') as f:
-                    json.dump(json_result, f, indent=2, ensure_ascii=False)
-                
-                print(f"\n{'='*80}")
-                print(f"JSON RESULT SAVED")
-                print(f"{'='*80}")
-                print(f"File: {json_filepath}")
-                print(f"Total Results: {len(final_results)}")
-                
-                # Return combined result
-                return {
-                    "screenshot_results": screenshot_results,
-                    "gemini_analysis": final_results,
-                    "json_filepath": json_filepath,
-                    "json_result": json_result
-                }
-                
             finally:
                 # Clean up temp directory
                 if temp_dir and os.path.exists(temp_dir):
@@ -287,10 +360,44 @@ def get_product_data(product_name: str) -> dict:
             print(f"Error in Gemini analysis: {e}")
             import traceback
             traceback.print_exc()
-            # Return screenshots even if Gemini fails
-            return {"screenshot_results": screenshot_results, "gemini_error": str(e)}
+            gemini_error = str(e)
+
+    if not final_results:
+        # Return screenshots even if Gemini fails
+        response = {"screenshot_results": screenshot_results}
+        if gemini_error:
+            response["gemini_error"] = gemini_error
+        return response
 
-    return {"screenshot_results": screenshot_results}
+    # Prepare JSON result
+    json_result = {
+        "product_name": product_name,
+        "timestamp": datetime.now().isoformat(),
+        "results": final_results,
+        "total_results": len(final_results)
+    }
+    
+    # Store the analysis (compressed) in the artifact store
+    json_ref = store.put_json(json_result, "product_analysis", product=product_name,
+                              url=final_results[0]["search_result"].get("url"))
+    
+    print(f"\n{'='*80}")
+    print(f"JSON RESULT SAVED")
+    print(f"{'='*80}")
+    print(f"Artifact: {json_ref['key']} ({json_ref['size']} bytes, {json_ref['stored_size']} on disk)")
+    print(f"Total Results: {len(final_results)}")
+    
+    # Return combined result
+    response = {
+        "screenshot_results": screenshot_results,
+        "extracted_results": extracted_results,
+        "gemini_analysis": final_results,
+        "json_artifact_key": json_ref["key"],
+        "json_result": json_result
+    }
+    if gemini_error:
+        response["gemini_error"] = gemini_error
+    return response
 
 
 if __name__ == "__main__":
@@ -301,8 +408,8 @@ if __name__ == "__main__":
     print("="*80)
     
     # Show JSON file path if saved
-    if res.get("json_filepath"):
-        print(f"\n✓ JSON saved to: {res.get('json_filepath')}")
+    if res.get("json_artifact_key"):
+        print(f"\n✓ JSON stored as artifact: {res.get('json_artifact_key')}")
         print(f"✓ Total Results: {res.get('json_result', {}).get('total_results', 0)}")
     
     # Show screenshot results
@@ -61,15 +61,9 @@ Now transform the following product data into the required JSON format. For ever
 {product_json}
 """
 
-def _construct_prompt(product: Dict[str, Any]) -> str:
-    """
-    Construct the final prompt by safely injecting the product JSON.
+# Everything before the product data is the same on every call and is cached provider-side
+PROMPT_PREFIX, PROMPT_SUFFIX = PROMPT_TEMPLATE.split("{product_json}")
 
-    We use replace(...) instead of format(...) because PROMPT_TEMPLATE contains many literal braces.
-    """
-    product_json = json.dumps(product, ensure_ascii=False)
-    prompt = PROMPT_TEMPLATE.replace("{product_json}", product_json)
-    return prompt
 
 def _extract_first_json_block(text: str) -> Optional[str]:
     """
@@ -135,10 +129,11 @@ def transform_product(product: Dict[str, Any],
                       max_tokens: int = 512,
                       llm_kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     llm_kwargs = llm_kwargs or {}
-    prompt = _construct_prompt(product)
+    product_json = json.dumps(product, ensure_ascii=False)
 
-    # Call the LLM
-    raw_resp = call_llm(prompt, model=model, temperature=temperature, max_tokens=max_tokens, **llm_kwargs)
+    # Call the LLM; the instructions are the cached prefix, the product data the per-call part
+    raw_resp = call_llm(product_json + PROMPT_SUFFIX, model=model, temperature=temperature, max_tokens=max_tokens,
+                        cached_prefix=PROMPT_PREFIX, **llm_kwargs)
     if not raw_resp:
         raise ValueError("LLM returned an empty response")
 
@@ -1,14 +1,20 @@
-from flask import Flask, jsonify, request, send_from_directory
-from flask_pymongo import PyMongo
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 import logging
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from server.routes.product import bp as product_bp
-from server.database import init_db
+from server.database import init_db, get_final_output_body
+from server.services.carbon_counter import CarbonCounter
+from server.services.carbon_stream import TotalBroadcaster, TooManySubscribers
+from server.services.response_cache import ResponseCache
+from server.services.fast_json import OrjsonProvider
+from server.services.compression import ResponseCompressor
+from server.services.registry import registry
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
@@ -23,11 +29,76 @@ app.config['SECRET_KEY'] = SECRET_KEY
 DEBUG_MODE = os.environ.get('DEBUG', 'False').lower() == 'true'
 PORT = int(os.environ.get('PORT', 5000))
 
-mongo = PyMongo(app)
+FINAL_OUTPUT_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Per-user / per-session tally keys (cart.js sends a short base-36 session id)
+CARBON_USER_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Responses at least this large are gzip/zstd-compressed when the client accepts it
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+# In-memory cache of serialized final outputs (per worker process)
+FINAL_OUTPUT_CACHE_MAX_BYTES = int(os.environ.get('FINAL_OUTPUT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Write-behind batches checkout increments in process and flushes them periodically
+CARBON_WRITE_BEHIND = os.environ.get('CARBON_WRITE_BEHIND', 'False').lower() == 'true'
+CARBON_FLUSH_INTERVAL_MS = int(os.environ.get('CARBON_FLUSH_INTERVAL_MS', 500))
+CARBON_FLUSH_MAX_EVENTS = int(os.environ.get('CARBON_FLUSH_MAX_EVENTS', 100))
+# Spread checkout writes over N documents; >1 removes the single hot document
+CARBON_COUNTER_SHARDS = int(os.environ.get('CARBON_COUNTER_SHARDS', 1))
+CARBON_COMPACT_INTERVAL_S = float(os.environ.get('CARBON_COMPACT_INTERVAL_S', 30.0))
+# How long /api/carbon-total may serve the cached total before re-reading Mongo
+CARBON_TOTAL_TTL_S = float(os.environ.get('CARBON_TOTAL_TTL_S', 2.0))
+# Server-Sent Events stream of the total
+CARBON_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('CARBON_STREAM_MAX_SUBSCRIBERS', 200))
+CARBON_STREAM_MIN_INTERVAL_S = float(os.environ.get('CARBON_STREAM_MIN_INTERVAL_S', 1.0))
+CARBON_STREAM_HEARTBEAT_S = float(os.environ.get('CARBON_STREAM_HEARTBEAT_S', 15.0))
+# Build the Mongo client and load the agents at startup instead of on first use
+EAGER_WARMUP = os.environ.get('EAGER_WARMUP', 'False').lower() == 'true'
+
 CORS(app)
+app.json = OrjsonProvider(app)
+ResponseCompressor(min_size=RESPONSE_COMPRESSION_MIN_BYTES).init_app(app)
+
+
+def _connect_mongo():
+    from flask_pymongo import PyMongo
+    client = PyMongo(app)
+    # PyMongo installs its own JSON provider; keep the orjson one
+    app.json = OrjsonProvider(app)
+    return client
+
+
+# The Mongo client is created on first use, so workers boot without touching the network
+registry.register("mongo", _connect_mongo)
+
+
+def get_mongo():
+    return registry.get("mongo")
+
+carbon_stream = TotalBroadcaster(
+    max_subscribers=CARBON_STREAM_MAX_SUBSCRIBERS,
+    min_interval_s=CARBON_STREAM_MIN_INTERVAL_S,
+    heartbeat_s=CARBON_STREAM_HEARTBEAT_S,
+)
+carbon_counter = CarbonCounter(
+    lambda: get_mongo().db.TotalCarbonReduced,
+    write_behind=CARBON_WRITE_BEHIND,
+    flush_interval_ms=CARBON_FLUSH_INTERVAL_MS,
+    flush_max_events=CARBON_FLUSH_MAX_EVENTS,
+    on_change=carbon_stream.publish,
+    shards=CARBON_COUNTER_SHARDS,
+    get_user_collection=lambda: get_mongo().db.CarbonReducedByUser,
+)
+if CARBON_COUNTER_SHARDS > 1:
+    carbon_counter.start_maintenance(CARBON_COMPACT_INTERVAL_S)
+
+final_output_cache = ResponseCache(max_bytes=FINAL_OUTPUT_CACHE_MAX_BYTES)
+# The product blueprint writes new outputs through this cache
+app.extensions['final_output_cache'] = final_output_cache
 
 app.register_blueprint(product_bp)
 
+if EAGER_WARMUP:
+    registry.warm_up()
+
 @app.route('/')
 def home():
     """Home route - serve index.html"""
@@ -36,42 +107,83 @@ def home():
 @app.route('/cart/checkout', methods=['POST'])
 def cart_checkout():
     try:
-        data = request.get_json()
-        amount = data.get('amount')
-        if not mongo.db.TotalCarbonReduced.find_one():
-            mongo.db.TotalCarbonReduced.insert_one({'Total': amount})
+        data = request.get_json() or {}
+        try:
+            amount = float(data.get('amount'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'amount must be a number'}), 400
+        # Optional per-user / per-session tally, one document per key, so only well-formed keys are accepted
+        user_key = data.get('user') or data.get('session')
+        if user_key and not CARBON_USER_KEY_RE.match(str(user_key)):
+            return jsonify({'error': 'user/session must be 1-64 letters, digits, "_" or "-"'}), 400
+        # The shard comes from the connection, never from client-supplied ids
+        new_amount, created = carbon_counter.record(
+            amount,
+            shard_key=request.remote_addr,
+            user_key=str(user_key) if user_key else None,
+        )
+        if created:
             return jsonify({
                 'message': 'Carbon reduction tracked',
-                'total': amount,
-                'added': amount
-            }), 201
-        else:
-            new_amount = mongo.db.TotalCarbonReduced.find_one().get('Total') + amount
-            print(new_amount)
-            mongo.db.TotalCarbonReduced.update_one(
-                {'_id': mongo.db.TotalCarbonReduced.find_one()['_id']},
-                {'$set': {'Total': new_amount}}
-            )
-            return jsonify({
-                'message': 'Carbon reduction updated',
                 'Total': new_amount,
                 'added': amount
-            }), 200
+            }), 201
+        return jsonify({
+            'message': 'Carbon reduction updated',
+            'Total': new_amount,
+            'added': amount
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/carbon-total', methods=['GET'])
 def get_carbon_total():
+    """Cached global total; clients revalidate with If-None-Match and get 304s while it is unchanged"""
+    try:
+        total, _ = carbon_counter.snapshot(CARBON_TOTAL_TTL_S)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    # The body holds only the value the ETag is derived from, so equal ETags mean
+    # equal bodies and they agree across worker processes (the snapshot version is per process)
+    response = jsonify({'total': total})
+    response.set_etag(f"total-{total!r}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/carbon-total/user/<user_key>', methods=['GET'])
+def get_user_carbon_total(user_key):
+    """Savings tallied for one user or session id"""
+    if not CARBON_USER_KEY_RE.match(user_key):
+        return jsonify({'error': 'Invalid user id'}), 400
     try:
-        doc = mongo.db.TotalCarbonReduced.find_one()
-        if doc:
-            total = doc.get('Total', 0)
-            return jsonify({'total': total}), 200
-        else:
-            return jsonify({'total': 0}), 200
+        return jsonify({'user': user_key, 'total': carbon_counter.user_total(user_key)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/carbon-total/stream', methods=['GET'])
+def stream_carbon_total():
+    """Server-Sent Events: pushes the total whenever a checkout changes it"""
+    try:
+        # Seeds the broadcaster with the current total so new subscribers get it immediately
+        carbon_counter.snapshot(CARBON_TOTAL_TTL_S)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    try:
+        events = carbon_stream.subscribe()
+    except TooManySubscribers:
+        return jsonify({'error': 'Too many subscribers'}), 503, {'Retry-After': '30'}
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/carbon-total/metrics', methods=['GET'])
+def get_carbon_counter_metrics():
+    """Write-behind flush lag, pending increments and stream subscribers"""
+    metrics = carbon_counter.metrics()
+    metrics['stream_subscribers'] = carbon_stream.subscriber_count
+    return jsonify(metrics), 200
+
 @app.route('/api/config/gemini-key', methods=['GET'])
 def get_gemini_key():
     """Get Gemini API key (for frontend use)"""
@@ -94,31 +206,66 @@ def static_files(filename):
     """Serve static files"""
     return send_from_directory('static', filename)
 
-@app.route('/api/final-output/<filename>')
-def get_final_output(filename):
-    """Serve final_output JSON files"""
-    import json
-    import os
+@app.route('/api/final-output/<output_id>')
+def get_final_output(output_id):
+    """Serve a stored final output by id (legacy final_output_<timestamp>.json names are accepted too)"""
     from flask import abort
-    
-    # Security: Only allow final_output_*.json files
-    if not filename.startswith('final_output_') or not filename.endswith('.json'):
-        abort(400, description="Invalid filename")
-    
-    # Construct file path
-    base_dir = os.path.dirname(__file__)
-    filepath = os.path.join(base_dir, filename)
-    
-    if not os.path.exists(filepath):
-        abort(404, description="File not found")
-    
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
 
+    # Legacy links point at final_output_<timestamp>.json; those were imported with the stem as id
+    if output_id.endswith('.json'):
+        output_id = output_id[:-len('.json')]
+    if not FINAL_OUTPUT_ID_RE.match(output_id):
+        abort(400, description="Invalid output id")
+
+    entry = final_output_cache.get(output_id)
+    if entry is None:
+        try:
+            body = get_final_output_body(output_id)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        if body is None:
+            abort(404, description="Output not found")
+        # Stored bytes are already compact JSON; cache them as they are, no re-parsing
+        entry = final_output_cache.put(output_id, body)
+
+    gzipped = entry.gzip_body is not None and request.accept_encodings['gzip'] > 0
+    response = Response(entry.gzip_body if gzipped else entry.body, mimetype='application/json')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Outputs are never rewritten under the same id, so clients may keep them forever
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    # Each encoding is its own representation, so each gets its own strong ETag
+    response.set_etag(entry.gzip_etag if gzipped else entry.etag)
+    return response.make_conditional(request)
+
+@app.route('/api/final-output-cache/metrics', methods=['GET'])
+def get_final_output_cache_metrics():
+    return jsonify(final_output_cache.metrics())
+
+@app.route('/api/registry/status', methods=['GET'])
+def get_registry_status():
+    """Which lazily loaded components are loaded, and how long each took"""
+    return jsonify(registry.status())
+
+@app.route('/api/tile-filter/metrics', methods=['GET'])
+def get_tile_filter_metrics():
+    """Screenshot tiles skipped before vision analysis, and the bytes that were not sent"""
+    # Imported here: the tile filter pulls in PIL, which the rest of the app does not need
+    from server.services.tile_filter import get_tile_filter
+    return jsonify(get_tile_filter().metrics())
+
+@app.route('/api/http-fetch/metrics', methods=['GET'])
+def get_http_fetch_metrics():
+    """Per-domain success rates of the plain HTTP fetch path, which decide when the browser is skipped"""
+    from server.services.http_fetch import get_http_fetcher
+    return jsonify(get_http_fetcher().metrics())
+
+@app.route('/api/prompt-cache/metrics', methods=['GET'])
+def get_prompt_cache_metrics():
+    """Hits, registrations and inline fallbacks of the cached static prompt prefixes, per client"""
+    from server.services.prompt_cache import all_metrics
+    return jsonify(all_metrics())
 
 if __name__ == '__main__':
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
@@ -1,10 +1,30 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import os
+import uuid
+
+try:
+    import zstandard
+except ImportError:  # compression is optional; details are stored raw without it
+    zstandard = None
+
+try:
+    from server.services import fast_json
+except ImportError:
+    from services import fast_json
 
 # Path of the SQLite database file
 DB_PATH = "carbon0.db"
 
+# Optional zstd dictionary shared by all cf_detail blobs (see train_cf_detail_dictionary)
+CF_DETAIL_DICT_PATH = os.getenv("CF_DETAIL_DICT_PATH")
+CF_DETAIL_ZSTD_LEVEL = int(os.getenv("CF_DETAIL_ZSTD_LEVEL", 9))
+
+# Retention for stored /api/product final outputs
+FINAL_OUTPUT_RETENTION_DAYS = float(os.getenv("FINAL_OUTPUT_RETENTION_DAYS", 30))
+FINAL_OUTPUT_MAX_ROWS = int(os.getenv("FINAL_OUTPUT_MAX_ROWS", 10000))
+
 
 def get_connection():
     """Create and return a SQLite connection object."""
@@ -35,70 +55,384 @@ def init_db():
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     ''')
+    # products.cf_detail is kept only for older databases; the text lives in
+    # product_details so scans over products stay narrow.
+
+    # Out-of-row, compressed cf_detail text keyed by products.id
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS product_details (
+        product_id INTEGER PRIMARY KEY,
+        codec TEXT NOT NULL,
+        cf_detail BLOB
+    )
+    ''')
+
+    # Final outputs of /api/product, stored as compact JSON bytes
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS final_outputs (
+        id TEXT PRIMARY KEY,
+        sku TEXT,
+        url TEXT,
+        body BLOB NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_final_outputs_created_at ON final_outputs (created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_final_outputs_sku ON final_outputs (sku)")
 
     conn.commit()
+    _migrate_inline_cf_detail(conn)
     conn.close()
     logging.info("Database initialized at %s", DB_PATH)
 
 
 
+# ---------------------------------------------------------------------------
+# cf_detail compression
+# ---------------------------------------------------------------------------
+
+_codec_cache = {}
+
+
+def _load_cf_detail_dict():
+    if "dict" not in _codec_cache:
+        zdict = None
+        if zstandard is not None and CF_DETAIL_DICT_PATH and os.path.isfile(CF_DETAIL_DICT_PATH):
+            with open(CF_DETAIL_DICT_PATH, "rb") as f:
+                zdict = zstandard.ZstdCompressionDict(f.read())
+        _codec_cache["dict"] = zdict
+    return _codec_cache["dict"]
+
+
+def encode_cf_detail(text):
+    """Return ``(codec, blob)`` for a cf_detail string."""
+    data = text.encode("utf-8")
+    if zstandard is None:
+        return "raw", data
+    zdict = _load_cf_detail_dict()
+    if zdict is not None:
+        cctx = zstandard.ZstdCompressor(level=CF_DETAIL_ZSTD_LEVEL, dict_data=zdict)
+        return f"zstd-dict:{zdict.dict_id()}", cctx.compress(data)
+    return "zstd", zstandard.ZstdCompressor(level=CF_DETAIL_ZSTD_LEVEL).compress(data)
+
+
+def decode_cf_detail(codec, blob):
+    """Inverse of encode_cf_detail."""
+    if blob is None:
+        return None
+    if codec == "raw":
+        return bytes(blob).decode("utf-8")
+    if zstandard is None:
+        raise RuntimeError(f"zstandard is required to read cf_detail stored as {codec!r}")
+    if codec.startswith("zstd-dict:"):
+        zdict = _load_cf_detail_dict()
+        if zdict is None or f"zstd-dict:{zdict.dict_id()}" != codec:
+            raise RuntimeError(f"cf_detail dictionary for {codec!r} is not available (CF_DETAIL_DICT_PATH)")
+        return zstandard.ZstdDecompressor(dict_data=zdict).decompress(blob).decode("utf-8")
+    return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+
+
+def train_cf_detail_dictionary(out_path, dict_size=16 * 1024, sample_limit=5000):
+    """
+    Train a zstd dictionary from the stored cf_detail texts and write it to out_path.
+    Point CF_DETAIL_DICT_PATH at the file to compress new details with it.
+    """
+    if zstandard is None:
+        raise RuntimeError("zstandard is not installed")
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT codec, cf_detail FROM product_details LIMIT ?", (sample_limit,))
+    samples = [decode_cf_detail(row["codec"], row["cf_detail"]).encode("utf-8") for row in cur.fetchall()]
+    conn.close()
+    zdict = zstandard.train_dictionary(dict_size, samples)
+    with open(out_path, "wb") as f:
+        f.write(zdict.as_bytes())
+    _codec_cache.clear()
+    return out_path
+
+
+def _write_cf_detail(conn, product_id, text):
+    codec, blob = encode_cf_detail(text)
+    conn.execute(
+        "INSERT OR REPLACE INTO product_details (product_id, codec, cf_detail) VALUES (?, ?, ?)",
+        (product_id, codec, blob),
+    )
+
+
+def _migrate_inline_cf_detail(conn):
+    """Move cf_detail text still stored inline in products into product_details."""
+    cur = conn.cursor()
+    cur.execute("SELECT id, cf_detail FROM products WHERE cf_detail IS NOT NULL")
+    rows = cur.fetchall()
+    if not rows:
+        return
+    with conn:
+        for row in rows:
+            _write_cf_detail(conn, row["id"], row["cf_detail"])
+        conn.execute("UPDATE products SET cf_detail = NULL WHERE cf_detail IS NOT NULL")
+    logging.info("Moved %d inline cf_detail values to product_details", len(rows))
+
+
+# ---------------------------------------------------------------------------
+# Products
+# ---------------------------------------------------------------------------
+
+PRODUCT_COLUMNS = (
+    "sku", "name", "category", "brand", "price", "web_url", "image_url",
+    "cf_value",
+)
+
+# Columns returned by product reads; cf_detail is fetched separately via get_cf_detail
+_SELECT_COLUMNS = ", ".join(("id",) + PRODUCT_COLUMNS + ("created_at", "updated_at"))
+
+_UPSERT_SQL = '''
+    INSERT OR REPLACE INTO products
+    (sku, name, category, brand, price, web_url, image_url,
+     cf_value, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _product_params(product, updated_at):
+    return tuple(product.get(col) for col in PRODUCT_COLUMNS) + (updated_at,)
+
+
 def insert_product(product):
     """
     Insert or update a product in the database.
     """
+    insert_products([product])
+
+
+def insert_products(products, conn=None):
+    """
+    Insert or update many products in a single transaction.
+
+    Pass an open connection to reuse it across batches (the caller is then
+    responsible for closing it); otherwise a connection is opened and closed here.
+    Returns the number of rows written.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        now = datetime.now()
+        count = 0
+        with conn:
+            for product in products:
+                sku = product.get("sku")
+                if sku is not None:
+                    # INSERT OR REPLACE gives the row a new id; drop the old row's detail
+                    conn.execute(
+                        "DELETE FROM product_details WHERE product_id IN (SELECT id FROM products WHERE sku = ?)",
+                        (sku,),
+                    )
+                cur = conn.execute(_UPSERT_SQL, _product_params(product, now))
+                if product.get("cf_detail") is not None:
+                    _write_cf_detail(conn, cur.lastrowid, product["cf_detail"])
+                count += 1
+        return count
+    finally:
+        if own_conn:
+            conn.close()
+
+
+QUERYABLE_COLUMNS = ("id",) + PRODUCT_COLUMNS + ("created_at", "updated_at")
+_NUMERIC_COLUMNS = {"id", "price", "cf_value"}
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def query_products(columns=None, category=None, brand=None, cf_min=None, cf_max=None,
+                   order_by=None, limit=None, output="dict"):
+    """
+    Fetch products with an explicit projection, filters and ordering.
+
+    columns:  iterable of column names (default: every column except cf_detail)
+    category / brand: a value or a list of accepted values
+    cf_min / cf_max:  inclusive bounds on cf_value (rows with NULL cf_value are excluded)
+    order_by: a column name or list of names; prefix with "-" for descending
+    limit:    maximum number of rows
+    output:   "dict"    -> list of dicts
+              "tuple"   -> list of plain tuples in `columns` order
+              "columns" -> dict of NumPy arrays, one per column (numeric columns are
+                           float64 with NaN for NULL, others are object arrays)
+    """
+    columns = tuple(columns) if columns else QUERYABLE_COLUMNS
+    unknown = [c for c in columns if c not in QUERYABLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown product columns: {unknown}")
+    if output not in ("dict", "tuple", "columns"):
+        raise ValueError(f"Unsupported output: {output}")
+
+    where = []
+    params = []
+    for col, value in (("category", category), ("brand", brand)):
+        values = _as_list(value)
+        if values is not None:
+            where.append(f"{col} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    if cf_min is not None:
+        where.append("cf_value >= ?")
+        params.append(cf_min)
+    if cf_max is not None:
+        where.append("cf_value <= ?")
+        params.append(cf_max)
+
+    sql = f"SELECT {', '.join(columns)} FROM products"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if order_by:
+        terms = []
+        for term in _as_list(order_by):
+            col = term.lstrip("-")
+            if col not in QUERYABLE_COLUMNS:
+                raise ValueError(f"Cannot order by unknown column: {col}")
+            terms.append(f"{col} DESC" if term.startswith("-") else col)
+        sql += " ORDER BY " + ", ".join(terms)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
     conn = get_connection()
-    cur = conn.cursor()
+    # Plain tuples avoid building a sqlite3.Row per result
+    conn.row_factory = None
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
 
-    cur.execute('''
-        INSERT OR REPLACE INTO products
-        (sku, name, category, brand, price, web_url, image_url,
-         cf_value, cf_detail, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        product.get("sku"),
-        product.get("name"),
-        product.get("category"),
-        product.get("brand"),
-        product.get("price"),
-        product.get("web_url"),
-        product.get("image_url"),
-        product.get("cf_value"),
-        product.get("cf_detail"),
-        datetime.now(),
-    ))
+    if output == "tuple":
+        return rows
+    if output == "dict":
+        return [dict(zip(columns, row)) for row in rows]
 
-    conn.commit()
-    conn.close()
+    import numpy as np
+    result = {}
+    for i, col in enumerate(columns):
+        values = [row[i] for row in rows]
+        if col in _NUMERIC_COLUMNS:
+            result[col] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            result[col] = np.array(values, dtype=object)
+    return result
 
 
 def get_all_products():
-    """Return all products as a list of dictionaries."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM products")
-    rows = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    return rows
+    """Return all products (without cf_detail) as a list of dictionaries."""
+    return query_products()
 
 
-def get_product_by_sku(sku):
-    """Retrieve a product by its SKU."""
+def get_product_by_sku(sku, include_detail=False):
+    """Retrieve a product by its SKU, optionally with its cf_detail text."""
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM products WHERE sku = ?", (sku,))
+    cur.execute(f"SELECT {_SELECT_COLUMNS} FROM products WHERE sku = ?", (sku,))
     row = cur.fetchone()
+    product = dict(row) if row else None
+    if product is not None and include_detail:
+        product["cf_detail"] = _fetch_cf_detail(cur, product["id"])
     conn.close()
-    return dict(row) if row else None
+    return product
+
+
+def _fetch_cf_detail(cur, product_id):
+    cur.execute("SELECT codec, cf_detail FROM product_details WHERE product_id = ?", (product_id,))
+    row = cur.fetchone()
+    return decode_cf_detail(row["codec"], row["cf_detail"]) if row else None
+
+
+def get_cf_detail(sku):
+    """Return the decompressed cf_detail text for a SKU, or None."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM products WHERE sku = ?", (sku,))
+        row = cur.fetchone()
+        return _fetch_cf_detail(cur, row["id"]) if row else None
+    finally:
+        conn.close()
 
 
 def delete_product_by_sku(sku):
     """Delete a product from the database by its SKU."""
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute("DELETE FROM product_details WHERE product_id IN (SELECT id FROM products WHERE sku = ?)", (sku,))
     cur.execute("DELETE FROM products WHERE sku = ?", (sku,))
     conn.commit()
     conn.close()
 
 
+# ---------------------------------------------------------------------------
+# Final outputs
+# ---------------------------------------------------------------------------
+
+def serialize_final_output(output):
+    """Compact UTF-8 JSON bytes, exactly as they are stored and served."""
+    return fast_json.dumpb(output)
+
+
+def save_final_output(output, sku=None, url=None, output_id=None, created_at=None, prune=True):
+    """
+    Store a final output and return its id (a new random hex id unless given).
+    Old rows are pruned according to the retention settings after each write.
+    """
+    output_id = output_id or uuid.uuid4().hex
+    body = output if isinstance(output, (bytes, bytearray)) else serialize_final_output(output)
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO final_outputs (id, sku, url, body, created_at) VALUES (?, ?, ?, ?, ?)",
+                (output_id, sku, url, bytes(body), created_at or datetime.now()),
+            )
+            if prune:
+                _prune_final_outputs(conn, FINAL_OUTPUT_RETENTION_DAYS, FINAL_OUTPUT_MAX_ROWS)
+    finally:
+        conn.close()
+    return output_id
+
+
+def get_final_output_body(output_id):
+    """Return the stored JSON bytes of a final output, or None."""
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT body FROM final_outputs WHERE id = ?", (output_id,)).fetchone()
+        return bytes(row["body"]) if row else None
+    finally:
+        conn.close()
+
+
+def _prune_final_outputs(conn, max_age_days, max_rows):
+    removed = 0
+    if max_age_days and max_age_days > 0:
+        cutoff = datetime.now() - timedelta(days=max_age_days)
+        removed += conn.execute("DELETE FROM final_outputs WHERE created_at < ?", (cutoff,)).rowcount
+    if max_rows and max_rows > 0:
+        removed += conn.execute('''
+            DELETE FROM final_outputs WHERE id IN (
+                SELECT id FROM final_outputs ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (max_rows,)).rowcount
+    return removed
+
+
+def prune_final_outputs(max_age_days=FINAL_OUTPUT_RETENTION_DAYS, max_rows=FINAL_OUTPUT_MAX_ROWS):
+    """Delete final outputs older than max_age_days and beyond the newest max_rows."""
+    conn = get_connection()
+    try:
+        with conn:
+            return _prune_final_outputs(conn, max_age_days, max_rows)
+    finally:
+        conn.close()
+
+
 if __name__ == "__main__":
     init_db()
@@ -7,6 +7,7 @@ from server.agents import transform as transform_module
 from server.services import carbon_calc
 from server import database
 from server import recommender
+from server.services import fast_json
 
 # Try to import arrange agent if present
 try:
@@ -113,7 +114,7 @@ def process_and_store_product(product_json: Dict[str, Any],
         print("STEP 1: TRANSFORM - Calling transform.transform_product")
         print(f"{'='*80}")
         print(f"Input product data:")
-        print(json.dumps(product_json, indent=2, ensure_ascii=False, default=str))
+        print(fast_json.dumps(product_json, indent=True))
         print(f"\nModel: {model}, Temperature: {transform_temperature}, Max Tokens: {max_tokens}")
         print(f"{'='*80}\n")
         
@@ -124,7 +125,7 @@ def process_and_store_product(product_json: Dict[str, Any],
         print(f"\n{'='*80}")
         print("TRANSFORM RESULT:")
         print(f"{'='*80}")
-        print(json.dumps(transformed, indent=2, ensure_ascii=False, default=str))
+        print(fast_json.dumps(transformed, indent=True))
         print(f"{'='*80}\n")
         
     except Exception as exc:
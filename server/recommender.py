@@ -3,7 +3,10 @@ import math
 import logging
 
 # Optional: use database helper to fetch candidates
-from server.database import get_all_products
+from server.database import query_products
+
+# Columns the recommender scores on, plus the links shown with each recommendation
+CANDIDATE_COLUMNS = ("sku", "name", "category", "brand", "price", "cf_value", "web_url", "image_url")
 
 def _tokenize(s: Optional[str]) -> List[str]:
     if not s:
@@ -138,10 +141,10 @@ def recommend_products(target: Dict[str, Any],
                        exclude_self: bool = True) -> List[Dict[str, Any]]:
     """
     Return top_k candidate dicts (with score and debug) sorted by score.
-    If candidates not provided, fetches all from DB (get_all_products).
+    If candidates not provided, fetches all from DB (only CANDIDATE_COLUMNS).
     """
     if candidates is None:
-        candidates = get_all_products()
+        candidates = query_products(columns=CANDIDATE_COLUMNS)
 
     # optionally exclude the target itself by SKU
     target_sku = target.get("sku")
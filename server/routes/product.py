@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 import logging
 import json
 import random
@@ -7,15 +7,44 @@ bp = Blueprint("product", __name__, url_prefix="/api")
 
 logger = logging.getLogger(__name__)
 
-# Import search agent and transform
 try:
-    from server.agents.search_agent_tool import get_product_data
+    from server.services.registry import registry
 except ImportError:
+    from services.registry import registry
+
+
+# The search agent (Playwright, SerpAPI, LangChain, PIL) and the recommender (SerpAPI)
+# are heavy to import, so they are loaded on the first request that needs them
+def _load_search_agent():
     try:
+        from server.agents.search_agent_tool import get_product_data
+    except ImportError:
         from agents.search_agent_tool import get_product_data
+    return get_product_data
+
+
+def _load_recommender():
+    try:
+        from server.agents.recommend import get_sustainable_alternatives_with_analysis
+    except ImportError:
+        from agents.recommend import get_sustainable_alternatives_with_analysis
+    return get_sustainable_alternatives_with_analysis
+
+
+def _load_image_analyzer():
+    # Only used through the search agent; registered so warm-up also builds the Gemini client
+    try:
+        from server.agents.gemini_image import analyze_product_images
     except ImportError:
-        get_product_data = None
+        from agents.gemini_image import analyze_product_images
+    return analyze_product_images
 
+
+registry.register("search_agent", _load_search_agent)
+registry.register("image_analyzer", _load_image_analyzer)
+registry.register("recommender", _load_recommender)
+
+# Import transform
 try:
     from server.agents.transform import transform_product
 except ImportError:
@@ -72,6 +101,11 @@ except ImportError:
     except ImportError:
         call_llm = None
 
+try:
+    from server.agents.fill_missing import construct_fill_prompt
+except ImportError:
+    from agents.fill_missing import construct_fill_prompt
+
 # Import carbon calculation service
 try:
     from server.services.carbon_calc import calculate_carbon_footprint
@@ -81,14 +115,34 @@ except ImportError:
     except ImportError:
         calculate_carbon_footprint = None
 
-# Import recommender
+# Import database helpers
 try:
-    from server.agents.recommend import get_sustainable_alternatives_with_analysis
+    from server import database
 except ImportError:
     try:
-        from agents.recommend import get_sustainable_alternatives_with_analysis
+        import database
     except ImportError:
-        get_sustainable_alternatives_with_analysis = None
+        database = None
+
+try:
+    from server.services import fast_json
+except ImportError:
+    from services import fast_json
+
+
+@bp.route('/products/<sku>/cf-detail', methods=['GET'])
+def get_product_cf_detail(sku):
+    """Return the carbon calculation reasoning for a stored product (loaded on demand)"""
+    if database is None:
+        return jsonify({'error': 'Database unavailable'}), 500
+    try:
+        cf_detail = database.get_cf_detail(sku)
+    except Exception:
+        logger.exception("Error loading cf_detail for %s", sku)
+        return jsonify({'error': 'Internal server error'}), 500
+    if cf_detail is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'sku': sku, 'cf_detail': cf_detail}), 200
 
 
 @bp.route('/product', methods=['POST'])
@@ -121,6 +175,7 @@ def receive_product():
 
         # Step 1: Run search agent (analyzer)
         search_result = None
+        get_product_data = registry.get("search_agent")
         if get_product_data is None:
             pass
         else:
@@ -132,7 +187,14 @@ def receive_product():
                 }), 400
             
             try:
-                search_result = get_product_data.invoke({"product_name": product_name})
+                tool_input = {"product_name": product_name}
+                # Optional per-request choice of screenshot analysis: gemini, ocr or auto
+                if data.get('analysis_mode') in ('gemini', 'ocr', 'auto'):
+                    tool_input["analysis_mode"] = data['analysis_mode']
+                search_result = get_product_data.invoke(tool_input)
+                # Only the analyses are used below; drop the tile references and intermediate results
+                if search_result:
+                    search_result = {"gemini_analysis": search_result.get("gemini_analysis") or []}
             except Exception as e:
                 import traceback
                 traceback.print_exc()
@@ -160,59 +222,7 @@ def receive_product():
             
             if analysis_text:
                 # Create prompt to fill missing values
-                prompt = f"""You are a data completion agent. Your task is to fill in missing (null) values in a carbon footprint calculation input JSON based on product analysis.
-
-The product analysis provides detailed information about the product:
-{analysis_text}
-
-Current transform result (with some null values):
-{json.dumps(transform_result, indent=2, ensure_ascii=False)}
-
-Your task:
-1. Identify all null values in the transform result
-2. Use the product analysis to estimate reasonable values for these null fields
-3. Return ONLY a valid JSON object with the same structure as the transform result, but with null values filled in based on estimation
-4. Keep all existing non-null values exactly as they are
-5. For numeric fields, provide reasonable estimates (e.g., weight in kg, distances in km, emission factors)
-6. For string fields, provide reasonable values (e.g., material names, locations)
-7. Mark estimated values in the "source" fields as "estimated_from_analysis" or "model_based_estimate"
-
-Return ONLY the JSON object, no explanations or markdown. The JSON must be valid and parseable.
-
-Example structure:
-{{
-  "materials": [
-    {{
-      "name": "material_name",
-      "weight": 0.5,
-      "weight_source": "estimated_from_analysis",
-      "emission_factor": 2.5,
-      "emission_factor_source": "estimated_from_analysis"
-    }}
-  ],
-  "manufacturing_factor": {{
-    "value": 1.2,
-    "source": "estimated_from_analysis"
-  }},
-  "transport": {{
-    "origin": "China",
-    "distance_km": 10000,
-    "mode": "ship",
-    "emission_factor_ton_km": 0.01,
-    "source": "estimated_from_analysis"
-  }},
-  "packaging": {{
-    "weight": 0.1,
-    "emission_factor": 2.0,
-    "source": "estimated_from_analysis"
-  }},
-  "product_weight": {{
-    "value": 1.5,
-    "source": "estimated_from_analysis"
-  }}
-}}
-
-Now fill in the null values in the transform result based on the analysis:"""
+                prompt = construct_fill_prompt(transform_result, analysis_text)
 
                 try:
                     llm_response = call_llm(prompt, model="gemini-2.5-flash", temperature=0.3, max_tokens=4096)
@@ -238,6 +248,7 @@ Now fill in the null values in the transform result based on the analysis:"""
 
         # Step 5: Get sustainable alternatives using analysis
         alternatives_result = None
+        get_sustainable_alternatives_with_analysis = registry.get("recommender") if search_result else None
         if search_result and get_sustainable_alternatives_with_analysis:
             # Extract analysis text and product name
             analysis_text = ""
@@ -260,14 +271,14 @@ Now fill in the null values in the transform result based on the analysis:"""
         print(f"\n{'='*80}")
         print("FILLED TRANSFORM RESULT:")
         print(f"{'='*80}")
-        print(json.dumps(filled_transform_result, indent=2, ensure_ascii=False, default=str))
+        print(fast_json.dumps(filled_transform_result, indent=True))
         print(f"{'='*80}\n")
         
         if carbon_result:
             print(f"\n{'='*80}")
             print("CARBON FOOTPRINT CALCULATION:")
             print(f"{'='*80}")
-            print(json.dumps(carbon_result, indent=2, ensure_ascii=False, default=str))
+            print(fast_json.dumps(carbon_result, indent=True))
             print(f"{'='*80}\n")
 
         # Build response compatible with frontend expectations
@@ -332,13 +343,6 @@ Now fill in the null values in the transform result based on the analysis:"""
         else:
             print(f"\nNo alternatives found. alternatives_result: {alternatives_result}")
         
-        # Save final output to JSON file
-        import os
-        from datetime import datetime
-        
-        base_dir = os.path.dirname(os.path.dirname(__file__))
-        os.makedirs(base_dir, exist_ok=True)
-        
         # Create final output structure
         final_output = {
             'carbon_score': response.get('C0Score'),
@@ -363,17 +367,28 @@ Now fill in the null values in the transform result based on the analysis:"""
                 final_output['links'].append(link_data)
                 print(f"  Added to final_output links: {link_data['explanation'][:50] if link_data['explanation'] else 'No explanation'} | C0Score: {link_c0_score}")
         
-        # Save to JSON file
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        json_filename = f"final_output_{timestamp_str}.json"
-        json_filepath = os.path.join(base_dir, json_filename)
-        
-        with open(json_filepath, 'w', encoding='utf-8') as f:
-            json.dump(final_output, f, indent=2, ensure_ascii=False, default=str)
+        # Store final output in the database; the extension fetches it by id
+        output_id = None
+        if database is not None:
+            try:
+                # Serialize once: the same bytes are stored and cached for /api/final-output
+                body = database.serialize_final_output(final_output)
+                output_id = database.save_final_output(
+                    body,
+                    sku=product_data.get('sku'),
+                    url=product_data.get('url'),
+                )
+                cache = current_app.extensions.get('final_output_cache')
+                if cache is not None:
+                    cache.put(output_id, body)
+            except Exception:
+                logger.exception("Failed to store final output")
         
-        # Add final_output structure and filepath to response
+        # Add final_output structure and its id to response
+        # (final_output_file is kept for older extension builds, which fetch /api/final-output/<last path segment>)
         response['final_output'] = final_output
-        response['final_output_file'] = json_filepath
+        response['final_output_id'] = output_id
+        response['final_output_file'] = output_id
         
         # Debug: Print final response structure
         print(f"\n{'='*80}")
@@ -383,7 +398,7 @@ Now fill in the null values in the transform result based on the analysis:"""
         print(f"link1: {response.get('link1', 'NOT SET')}")
         print(f"link1Image: {response.get('link1Image', 'NOT SET')}")
         print(f"link1Explanation: {response.get('link1Explanation', 'NOT SET')[:50] if response.get('link1Explanation') else 'NOT SET'}")
-        print(f"Final output saved to: {json_filepath}")
+        print(f"Final output stored as: {output_id}")
         print(f"{'='*80}\n")
 
         return jsonify(response), 200
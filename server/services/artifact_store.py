@@ -0,0 +1,316 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional; JSON artifacts are stored uncompressed without it
+    zstandard = None
+
+try:
+    from server.services import fast_json
+except ImportError:
+    from services import fast_json
+
+logger = logging.getLogger(__name__)
+
+# Where blobs live and how much of them to keep
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024))
+ARTIFACT_MAX_AGE_DAYS = float(os.getenv("ARTIFACT_MAX_AGE_DAYS", 14))
+ARTIFACT_ZSTD_LEVEL = int(os.getenv("ARTIFACT_ZSTD_LEVEL", 10))
+# Minimum seconds between automatic eviction passes triggered by writes
+ARTIFACT_EVICT_INTERVAL_S = float(os.getenv("ARTIFACT_EVICT_INTERVAL_S", 60))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifact_blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    ext TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL REFERENCES artifact_blobs(hash),
+    kind TEXT NOT NULL,
+    product TEXT,
+    url TEXT,
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_hash ON artifacts(hash);
+CREATE INDEX IF NOT EXISTS idx_artifacts_created_at ON artifacts(created_at);
+CREATE INDEX IF NOT EXISTS idx_artifacts_product ON artifacts(product);
+"""
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for screenshots, tiles and analysis JSON.
+
+    Each blob is written once under ``root/<hash[:2]>/<hash><ext>``, where the
+    hash is the SHA-256 of the original bytes, so storing an identical
+    screenshot or document again only refreshes its index row. JSON is
+    zstd-compressed on disk when zstandard is installed. The index lives in
+    SQLite: ``artifact_blobs`` (one row per stored file) and ``artifacts``
+    (kind, product, url, size, created_at), reached through
+    ``get_connection``.
+
+    evict() drops index rows older than ``max_age_days``, then the oldest
+    rows until the blobs fit in ``max_bytes``, and deletes blobs no row
+    references any more. Writes trigger it at most every ``evict_interval_s``.
+    """
+
+    def __init__(self, root: str, get_connection: Callable[[], object],
+                 max_bytes: int = ARTIFACT_MAX_BYTES, max_age_days: float = ARTIFACT_MAX_AGE_DAYS,
+                 zstd_level: int = ARTIFACT_ZSTD_LEVEL, evict_interval_s: float = ARTIFACT_EVICT_INTERVAL_S):
+        self.root = root
+        self._get_connection = get_connection
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.zstd_level = zstd_level
+        self.evict_interval_s = evict_interval_s
+        self._last_evict = time.monotonic()
+        self._evict_lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        conn = self._get_connection()
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    # -- paths ----------------------------------------------------------------
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _blob_path(self, key: str, codec: str, ext: str) -> str:
+        suffix = ext + (".zst" if codec == "zstd" else "")
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def path(self, key: str) -> Optional[str]:
+        """Filesystem path of a blob (compressed blobs are not directly readable), or None."""
+        row = self._blob_row(key)
+        return self._blob_path(key, row["codec"], row["ext"]) if row else None
+
+    def _blob_row(self, key: str):
+        conn = self._get_connection()
+        try:
+            return conn.execute("SELECT codec, ext, size FROM artifact_blobs WHERE hash = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+
+    # -- writes ---------------------------------------------------------------
+
+    def put_bytes(self, data: bytes, kind: str, product: Optional[str] = None, url: Optional[str] = None,
+                  ext: str = "", compress: bool = False) -> dict:
+        """
+        Store ``data`` and index it. Returns ``{"key", "path", "size", "stored_size", "deduped"}``;
+        ``deduped`` is True when the blob was already on disk and nothing new was written.
+        """
+        data = bytes(data)
+        key = self.hash_bytes(data)
+        codec = "zstd" if compress and zstandard is not None else "raw"
+        now = datetime.now()
+
+        conn = self._get_connection()
+        try:
+            # IMMEDIATE takes the write lock up front, so eviction cannot remove the
+            # blob between the existence check and the new index row
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                blob = conn.execute("SELECT codec, ext, stored_size FROM artifact_blobs WHERE hash = ?", (key,)).fetchone()
+                path = self._blob_path(key, blob["codec"], blob["ext"]) if blob else None
+                deduped = blob is not None and os.path.exists(path)
+                if deduped:
+                    stored_size = blob["stored_size"]
+                else:
+                    payload = zstandard.ZstdCompressor(level=self.zstd_level).compress(data) if codec == "zstd" else data
+                    path = self._blob_path(key, codec, ext)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(payload)
+                    os.replace(tmp, path)
+                    stored_size = len(payload)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO artifact_blobs (hash, codec, size, stored_size, ext, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, codec, len(data), stored_size, ext, now),
+                    )
+
+                # The same content for the same product/url/kind is one index row; refresh its age
+                existing = conn.execute(
+                    "SELECT id FROM artifacts WHERE hash = ? AND kind = ? AND product IS ? AND url IS ?",
+                    (key, kind, product, url),
+                ).fetchone()
+                if existing:
+                    conn.execute("UPDATE artifacts SET created_at = ? WHERE id = ?", (now, existing["id"]))
+                else:
+                    conn.execute(
+                        "INSERT INTO artifacts (hash, kind, product, url, size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, kind, product, url, len(data), now),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+        self._maybe_evict()
+        return {"key": key, "path": path, "size": len(data), "stored_size": stored_size, "deduped": deduped}
+
+    def put_json(self, obj, kind: str, product: Optional[str] = None, url: Optional[str] = None) -> dict:
+        """Store ``obj`` as compact JSON, zstd-compressed when available."""
+        return self.put_bytes(fast_json.dumpb(obj), kind, product=product, url=url, ext=".json", compress=True)
+
+    # -- reads ----------------------------------------------------------------
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Original bytes of a blob, or None if it is unknown or was evicted."""
+        row = self._blob_row(key)
+        if row is None:
+            return None
+        try:
+            with open(self._blob_path(key, row["codec"], row["ext"]), "rb") as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        if row["codec"] == "zstd":
+            return zstandard.ZstdDecompressor().decompress(payload, max_output_size=row["size"])
+        return payload
+
+    def get_json(self, key: str):
+        data = self.get_bytes(key)
+        return fast_json.loads(data) if data is not None else None
+
+    def find(self, kind: Optional[str] = None, product: Optional[str] = None, url: Optional[str] = None,
+             limit: int = 50) -> list:
+        """Newest index rows matching the given filters, as dicts."""
+        clauses, params = [], []
+        for column, value in (("kind", kind), ("product", product), ("url", url)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(
+                f"SELECT hash AS key, kind, product, url, size, created_at FROM artifacts {where} "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, int(limit)),
+            ).fetchall()
+            return [dict(r) for r in rows]
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        conn = self._get_connection()
+        try:
+            blobs = conn.execute(
+                "SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size, COALESCE(SUM(stored_size), 0) AS stored "
+                "FROM artifact_blobs"
+            ).fetchone()
+            rows = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size FROM artifacts").fetchone()
+        finally:
+            conn.close()
+        return {
+            "blobs": blobs["n"],
+            "artifacts": rows["n"],
+            "logical_bytes": rows["size"],
+            "unique_bytes": blobs["size"],
+            "stored_bytes": blobs["stored"],
+            "max_bytes": self.max_bytes,
+        }
+
+    # -- eviction -------------------------------------------------------------
+
+    def _maybe_evict(self) -> None:
+        if time.monotonic() - self._last_evict < self.evict_interval_s:
+            return
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_evict = time.monotonic()
+            self.evict()
+        except Exception:
+            logger.exception("artifact eviction failed")
+        finally:
+            self._evict_lock.release()
+
+    def evict(self, max_bytes: Optional[int] = None, max_age_days: Optional[float] = None) -> int:
+        """Apply the age and size limits; returns the number of blob files deleted."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+
+        conn = self._get_connection()
+        try:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if max_age_days and max_age_days > 0:
+                    cutoff = datetime.now() - timedelta(days=max_age_days)
+                    conn.execute("DELETE FROM artifacts WHERE created_at < ?", (cutoff,))
+                removed = self._delete_orphans(conn)
+
+                if max_bytes and max_bytes > 0:
+                    total = conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM artifact_blobs").fetchone()[0]
+                    while total > max_bytes:
+                        # Drop every index row of the blob whose newest reference is oldest
+                        oldest = conn.execute(
+                            "SELECT hash FROM artifacts GROUP BY hash ORDER BY MAX(created_at) ASC LIMIT 1"
+                        ).fetchone()
+                        if oldest is None:
+                            break
+                        conn.execute("DELETE FROM artifacts WHERE hash = ?", (oldest["hash"],))
+                        removed += self._delete_orphans(conn)
+                        total = conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM artifact_blobs").fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        return removed
+
+    def _delete_orphans(self, conn) -> int:
+        orphans = conn.execute(
+            "SELECT hash, codec, ext FROM artifact_blobs b "
+            "WHERE NOT EXISTS (SELECT 1 FROM artifacts a WHERE a.hash = b.hash)"
+        ).fetchall()
+        for row in orphans:
+            try:
+                os.remove(self._blob_path(row["hash"], row["codec"], row["ext"]))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM artifact_blobs WHERE hash = ?", (row["hash"],))
+        return len(orphans)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Process-wide store configured from the ARTIFACT_* environment variables, indexed in the main database."""
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                try:
+                    from server import database
+                except ImportError:
+                    import database
+                _default_store = ArtifactStore(ARTIFACT_DIR, database.get_connection)
+    return _default_store
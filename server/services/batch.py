@@ -0,0 +1,515 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from server.services import fast_json
+except ImportError:
+    from services import fast_json
+
+logger = logging.getLogger(__name__)
+
+# gemini: Gemini Batch API (client.batches); local: an in-process stand-in (tests, dry runs)
+BATCH_BACKEND = os.getenv("BATCH_BACKEND", "gemini").lower()
+BATCH_MODEL = os.getenv("BATCH_MODEL", "gemini-2.5-flash-lite")
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "batch_jobs"))
+# Batch jobs finish within hours, not seconds; there is no point polling faster than this
+BATCH_POLL_S = float(os.getenv("BATCH_POLL_S", 60))
+# Lines that fail (provider error or unparseable answer) are resubmitted up to this many times in total
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", 3))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", 2048))
+# Records are written to the products table in transactions of this many rows
+BATCH_WRITE_CHUNK = int(os.getenv("BATCH_WRITE_CHUNK", 200))
+
+TERMINAL_STATES = {"succeeded", "failed", "cancelled", "expired"}
+
+
+# ---------------------------------------------------------------------------
+# JSONL lines
+# ---------------------------------------------------------------------------
+
+def request_line(key: str, text: str, system_instruction: Optional[str] = None,
+                 max_tokens: int = BATCH_MAX_TOKENS, temperature: float = 0.0) -> dict:
+    """One line of a batch input file: a GenerateContentRequest under ``key``."""
+    request = {
+        "contents": [{"role": "user", "parts": [{"text": text}]}],
+        "generation_config": {"temperature": temperature, "max_output_tokens": max_tokens},
+    }
+    if system_instruction:
+        request["system_instruction"] = {"parts": [{"text": system_instruction}]}
+    return {"key": key, "request": request}
+
+
+def request_text(request: dict) -> Tuple[Optional[str], str]:
+    """(system instruction, user text) of a request written by request_line()."""
+    system = "".join(part.get("text", "") for part in (request.get("system_instruction") or {}).get("parts", []))
+    text = "".join(part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", []))
+    return system or None, text
+
+
+def response_text(line: dict) -> Tuple[Optional[str], Optional[str]]:
+    """(text, error) of one line of a batch results file."""
+    error = line.get("error") or line.get("status")
+    if error:
+        return None, error.get("message", str(error)) if isinstance(error, dict) else str(error)
+    candidates = (line.get("response") or {}).get("candidates") or []
+    if not candidates:
+        return None, "no candidates in response"
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    text = "".join(part.get("text", "") for part in parts)
+    if not text:
+        return None, f"empty response (finish reason {candidates[0].get('finishReason') or candidates[0].get('finish_reason')})"
+    return text, None
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """Lines of a JSONL file one at a time, skipping blank and malformed lines."""
+    with open(path, "rb") as f:
+        for raw in f:
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                yield fast_json.loads(raw)
+            except ValueError:
+                logger.warning("Skipping malformed JSONL line in %s", path)
+
+
+def write_jsonl(path: str, lines: Iterable[dict]) -> int:
+    tmp = path + ".tmp"
+    count = 0
+    with open(tmp, "wb") as f:
+        for line in lines:
+            f.write(fast_json.dumpb(line) + b"\n")
+            count += 1
+    os.replace(tmp, path)
+    return count
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class GeminiBatchBackend:
+    """Gemini Batch API: upload the JSONL file, create a job, poll it, download its results file."""
+
+    name = "gemini"
+
+    def __init__(self, get_client: Callable[[], object]):
+        self.get_client = get_client
+
+    def submit(self, path: str, model: str, display_name: str) -> str:
+        client = self.get_client()
+        uploaded = client.files.upload(file=path, config={"display_name": display_name, "mime_type": "jsonl"})
+        job = client.batches.create(model=model, src=uploaded.name, config={"display_name": display_name})
+        return job.name
+
+    def status(self, job_name: str) -> str:
+        state = self.get_client().batches.get(name=job_name).state
+        state = getattr(state, "name", state) or ""
+        return str(state).lower().replace("job_state_", "")
+
+    def download(self, job_name: str, dest_path: str) -> None:
+        client = self.get_client()
+        job = client.batches.get(name=job_name)
+        data = client.files.download(file=job.dest.file_name)
+        tmp = dest_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dest_path)
+
+
+class LocalBatchBackend:
+    """
+    In-process stand-in with the Batch API's lifecycle: a job is "running"
+    for ``polls_until_done`` status checks, then its results file is produced
+    line by line with ``respond(request) -> text``. A respond() that raises
+    yields an error line, like a failed request in a real batch.
+    """
+
+    name = "local"
+
+    def __init__(self, respond: Optional[Callable[[dict], str]] = None, polls_until_done: int = 1):
+        self.respond = respond or self._call_llm
+        self.polls_until_done = polls_until_done
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, dict] = {}
+
+    @staticmethod
+    def _call_llm(request: dict) -> str:
+        try:
+            from server.services.llm import call_llm
+        except ImportError:
+            from services.llm import call_llm
+        system, text = request_text(request)
+        config = request.get("generation_config") or {}
+        return call_llm(text, cached_prefix=system, temperature=config.get("temperature", 0.0),
+                        max_tokens=config.get("max_output_tokens", BATCH_MAX_TOKENS))
+
+    def submit(self, path: str, model: str, display_name: str) -> str:
+        with self._lock:
+            name = f"batches/local-{len(self._jobs) + 1}"
+            self._jobs[name] = {"path": path, "model": model, "polls": 0}
+        return name
+
+    def status(self, job_name: str) -> str:
+        with self._lock:
+            job = self._jobs[job_name]
+            job["polls"] += 1
+            return "succeeded" if job["polls"] >= self.polls_until_done else "running"
+
+    def download(self, job_name: str, dest_path: str) -> None:
+        def results():
+            for line in read_jsonl(self._jobs[job_name]["path"]):
+                try:
+                    text = self.respond(line["request"])
+                    yield {"key": line["key"], "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]}}
+                except Exception as e:
+                    yield {"key": line["key"], "error": {"message": str(e)}}
+        write_jsonl(dest_path, results())
+
+
+def get_backend(name: str = BATCH_BACKEND):
+    if name == "local":
+        return LocalBatchBackend()
+    if name == "gemini":
+        try:
+            from server.agents.gemini_image import get_client
+        except ImportError:
+            from agents.gemini_image import get_client
+        return GeminiBatchBackend(get_client)
+    raise ValueError(f"Unsupported BATCH_BACKEND: {name}")
+
+
+# ---------------------------------------------------------------------------
+# Enrichment tasks
+# ---------------------------------------------------------------------------
+#
+# A backfill item is a dict: {"key", "product", optional "analysis"}, plus what
+# the tasks add ("transformed", "category", "category_reasoning") and
+# "errors" ({task: message} for lines that failed every attempt).
+
+def _agents():
+    try:
+        from server.agents import arrange, fill_missing, transform
+    except ImportError:
+        from agents import arrange, fill_missing, transform
+    return arrange, fill_missing, transform
+
+
+class TransformTask:
+    """Raw product data -> carbon calculation input (agents.transform)."""
+
+    name = "transform"
+
+    def __init__(self, max_tokens: int = BATCH_MAX_TOKENS):
+        self.max_tokens = max_tokens
+
+    def prompt(self, item: dict) -> Optional[Tuple[Optional[str], str]]:
+        if item.get("transformed") is not None:
+            return None
+        _, _, transform = _agents()
+        product_json = json.dumps(item["product"], ensure_ascii=False)
+        return transform.PROMPT_PREFIX, product_json + transform.PROMPT_SUFFIX
+
+    def apply(self, item: dict, text: str) -> None:
+        _, _, transform = _agents()
+        parsed = transform._safe_load_json(text)
+        if not isinstance(parsed, dict):
+            raise ValueError(f"transform output is not a JSON object: {text[:200]}")
+        item["transformed"] = parsed
+
+
+class FillMissingTask:
+    """Null values of the transform result filled from a page analysis, for items that have one."""
+
+    name = "fill_missing"
+
+    def __init__(self, max_tokens: int = 4096):
+        self.max_tokens = max_tokens
+
+    def prompt(self, item: dict) -> Optional[Tuple[Optional[str], str]]:
+        if not item.get("analysis") or item.get("transformed") is None or item.get("filled"):
+            return None
+        _, fill_missing, _ = _agents()
+        return None, fill_missing.construct_fill_prompt(item["transformed"], item["analysis"])
+
+    def apply(self, item: dict, text: str) -> None:
+        _, _, transform = _agents()
+        parsed = transform._safe_load_json(text)
+        if not isinstance(parsed, dict):
+            raise ValueError(f"fill-missing output is not a JSON object: {text[:200]}")
+        item["transformed"] = parsed
+        item["filled"] = True
+
+
+class CategoryTask:
+    """One of the canonical categories (agents.arrange) for each transformed item."""
+
+    name = "category"
+
+    def __init__(self, max_tokens: int = 512, categories: Optional[List[str]] = None):
+        self.max_tokens = max_tokens
+        self._categories = categories
+
+    @property
+    def categories(self) -> List[str]:
+        if self._categories is None:
+            arrange, _, _ = _agents()
+            self._categories = arrange._load_flat_categories(arrange.CATEGORIES_PATH)
+        return self._categories
+
+    def prompt(self, item: dict) -> Optional[Tuple[Optional[str], str]]:
+        if item.get("transformed") is None or "category" in item or not self.categories:
+            return None
+        arrange, _, _ = _agents()
+        return (arrange._category_prompt_prefix(self.categories),
+                arrange._category_prompt_product(item["product"], item["transformed"]))
+
+    def apply(self, item: dict, text: str) -> None:
+        arrange, _, _ = _agents()
+        item["category"], item["category_reasoning"] = arrange.parse_category_response(text, self.categories)
+
+
+TASKS = {task.name: task for task in (TransformTask, FillMissingTask, CategoryTask)}
+
+
+# ---------------------------------------------------------------------------
+# Running a backfill
+# ---------------------------------------------------------------------------
+
+class BatchRunner:
+    """
+    Runs enrichment tasks over many items as batch jobs: each task's prompts
+    are written to a JSONL file and submitted in one job, the job is polled
+    every ``poll_s`` until it finishes, and its results file is read back one
+    line at a time. Lines that failed (provider error, unparseable answer)
+    are resubmitted as a smaller job, up to ``max_attempts`` jobs per task.
+
+    Everything lives in ``run_dir``: the request and result files, the
+    items after each task (items.jsonl) and the submitted jobs (jobs.json),
+    so an interrupted run resumes by waiting on its jobs instead of
+    resubmitting them.
+    """
+
+    def __init__(self, backend, run_dir: str, model: str = BATCH_MODEL, poll_s: float = BATCH_POLL_S,
+                 max_attempts: int = BATCH_MAX_ATTEMPTS, sleep: Callable[[float], None] = time.sleep):
+        self.backend = backend
+        self.run_dir = run_dir
+        self.model = model
+        self.poll_s = poll_s
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        os.makedirs(run_dir, exist_ok=True)
+        self._jobs_path = os.path.join(run_dir, "jobs.json")
+        self._items_path = os.path.join(run_dir, "items.jsonl")
+
+    # -- run state ------------------------------------------------------------
+
+    def _load_jobs(self) -> Dict[str, dict]:
+        try:
+            with open(self._jobs_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_jobs(self, jobs: Dict[str, dict]) -> None:
+        tmp = self._jobs_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(jobs, f, indent=1)
+        os.replace(tmp, self._jobs_path)
+
+    def save_items(self, items: List[dict]) -> None:
+        write_jsonl(self._items_path, items)
+
+    def load_items(self) -> Optional[List[dict]]:
+        if not os.path.exists(self._items_path):
+            return None
+        return list(read_jsonl(self._items_path))
+
+    # -- jobs -----------------------------------------------------------------
+
+    def wait(self, job_name: str) -> str:
+        """Poll ``job_name`` until it reaches a terminal state; returns the state."""
+        while True:
+            state = self.backend.status(job_name)
+            if state in TERMINAL_STATES:
+                return state
+            logger.info("Batch job %s is %s", job_name, state)
+            self.sleep(self.poll_s)
+
+    def run_task(self, task, items: List[dict], on_done: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Run ``task`` over the items that need it, updating them in place.
+        ``on_done(item)`` is called as each item's result is applied (also
+        for items whose lines failed every attempt), so results can be
+        streamed on while the file is still being read.
+        """
+        by_key = {item["key"]: item for item in items}
+        jobs = self._load_jobs()
+        summary = {"task": task.name, "requests": 0, "succeeded": 0, "failed": 0, "jobs": 0}
+        pending = [item for item in items if task.prompt(item) is not None]
+        summary["requests"] = len(pending)
+
+        attempt = 0
+        while pending and attempt < self.max_attempts:
+            attempt += 1
+            job_id = f"{task.name}-{attempt}"
+            requests_path = os.path.join(self.run_dir, f"{job_id}.requests.jsonl")
+            results_path = os.path.join(self.run_dir, f"{job_id}.results.jsonl")
+
+            job = jobs.get(job_id)
+            if job is None or job.get("state") in ("failed", "cancelled", "expired"):
+                def lines():
+                    for item in pending:
+                        system, text = task.prompt(item)
+                        yield request_line(item["key"], text, system, max_tokens=task.max_tokens)
+                write_jsonl(requests_path, lines())
+                name = self.backend.submit(requests_path, self.model, f"backfill-{os.path.basename(self.run_dir)}-{job_id}")
+                job = jobs[job_id] = {"name": name, "state": "submitted", "lines": len(pending)}
+                self._save_jobs(jobs)
+                summary["jobs"] += 1
+                logger.info("Submitted %s lines for %s as %s", len(pending), task.name, name)
+
+            if job["state"] != "applied":
+                state = self.wait(job["name"])
+                job["state"] = state
+                self._save_jobs(jobs)
+                if state != "succeeded":
+                    logger.warning("Batch job %s ended %s; resubmitting its %s lines", job["name"], state, len(pending))
+                    continue
+                self.backend.download(job["name"], results_path)
+
+            failed_keys = set()
+            answered = set()
+            for line in read_jsonl(results_path):
+                item = by_key.get(line.get("key"))
+                if item is None:
+                    continue
+                answered.add(item["key"])
+                text, error = response_text(line)
+                if error is None:
+                    try:
+                        task.apply(item, text)
+                    except Exception as e:
+                        error = f"unusable answer: {e}"
+                if error is None:
+                    item.get("errors", {}).pop(task.name, None)
+                    summary["succeeded"] += 1
+                    if on_done:
+                        on_done(item)
+                else:
+                    item.setdefault("errors", {})[task.name] = error
+                    failed_keys.add(item["key"])
+            # Lines missing from the results file count as failed too
+            pending = [item for item in pending if item["key"] in failed_keys or item["key"] not in answered]
+            for item in pending:
+                item.setdefault("errors", {}).setdefault(task.name, "no result line")
+            job["state"] = "applied"
+            self._save_jobs(jobs)
+            if pending:
+                logger.info("%s of %s lines failed in %s", len(pending), job["lines"], job["name"])
+
+        summary["failed"] = len(pending)
+        if on_done:
+            for item in pending:
+                on_done(item)
+        return summary
+
+
+def _build_record(item: dict, categories: List[str]) -> Optional[dict]:
+    """The products row for a finished item, or None if it was never transformed."""
+    if item.get("transformed") is None:
+        return None
+    arrange, _, _ = _agents()
+    try:
+        from server.services.carbon_calc import calculate_carbon_footprint
+    except ImportError:
+        from services.carbon_calc import calculate_carbon_footprint
+    carbon_result = calculate_carbon_footprint(item["transformed"])
+    return arrange.build_record(item["product"], item["transformed"], carbon_result, categories,
+                                item.get("category"), item.get("category_reasoning"))
+
+
+def run_backfill(items: List[dict], runner: BatchRunner, tasks: Iterable = ("transform", "fill_missing", "category"),
+                 store: bool = True, write_chunk: int = BATCH_WRITE_CHUNK) -> dict:
+    """
+    Enrich ``items`` with batch jobs, one task after another, and (with
+    ``store``) write each finished product to the products table as the last
+    task's results are read. Items whose category line failed every attempt
+    are stored with the token-matching category, as arrange_product does
+    when the LLM fails; items that could not be transformed are not stored.
+    """
+    try:
+        from server import database
+    except ImportError:
+        import database
+
+    # Task names, or task instances
+    tasks = [TASKS[task]() if isinstance(task, str) else task for task in tasks]
+    categories = next((task.categories for task in tasks if isinstance(task, CategoryTask)), None)
+    if categories is None:
+        arrange, _, _ = _agents()
+        categories = arrange._load_flat_categories(arrange.CATEGORIES_PATH)
+
+    summary = {"items": len(items), "tasks": [], "stored": 0, "not_stored": 0}
+    buffer: List[dict] = []
+    stored_keys = set()
+    conn = database.get_connection() if store else None
+
+    def flush():
+        if buffer:
+            summary["stored"] += database.insert_products(buffer, conn=conn)
+            buffer.clear()
+
+    def store_item(item):
+        if not store or item["key"] in stored_keys:
+            return
+        record = _build_record(item, categories)
+        if record is None:
+            return
+        stored_keys.add(item["key"])
+        buffer.append(record)
+        if len(buffer) >= write_chunk:
+            flush()
+
+    try:
+        runner.save_items(items)
+        for index, task in enumerate(tasks):
+            last = index == len(tasks) - 1
+            summary["tasks"].append(runner.run_task(task, items, on_done=store_item if last else None))
+            runner.save_items(items)
+        # Items the last task had nothing to do for (already enriched) are stored as they are
+        for item in items:
+            store_item(item)
+        flush()
+    finally:
+        if conn is not None:
+            conn.close()
+    summary["not_stored"] = len(items) - summary["stored"] if store else len(items)
+    return summary
+
+
+def items_from_products(products: Iterable[dict]) -> List[dict]:
+    """Backfill items for raw product dicts (``analysis`` is taken from the product if present)."""
+    items = []
+    for index, product in enumerate(products):
+        product = dict(product)
+        analysis = product.pop("analysis", None)
+        key = str(product.get("sku") or product.get("id") or product.get("url") or f"line-{index + 1}")
+        item = {"key": key, "product": product}
+        if analysis:
+            item["analysis"] = analysis
+        items.append(item)
+    # Keys must be unique within a batch file
+    seen: Dict[str, int] = {}
+    for item in items:
+        count = seen.get(item["key"], 0)
+        seen[item["key"]] = count + 1
+        if count:
+            item["key"] = f"{item['key']}#{count + 1}"
+    return items
@@ -0,0 +1,293 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from server.services.resource_policy import ResourcePolicy, site_of
+except ImportError:
+    from services.resource_policy import ResourcePolicy, site_of
+
+# storage_state: a fresh context seeded with the saved cookies of the sites being visited;
+# persistent: one Chromium profile directory (cookies and HTTP disk cache survive between captures,
+# but only the resource policy's blocked domains are enforced, see BrowserProfile); off: neither
+BROWSER_PROFILE_MODE = os.getenv("BROWSER_PROFILE_MODE", "storage_state").lower()
+BROWSER_PROFILE_DIR = os.getenv("BROWSER_PROFILE_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "browser_profile"))
+# Chromium's disk cache limit, and the size of the whole profile above which the caches are cleared
+BROWSER_DISK_CACHE_BYTES = int(os.getenv("BROWSER_DISK_CACHE_BYTES", 256 * 1024 * 1024))
+BROWSER_PROFILE_MAX_BYTES = int(os.getenv("BROWSER_PROFILE_MAX_BYTES", 512 * 1024 * 1024))
+# The profile is recreated after this long, and saved per-site state is not reused after this long
+BROWSER_PROFILE_MAX_AGE_H = float(os.getenv("BROWSER_PROFILE_MAX_AGE_H", 72))
+BROWSER_STATE_MAX_AGE_H = float(os.getenv("BROWSER_STATE_MAX_AGE_H", 24))
+
+# Cache directories inside a Chromium profile, cleared when the profile grows too large
+_CACHE_DIRS = {"Cache", "Code Cache", "GPUCache", "Service Worker", "DawnCache", "GrShaderCache"}
+_CREATED_MARKER = ".created"
+# Held (next to, not inside, the profile directory) by whichever process is using or maintaining it
+_LOCK_FILE = "profile.lock"
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _try_lock_file(path: str):
+    """An exclusive lock on ``path`` held through the returned file, or None if another holder has it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _unlock_file(f) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+
+def split_storage_state(state: dict, sites: Iterable[str]) -> Dict[str, dict]:
+    """A context's ``storage_state()`` split into one state per site in ``sites``."""
+    per_site = {site: {"cookies": [], "origins": []} for site in sites}
+    for cookie in state.get("cookies") or []:
+        site = site_of((cookie.get("domain") or "").lstrip("."))
+        if site in per_site:
+            per_site[site]["cookies"].append(cookie)
+    for origin in state.get("origins") or []:
+        host = (origin.get("origin") or "").split("://", 1)[-1].split(":", 1)[0].split("/", 1)[0]
+        site = site_of(host)
+        if site in per_site:
+            per_site[site]["origins"].append(origin)
+    return per_site
+
+
+class BrowserSession:
+    """An open capture context and how to close it (saving per-site state first)."""
+
+    def __init__(self, context, browser, profile: "BrowserProfile", sites: List[str], disk_cache: bool, lock_held: bool):
+        self.context = context
+        self.browser = browser
+        self.profile = profile
+        self.sites = sites
+        self.disk_cache = disk_cache
+        self._lock_held = lock_held
+
+    def page(self):
+        return self.context.pages[0] if self.context.pages else self.context.new_page()
+
+    def close(self) -> None:
+        try:
+            if self.profile.mode != "off":
+                try:
+                    self.profile.save_state(self.context.storage_state(), self.sites)
+                except Exception as e:
+                    print(f"  Could not save browser storage state: {e}")
+            self.context.close()
+            if self.browser is not None:
+                self.browser.close()
+        finally:
+            if self._lock_held:
+                self.profile._release_profile()
+
+
+class BrowserProfile:
+    """
+    Builds capture contexts that remember what earlier captures fetched.
+
+    In "persistent" mode the context runs on a profile directory, so cookies
+    (consent banners, bot checks already passed) and Chromium's HTTP disk
+    cache (retailer CSS, JS bundles, sprites) carry over between captures.
+    Only one browser, in any process, can use the directory at a time;
+    concurrent captures, and "storage_state" mode, get a fresh context
+    seeded with the saved cookies and local storage of the sites they will
+    visit.
+
+    Playwright disables the HTTP cache for contexts with request routing, so
+    with the disk cache the resource policy's blocked domains are enforced
+    through Chromium's host resolver instead, and its resource-type and
+    third-party blocking does not apply. That is why "persistent" is opt-in.
+
+    The profile's caches are cleared when it exceeds ``max_bytes``, the whole
+    profile is recreated after ``max_age_h``, and saved per-site state older
+    than ``state_max_age_h`` is discarded.
+    """
+
+    def __init__(self, root: str = BROWSER_PROFILE_DIR, mode: str = BROWSER_PROFILE_MODE,
+                 disk_cache_bytes: int = BROWSER_DISK_CACHE_BYTES, max_bytes: int = BROWSER_PROFILE_MAX_BYTES,
+                 max_age_h: float = BROWSER_PROFILE_MAX_AGE_H, state_max_age_h: float = BROWSER_STATE_MAX_AGE_H):
+        self.root = root
+        self.mode = mode
+        self.disk_cache_bytes = disk_cache_bytes
+        self.max_bytes = max_bytes
+        self.max_age_h = max_age_h
+        self.state_max_age_h = state_max_age_h
+        self.user_data_dir = os.path.join(root, "chromium")
+        self.state_dir = os.path.join(root, "state")
+        self.lock_path = os.path.join(root, _LOCK_FILE)
+        self._profile_lock = threading.Lock()
+        self._lock_file = None
+        self._state_lock = threading.Lock()
+
+    def _acquire_profile(self) -> bool:
+        """Take the profile directory for this capture: the thread lock, then the cross-process file lock."""
+        if not self._profile_lock.acquire(blocking=False):
+            return False
+        try:
+            self._lock_file = _try_lock_file(self.lock_path)
+        except OSError:
+            self._lock_file = None
+        if self._lock_file is None:
+            self._profile_lock.release()
+            return False
+        return True
+
+    def _release_profile(self) -> None:
+        lock_file, self._lock_file = self._lock_file, None
+        try:
+            if lock_file is not None:
+                _unlock_file(lock_file)
+        finally:
+            self._profile_lock.release()
+
+    # -- maintenance ---------------------------------------------------------
+
+    def maintain(self) -> dict:
+        """
+        Recreate an expired profile and clear caches of an oversized one.
+        Call only while holding the profile (open() does), so no browser in any process uses it.
+        """
+        actions = {"recreated": False, "caches_cleared": False, "size": 0}
+        marker = os.path.join(self.user_data_dir, _CREATED_MARKER)
+        if os.path.isdir(self.user_data_dir):
+            try:
+                age_h = (time.time() - os.path.getmtime(marker)) / 3600.0
+            except OSError:
+                age_h = float("inf")
+            if self.max_age_h and age_h > self.max_age_h:
+                shutil.rmtree(self.user_data_dir, ignore_errors=True)
+                actions["recreated"] = True
+            else:
+                size = _dir_size(self.user_data_dir)
+                if self.max_bytes and size > self.max_bytes:
+                    for root, dirs, _ in os.walk(self.user_data_dir):
+                        for name in [d for d in dirs if d in _CACHE_DIRS]:
+                            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                            dirs.remove(name)
+                    actions["caches_cleared"] = True
+                    size = _dir_size(self.user_data_dir)
+                actions["size"] = size
+        if not os.path.isdir(self.user_data_dir):
+            os.makedirs(self.user_data_dir, exist_ok=True)
+            with open(marker, "w") as f:
+                f.write(str(time.time()))
+        return actions
+
+    # -- per-site storage state ----------------------------------------------
+
+    def _state_path(self, site: str) -> str:
+        return os.path.join(self.state_dir, site.replace(os.sep, "_") + ".json")
+
+    def load_state(self, sites: Iterable[str]) -> dict:
+        """Saved cookies and local storage of ``sites`` merged into one ``storage_state``."""
+        merged = {"cookies": [], "origins": []}
+        now = time.time()
+        for site in sites:
+            path = self._state_path(site)
+            try:
+                if self.state_max_age_h and now - os.path.getmtime(path) > self.state_max_age_h * 3600:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            merged["cookies"].extend(state.get("cookies") or [])
+            merged["origins"].extend(state.get("origins") or [])
+        return merged
+
+    def save_state(self, state: dict, sites: Iterable[str]) -> None:
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._state_lock:
+            for site, site_state in split_storage_state(state, sites).items():
+                if not site_state["cookies"] and not site_state["origins"]:
+                    continue
+                path = self._state_path(site)
+                tmp = path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(site_state, f)
+                os.replace(tmp, path)
+
+    # -- contexts ------------------------------------------------------------
+
+    def open(self, playwright, urls: Iterable[str], args: Optional[List[str]] = None,
+             context_options: Optional[dict] = None, policy: Optional[ResourcePolicy] = None,
+             headless: bool = True) -> BrowserSession:
+        """A capture context for visiting ``urls``; close it with ``session.close()``."""
+        sites = sorted({site_of(urlparse(url).hostname or "") for url in urls} - {""})
+        args = list(args or [])
+        context_options = dict(context_options or {})
+
+        if self.mode == "persistent" and self._acquire_profile():
+            try:
+                maintenance = self.maintain()
+                if maintenance["recreated"] or maintenance["caches_cleared"]:
+                    print(f"  Browser profile maintenance: {maintenance}")
+                persistent_args = args + [f"--disk-cache-size={self.disk_cache_bytes}"]
+                if policy is not None and policy.enabled and policy.block_domains:
+                    persistent_args.append(policy.host_resolver_rules())
+                context = playwright.chromium.launch_persistent_context(
+                    self.user_data_dir, headless=headless, args=persistent_args, **context_options)
+                return BrowserSession(context, None, self, sites, disk_cache=True, lock_held=True)
+            except Exception as e:
+                # e.g. Chromium could not start on the directory
+                self._release_profile()
+                print(f"  Persistent browser profile unavailable ({e}), using a fresh context")
+
+        browser = playwright.chromium.launch(headless=headless, args=args)
+        if self.mode != "off":
+            context_options["storage_state"] = self.load_state(sites)
+        context = browser.new_context(**context_options)
+        return BrowserSession(context, browser, self, sites, disk_cache=False, lock_held=False)
+
+
+_default_profile = None
+_default_lock = threading.Lock()
+
+
+def get_browser_profile() -> BrowserProfile:
+    """Process-wide profile, so captures in one process take turns on the profile directory."""
+    global _default_profile
+    if _default_profile is None:
+        with _default_lock:
+            if _default_profile is None:
+                _default_profile = BrowserProfile()
+    return _default_profile
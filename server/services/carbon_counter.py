@@ -0,0 +1,359 @@
+import atexit
+import logging
+import random
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def shard_id(index: int) -> str:
+    return f"shard-{index}"
+
+
+class CarbonCounter:
+    """
+    Global carbon-savings counter stored in the TotalCarbonReduced collection.
+
+    Every increment is a single atomic ``$inc`` upsert, so concurrent checkouts
+    never lose updates. With ``write_behind=True`` increments are summed in
+    process and flushed every ``flush_interval_ms`` or every ``flush_max_events``
+    increments, whichever comes first; pending savings are flushed on close()
+    and at interpreter exit.
+
+    With ``shards > 1`` the total is split across documents ``shard-0`` ..
+    ``shard-<N-1>``; each increment goes to one shard, picked by a hash of the
+    caller's shard key or at random, and the total is the sum over every
+    document in the collection (so a pre-existing single total document keeps
+    counting). compact() folds documents outside the current shard set into
+    ``shard-0``. Optional per-user tallies live one document per user in
+    ``get_user_collection()``, so they add no shared hotspot.
+
+    Reads go through snapshot(), an in-process cache of the stored total that is
+    refreshed by this process's own writes or after a short TTL. ``on_change``
+    is called with the new total whenever the cached value changes.
+    """
+
+    def __init__(self,
+                 get_collection: Callable[[], object],
+                 write_behind: bool = False,
+                 flush_interval_ms: int = 500,
+                 flush_max_events: int = 100,
+                 on_change: Optional[Callable[[float], None]] = None,
+                 shards: int = 1,
+                 get_user_collection: Optional[Callable[[], object]] = None):
+        self._get_collection = get_collection
+        self._get_user_collection = get_user_collection
+        self._on_change = on_change
+        self.write_behind = write_behind
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_max_events = max(1, flush_max_events)
+        self.shards = max(1, shards)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending_amount = 0.0
+        self._pending_events = 0
+        self._pending_by_user: Dict[str, float] = {}
+        self._oldest_pending = None  # monotonic time of the oldest unflushed increment
+        self._last_total = None
+
+        # Cached stored total served to readers; version bumps whenever it changes
+        self._cache_lock = threading.Lock()
+        self._cached_total = None
+        self._cached_at = 0.0
+        self._version = 0
+
+        self._metrics = {
+            "flushes": 0,
+            "flush_errors": 0,
+            "flushed_events": 0,
+            "last_flush_lag_ms": None,
+            "max_flush_lag_ms": 0.0,
+            "compactions": 0,
+        }
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._maintenance_thread = None
+        if write_behind:
+            self._thread = threading.Thread(target=self._run, name="carbon-counter-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # -- writes -------------------------------------------------------------
+
+    def _pick_shard(self, shard_key: Optional[str]) -> int:
+        if self.shards == 1:
+            return 0
+        if shard_key:
+            return zlib.crc32(shard_key.encode("utf-8")) % self.shards
+        return random.randrange(self.shards)
+
+    def _apply(self, amount: float, shard_key: Optional[str] = None):
+        """Write one increment; returns ``(total, created)`` where created means no total was stored before."""
+        if self.shards == 1:
+            from pymongo import ReturnDocument
+
+            # Single document: the document before the update tells whether this created it
+            doc = self._get_collection().find_one_and_update(
+                {},
+                {"$inc": {"Total": amount}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+            created = doc is None
+            total = amount if created else (doc.get("Total") or 0) + amount
+        else:
+            result = self._get_collection().update_one(
+                {"_id": shard_id(self._pick_shard(shard_key))},
+                {"$inc": {"Total": amount}},
+                upsert=True,
+            )
+            # Other shards are not read on the write path; extend the cached sum instead
+            total = self._add_to_cached(amount)
+            if total is None:
+                total = self.total()
+            else:
+                self._last_total = total
+            # A new shard document only means a new total if nothing else is stored
+            return total, result.upserted_id is not None and total == amount
+        self._last_total = total
+        self._set_cached(total)
+        return total, created
+
+    def _apply_user_tallies(self, by_user: Dict[str, float]) -> None:
+        if self._get_user_collection is None:
+            return
+        collection = self._get_user_collection()
+        for user, amount in by_user.items():
+            collection.update_one({"_id": user}, {"$inc": {"Total": amount}}, upsert=True)
+
+    def increment(self, amount: float, shard_key: Optional[str] = None,
+                  user_key: Optional[str] = None) -> Optional[float]:
+        """Add ``amount``; returns the new total (see record())."""
+        return self.record(amount, shard_key=shard_key, user_key=user_key)[0]
+
+    def record(self, amount: float, shard_key: Optional[str] = None,
+               user_key: Optional[str] = None):
+        """
+        Add ``amount`` to the global total (and to ``user_key``'s tally, if given).
+
+        ``shard_key`` (e.g. the client address) pins the caller to one shard;
+        without it a shard is chosen at random. ``user_key`` never picks the
+        shard, so arbitrary ids cannot skew the spread. Returns the new total in direct mode (the cached sum
+        plus ``amount`` when sharded). In write-behind mode returns the last
+        known total plus everything still pending (an estimate).
+
+        Returns ``(total, created)``; created is True when this increment
+        stored the first savings (never in write-behind mode, where the write
+        happens later).
+        """
+        if not self.write_behind:
+            total, created = self._apply(amount, shard_key=shard_key)
+            if user_key:
+                try:
+                    self._apply_user_tallies({user_key: amount})
+                except Exception:
+                    logger.exception("Failed to update carbon tally for %s", user_key)
+            return total, created
+
+        with self._lock:
+            if self._pending_events == 0:
+                self._oldest_pending = time.monotonic()
+            self._pending_amount += amount
+            self._pending_events += 1
+            if user_key:
+                self._pending_by_user[user_key] = self._pending_by_user.get(user_key, 0.0) + amount
+            should_flush = self._pending_events >= self.flush_max_events
+            estimate = (self._last_total or 0) + self._pending_amount
+        if should_flush:
+            self._wake.set()
+        return estimate, False
+
+    def flush(self) -> None:
+        """Write pending increments (one ``$inc`` for the total, one per user tally); re-queue them on failure."""
+        with self._flush_lock:
+            with self._lock:
+                amount = self._pending_amount
+                events = self._pending_events
+                by_user = self._pending_by_user
+                oldest = self._oldest_pending
+                self._pending_amount = 0.0
+                self._pending_events = 0
+                self._pending_by_user = {}
+                self._oldest_pending = None
+            if events == 0 and not by_user:
+                return
+            try:
+                if events:
+                    self._apply(amount)
+            except Exception:
+                logger.exception("Failed to flush %d carbon increments", events)
+                with self._lock:
+                    self._pending_amount += amount
+                    self._pending_events += events
+                    self._requeue_user_tallies(by_user)
+                    if self._oldest_pending is None or oldest < self._oldest_pending:
+                        self._oldest_pending = oldest
+                self._metrics["flush_errors"] += 1
+                return
+            try:
+                self._apply_user_tallies(by_user)
+            except Exception:
+                # The global total is already written; retry only the per-user tallies
+                logger.exception("Failed to flush carbon tallies for %d users", len(by_user))
+                with self._lock:
+                    self._requeue_user_tallies(by_user)
+                self._metrics["flush_errors"] += 1
+
+            if not events:
+                return
+            lag_ms = (time.monotonic() - oldest) * 1000.0
+            self._metrics["flushes"] += 1
+            self._metrics["flushed_events"] += events
+            self._metrics["last_flush_lag_ms"] = lag_ms
+            self._metrics["max_flush_lag_ms"] = max(self._metrics["max_flush_lag_ms"], lag_ms)
+
+    def _requeue_user_tallies(self, by_user: Dict[str, float]) -> None:
+        # Caller holds self._lock
+        for user, user_amount in by_user.items():
+            self._pending_by_user[user] = self._pending_by_user.get(user, 0.0) + user_amount
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_ms / 1000.0)
+            self._wake.clear()
+            self.flush()
+
+    def compact(self) -> int:
+        """
+        Fold every document that is not one of the current shards (a legacy
+        single total document, or shards left over from a larger shard count)
+        into ``shard-0``. Each amount is added to shard-0 before it is removed
+        from its source, so a concurrent read can only over-count briefly,
+        never lose savings. Returns the number of documents folded.
+        """
+        if self.shards == 1:
+            return 0
+        collection = self._get_collection()
+        keep = [shard_id(i) for i in range(self.shards)]
+        folded = 0
+        for doc in collection.find({"_id": {"$nin": keep}}):
+            amount = doc.get("Total") or 0
+            if amount:
+                collection.update_one({"_id": shard_id(0)}, {"$inc": {"Total": amount}}, upsert=True)
+            # Only delete the document if nothing was added to it in the meantime
+            result = collection.delete_one({"_id": doc["_id"], "Total": doc.get("Total")})
+            if result.deleted_count == 0 and amount:
+                collection.update_one({"_id": doc["_id"]}, {"$inc": {"Total": -amount}})
+            folded += 1
+        if folded:
+            self._metrics["compactions"] += 1
+        return folded
+
+    def start_maintenance(self, interval_s: float = 30.0) -> None:
+        """Periodically compact the shards and refresh the cached aggregate in a daemon thread."""
+        if self._maintenance_thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval_s):
+                try:
+                    self.compact()
+                    self.total()
+                except Exception:
+                    logger.exception("carbon counter maintenance failed")
+
+        self._maintenance_thread = threading.Thread(target=loop, name="carbon-counter-maintenance", daemon=True)
+        self._maintenance_thread.start()
+
+    def close(self) -> None:
+        """Stop the background threads and write anything still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    # -- reads --------------------------------------------------------------
+
+    def total(self) -> float:
+        """Read the stored total (pending write-behind increments are not included)."""
+        collection = self._get_collection()
+        if self.shards == 1:
+            doc = collection.find_one()
+            total = doc.get("Total", 0) if doc else 0
+        else:
+            result = list(collection.aggregate([{"$group": {"_id": None, "Total": {"$sum": "$Total"}}}]))
+            total = result[0]["Total"] if result else 0
+        self._last_total = total
+        self._set_cached(total)
+        return total
+
+    def user_total(self, user_key: str) -> float:
+        """Stored tally for one user or session."""
+        if self._get_user_collection is None:
+            return 0
+        doc = self._get_user_collection().find_one({"_id": user_key})
+        return doc.get("Total", 0) if doc else 0
+
+    def _set_cached(self, total) -> None:
+        with self._cache_lock:
+            changed = total != self._cached_total
+            if changed:
+                self._version += 1
+            self._cached_total = total
+            self._cached_at = time.monotonic()
+        if changed and self._on_change is not None:
+            try:
+                self._on_change(total)
+            except Exception:
+                logger.exception("carbon total on_change callback failed")
+
+    def _add_to_cached(self, amount: float) -> Optional[float]:
+        """Atomically extend the cached total; returns None when nothing is cached yet."""
+        with self._cache_lock:
+            if self._cached_total is None:
+                return None
+            self._cached_total += amount
+            self._version += 1
+            self._cached_at = time.monotonic()
+            total = self._cached_total
+        if self._on_change is not None:
+            try:
+                self._on_change(total)
+            except Exception:
+                logger.exception("carbon total on_change callback failed")
+        return total
+
+    def snapshot(self, max_age_s: float = 2.0):
+        """
+        Return ``(total, version)`` from the in-process cache, reading the
+        collection only when the cached value is older than ``max_age_s``.
+        """
+        with self._cache_lock:
+            fresh = self._cached_total is not None and time.monotonic() - self._cached_at < max_age_s
+            if fresh:
+                return self._cached_total, self._version
+        total = self.total()
+        with self._cache_lock:
+            return total, self._version
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending_amount = self._pending_amount
+            pending_events = self._pending_events
+            oldest = self._oldest_pending
+        out = dict(self._metrics)
+        out.update({
+            "write_behind": self.write_behind,
+            "shards": self.shards,
+            "pending_amount": pending_amount,
+            "pending_events": pending_events,
+            "pending_age_ms": (time.monotonic() - oldest) * 1000.0 if oldest is not None else 0.0,
+        })
+        return out
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from typing import Iterator, Optional
+
+
+class TooManySubscribers(Exception):
+    """Raised when the stream already has the maximum number of subscribers."""
+
+
+class TotalBroadcaster:
+    """
+    Fan-out of the global carbon total to Server-Sent Events subscribers.
+
+    publish() only records the latest value; each subscriber wakes up, sends
+    the newest total and then waits at least ``min_interval_s`` before sending
+    again, so a burst of checkouts collapses into one event per interval.
+    Idle subscribers receive a comment line every ``heartbeat_s`` to keep
+    proxies from closing the connection.
+    """
+
+    def __init__(self, max_subscribers: int = 100, min_interval_s: float = 1.0, heartbeat_s: float = 15.0):
+        self.max_subscribers = max_subscribers
+        self.min_interval_s = min_interval_s
+        self.heartbeat_s = heartbeat_s
+
+        self._cond = threading.Condition()
+        self._total = None
+        self._version = 0
+        self._subscribers = 0
+        self._closed = False
+
+    def publish(self, total) -> None:
+        with self._cond:
+            if total == self._total and self._version:
+                return
+            self._total = total
+            self._version += 1
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Ask all open streams to finish."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._cond:
+            return self._subscribers
+
+    def _acquire(self) -> None:
+        with self._cond:
+            if self._subscribers >= self.max_subscribers:
+                raise TooManySubscribers(f"{self._subscribers} subscribers already connected")
+            self._subscribers += 1
+
+    def _release(self) -> None:
+        with self._cond:
+            self._subscribers -= 1
+
+    @staticmethod
+    def format_event(total, version: int) -> str:
+        return f"id: {version}\nevent: total\ndata: {json.dumps({'total': total, 'version': version})}\n\n"
+
+    def subscribe(self) -> "Subscription":
+        """
+        Reserve a subscriber slot and return the SSE body iterator.
+        Raises TooManySubscribers when the cap is reached; the slot is released
+        when the iterator is closed (the WSGI server does this on disconnect)
+        or runs out.
+        """
+        self._acquire()
+        return Subscription(self)
+
+    def _events(self) -> Iterator[str]:
+        last_version: Optional[int] = None
+        # Let EventSource reconnect quickly if the connection drops
+        yield "retry: 3000\n\n"
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or (self._version and self._version != last_version),
+                    timeout=self.heartbeat_s,
+                )
+                if self._closed:
+                    return
+                total, version = self._total, self._version
+            if version and version != last_version:
+                last_version = version
+                yield self.format_event(total, version)
+                # Coalesce: anything published while we sleep is sent as one event
+                time.sleep(self.min_interval_s)
+            else:
+                yield ": heartbeat\n\n"
+
+
+class Subscription:
+    """Iterator over one subscriber's SSE lines that gives its slot back exactly once."""
+
+    def __init__(self, broadcaster: TotalBroadcaster):
+        self._broadcaster = broadcaster
+        self._events = broadcaster._events()
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._events)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self._events.close()
+        if not self._released:
+            self._released = True
+            self._broadcaster._release()
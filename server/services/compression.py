@@ -0,0 +1,86 @@
+import gzip
+import logging
+
+try:
+    import zstandard
+except ImportError:  # optional; only gzip is offered without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+}
+
+
+class ResponseCompressor:
+    """
+    after_request hook that compresses response bodies with zstd or gzip,
+    whichever the client accepts with the higher quality (zstd wins ties).
+
+    Bodies below ``min_size`` bytes, non-text types, streamed responses (the
+    SSE stream) and responses that already carry a Content-Encoding (e.g. the
+    pre-gzipped final outputs) are left untouched.
+    """
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, zstd_level: int = 3):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        self.zstd_available = zstandard is not None
+
+    def init_app(self, app) -> None:
+        app.after_request(self.after_request)
+
+    def choose_encoding(self, accept_encodings):
+        gzip_q = accept_encodings["gzip"]
+        zstd_q = accept_encodings["zstd"] if self.zstd_available else 0
+        if zstd_q and zstd_q >= gzip_q:
+            return "zstd"
+        if gzip_q:
+            return "gzip"
+        return None
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if encoding == "zstd":
+            # ZstdCompressor instances must not be shared between request threads
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(data)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def after_request(self, response):
+        from flask import request
+
+        if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 204
+                or response.direct_passthrough or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        try:
+            compressed = self.compress(data, encoding)
+        except Exception:
+            logger.exception("Failed to %s-compress response", encoding)
+            return response
+        if len(compressed) >= len(data):
+            return response
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        # A weak validator: the compressed bytes differ from the identity representation
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,29 @@
+import itertools
+import sqlite3
+
+import pytest
+
+from server.services.artifact_store import ArtifactStore
+# Database fixtures are shared with server/tests
+from server.tests.conftest import db  # noqa: F401
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    """Builds ArtifactStores under tmp_path; each call returns ``(store, connect)`` on its own directory."""
+    counter = itertools.count()
+
+    def make_store(**kwargs):
+        root = tmp_path / f"artifacts-{next(counter)}"
+        root.mkdir()
+        db_path = str(root / "index.db")
+
+        def connect():
+            conn = sqlite3.connect(db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        kwargs.setdefault("evict_interval_s", 3600)
+        return ArtifactStore(str(root / "blobs"), connect, **kwargs), connect
+
+    return make_store
@@ -0,0 +1,66 @@
+import json
+from typing import Any
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the standard library
+    orjson = None
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj):
+    # Anything orjson cannot encode natively (Decimal, ObjectId, sets, ...) is stringified,
+    # matching the json.dumps(..., default=str) calls this replaces
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def dumpb(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (compact unless ``indent``)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=_default).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize to a JSON string; ``indent=True`` is meant for logs and debug prints."""
+    return dumpb(obj, indent=indent).decode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_file(obj: Any, path: str, indent: bool = True) -> None:
+    """Write ``obj`` as JSON to ``path`` in one binary write."""
+    with open(path, "wb") as f:
+        f.write(dumpb(obj, indent=indent))
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson (the stdlib json module when orjson is
+    missing). jsonify() and request.get_json() go through it once it is set as
+    ``app.json``.
+    """
+
+    mimetype = "application/json"
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumpb(obj), mimetype=self.mimetype)
@@ -0,0 +1,204 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# auto: plain HTTP first where it has worked for the domain; http: always try it; browser: never
+HTTP_FETCH_MODE = os.getenv("HTTP_FETCH_MODE", "auto").lower()
+HTTP_FETCH_TIMEOUT_S = float(os.getenv("HTTP_FETCH_TIMEOUT_S", 10))
+HTTP_FETCH_POOL_SIZE = int(os.getenv("HTTP_FETCH_POOL_SIZE", 16))
+HTTP_FETCH_MAX_BYTES = int(os.getenv("HTTP_FETCH_MAX_BYTES", 5 * 1024 * 1024))
+# Domains known to render product data client-side or to block non-browser clients
+HTTP_FETCH_JS_DOMAINS = [d.strip().lower() for d in os.getenv(
+    "HTTP_FETCH_JS_DOMAINS", "walmart.com,target.com,bestbuy.com").split(",") if d.strip()]
+# After this many attempts, a domain whose HTTP success rate is below the threshold goes straight to the browser...
+HTTP_FETCH_MIN_SAMPLES = int(os.getenv("HTTP_FETCH_MIN_SAMPLES", 3))
+HTTP_FETCH_MIN_SUCCESS_RATE = float(os.getenv("HTTP_FETCH_MIN_SUCCESS_RATE", 0.5))
+# ...except every Nth request, which probes HTTP again so the domain can recover
+HTTP_FETCH_REPROBE_EVERY = int(os.getenv("HTTP_FETCH_REPROBE_EVERY", 20))
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/120.0.0.0 Safari/537.36")
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+# Per-domain header overrides and timeouts (seconds)
+DOMAIN_PROFILES: Dict[str, dict] = {
+    "amazon.com": {"headers": {"Accept-Encoding": "gzip, deflate", "Device-Memory": "8"}, "timeout": 8},
+    "etsy.com": {"timeout": 8},
+    "ebay.com": {"timeout": 8},
+}
+
+# Markers of bot walls; these pages are small, unlike product pages that merely mention them in scripts
+_BLOCKED_MARKERS = re.compile(r"captcha|robot check|are you a human|verify you are human|access denied", re.I)
+_BLOCKED_MAX_BYTES = 100 * 1024
+
+
+def domain_of(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _matches(domain: str, candidates) -> Optional[str]:
+    """The entry of ``candidates`` that ``domain`` equals or is a subdomain of."""
+    for candidate in candidates:
+        if domain == candidate or domain.endswith("." + candidate):
+            return candidate
+    return None
+
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([A-Za-z0-9_-]+)""", re.I)
+
+
+def _encoding_of(content_type: str, body: bytes) -> str:
+    """Charset from the Content-Type header, else from a <meta> tag, else UTF-8."""
+    match = re.search(r"charset=([A-Za-z0-9_-]+)", content_type, re.I) or _META_CHARSET.search(body[:4096])
+    if match:
+        encoding = match.group(1)
+        encoding = encoding.decode("ascii") if isinstance(encoding, bytes) else encoding
+        try:
+            "".encode(encoding)
+            return encoding
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+class FetchResult:
+    __slots__ = ("url", "final_url", "status", "html", "elapsed_ms", "bytes", "error")
+
+    def __init__(self, url, final_url=None, status=None, html="", elapsed_ms=0, size=0, error=None):
+        self.url = url
+        self.final_url = final_url or url
+        self.status = status
+        self.html = html
+        self.elapsed_ms = elapsed_ms
+        self.bytes = size
+        self.error = error
+
+    @property
+    def looks_blocked(self) -> bool:
+        """An error, an empty body or a bot wall rather than the product page."""
+        if self.error or self.status is None or self.status >= 400:
+            return True
+        return len(self.html) < 2000 or (len(self.html) < _BLOCKED_MAX_BYTES and bool(_BLOCKED_MARKERS.search(self.html)))
+
+
+class HttpFetcher:
+    """
+    Fetches product pages over a pooled HTTP session instead of a browser.
+
+    Each domain's HTTP outcomes are counted; ``should_try_http`` sends a
+    domain straight to the browser once enough attempts show plain HTTP
+    rarely yields a usable page there, and re-probes it now and then.
+    Domains in ``js_domains`` always use the browser.
+    """
+
+    def __init__(self, timeout_s: float = HTTP_FETCH_TIMEOUT_S, pool_size: int = HTTP_FETCH_POOL_SIZE,
+                 max_bytes: int = HTTP_FETCH_MAX_BYTES, js_domains=None, profiles: Optional[Dict[str, dict]] = None,
+                 min_samples: int = HTTP_FETCH_MIN_SAMPLES, min_success_rate: float = HTTP_FETCH_MIN_SUCCESS_RATE,
+                 reprobe_every: int = HTTP_FETCH_REPROBE_EVERY, mode: str = HTTP_FETCH_MODE):
+        self.timeout_s = timeout_s
+        self.max_bytes = max_bytes
+        self.js_domains = list(HTTP_FETCH_JS_DOMAINS if js_domains is None else js_domains)
+        self.profiles = DOMAIN_PROFILES if profiles is None else profiles
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.reprobe_every = reprobe_every
+        self.mode = mode
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        retry = Retry(total=1, connect=1, read=0, backoff_factor=0.3, status_forcelist=(502, 504),
+                      allowed_methods=frozenset(["GET"]))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        # domain -> {"http_attempts", "http_successes", "skipped"}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _domain_stats(self, domain: str) -> Dict[str, int]:
+        # Caller holds self._lock
+        return self._stats.setdefault(domain, {"http_attempts": 0, "http_successes": 0, "skipped": 0})
+
+    def should_try_http(self, url: str) -> bool:
+        if self.mode == "browser":
+            return False
+        domain = domain_of(url)
+        if not domain:
+            return False
+        if self.mode == "http":
+            return True
+        if _matches(domain, self.js_domains):
+            return False
+        with self._lock:
+            stats = self._domain_stats(domain)
+            attempts = stats["http_attempts"]
+            if attempts < self.min_samples or stats["http_successes"] / attempts >= self.min_success_rate:
+                return True
+            stats["skipped"] += 1
+            if self.reprobe_every and stats["skipped"] % self.reprobe_every == 0:
+                return True
+            return False
+
+    def record(self, url: str, success: bool) -> None:
+        """Count whether plain HTTP produced a usable page for ``url``'s domain."""
+        with self._lock:
+            stats = self._domain_stats(domain_of(url))
+            stats["http_attempts"] += 1
+            stats["http_successes"] += int(success)
+
+    def fetch(self, url: str) -> FetchResult:
+        profile = self.profiles.get(_matches(domain_of(url), self.profiles) or "", {})
+        started = time.perf_counter()
+        try:
+            with self.session.get(url, headers=profile.get("headers"), timeout=profile.get("timeout", self.timeout_s),
+                                  stream=True, allow_redirects=True) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if "html" not in content_type and "xml" not in content_type:
+                    return FetchResult(url, response.url, response.status_code,
+                                       elapsed_ms=round((time.perf_counter() - started) * 1000),
+                                       error=f"not HTML ({content_type or 'no content type'})")
+                body = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    body.extend(chunk)
+                    if len(body) > self.max_bytes:
+                        break
+                html = bytes(body).decode(_encoding_of(content_type, body), errors="replace")
+                return FetchResult(url, response.url, response.status_code, html,
+                                   round((time.perf_counter() - started) * 1000), len(body))
+        except requests.RequestException as e:
+            return FetchResult(url, elapsed_ms=round((time.perf_counter() - started) * 1000), error=str(e))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            domains = {
+                domain: dict(stats, success_rate=round(stats["http_successes"] / stats["http_attempts"], 3)
+                             if stats["http_attempts"] else None)
+                for domain, stats in self._stats.items()
+            }
+        return {"mode": self.mode, "js_domains": self.js_domains, "domains": domains}
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def get_http_fetcher() -> HttpFetcher:
+    """Process-wide fetcher, so the connection pool and domain statistics are shared across requests."""
+    global _default_fetcher
+    if _default_fetcher is None:
+        with _default_lock:
+            if _default_fetcher is None:
+                _default_fetcher = HttpFetcher()
+    return _default_fetcher
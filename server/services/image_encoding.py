@@ -0,0 +1,126 @@
+import os
+import threading
+from io import BytesIO
+from typing import Union
+
+from PIL import Image, ImageStat
+
+# Encoding applied to screenshot tiles before they are sent to Gemini
+IMAGE_MAX_WIDTH = int(os.getenv("IMAGE_MAX_WIDTH", 1280))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()  # webp | jpeg | png
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+# auto: greyscale when the tile is mostly text; always | never
+IMAGE_GREYSCALE = os.getenv("IMAGE_GREYSCALE", "auto").lower()
+# A tile counts as "mostly text" when its mean saturation (0-255) is below this
+IMAGE_TEXT_SATURATION = float(os.getenv("IMAGE_TEXT_SATURATION", 12))
+
+MIME_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+class EncodedImage:
+    """Bytes ready to send to the vision model, with the sizes needed for reporting."""
+
+    __slots__ = ("data", "mime_type", "width", "height", "greyscale", "original_bytes")
+
+    def __init__(self, data: bytes, mime_type: str, width: int, height: int, greyscale: bool, original_bytes: int):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.greyscale = greyscale
+        self.original_bytes = original_bytes
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def is_mostly_text(image: Image.Image, saturation_threshold: float = IMAGE_TEXT_SATURATION) -> bool:
+    """
+    True when the image carries almost no colour: dark text on a light page.
+    Product photos and colour swatches push the mean saturation up and keep
+    the tile in colour, where the hue matters for materials and variants.
+    """
+    sample = image.convert("RGB")
+    sample.thumbnail((256, 256))
+    saturation = sample.convert("HSV").getchannel("S")
+    return ImageStat.Stat(saturation).mean[0] < saturation_threshold
+
+
+def encode_image(source: Union[bytes, str], max_width: int = IMAGE_MAX_WIDTH, fmt: str = IMAGE_FORMAT,
+                 quality: int = IMAGE_QUALITY, greyscale: str = IMAGE_GREYSCALE) -> EncodedImage:
+    """
+    Downscale ``source`` (PNG bytes or a file path) to at most ``max_width``
+    pixels wide and re-encode it as WebP, JPEG or PNG. If the re-encoded image
+    would be larger than the original PNG, the original is returned as is.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        original = bytes(source)
+    else:
+        with open(source, "rb") as f:
+            original = f.read()
+    fmt = fmt if fmt in MIME_TYPES else "webp"
+
+    image = Image.open(BytesIO(original))
+    image.load()
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.LANCZOS)
+
+    grey = greyscale == "always" or (greyscale == "auto" and is_mostly_text(image))
+    image = image.convert("L" if grey else "RGB")
+
+    buffer = BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    elif fmt == "jpeg":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    data = buffer.getvalue()
+
+    if len(data) >= len(original):
+        with Image.open(BytesIO(original)) as src:
+            return EncodedImage(original, MIME_TYPES["png"], src.width, src.height, False, len(original))
+    return EncodedImage(data, MIME_TYPES[fmt], image.width, image.height, grey, len(original))
+
+
+class EncodingStats:
+    """Running byte totals for the images of one request (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.greyscale = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+
+    def add(self, encoded: EncodedImage) -> None:
+        with self._lock:
+            self.images += 1
+            self.greyscale += int(encoded.greyscale)
+            self.original_bytes += encoded.original_bytes
+            self.sent_bytes += len(encoded.data)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "greyscale": self.greyscale,
+                "original_bytes": self.original_bytes,
+                "sent_bytes": self.sent_bytes,
+                "saved_bytes": self.original_bytes - self.sent_bytes,
+            }
+
+
+def describe(stats: dict) -> str:
+    if not stats.get("original_bytes"):
+        return "no images encoded"
+    saved_pct = 100.0 * stats["saved_bytes"] / stats["original_bytes"]
+    return (f"{stats['images']} images ({stats['greyscale']} greyscale): "
+            f"{stats['original_bytes']:,} -> {stats['sent_bytes']:,} bytes ({saved_pct:.0f}% saved)")
+
+
+def encoding_from_env() -> dict:
+    """Current encoder settings, for logs and benchmark output."""
+    return {"max_width": IMAGE_MAX_WIDTH, "format": IMAGE_FORMAT, "quality": IMAGE_QUALITY, "greyscale": IMAGE_GREYSCALE}
@@ -3,6 +3,13 @@ import os
 import logging
 from typing import Optional
 
+try:
+    from server.services.prompt_cache import get_prompt_cache
+    from server.services.registry import registry
+except ImportError:
+    from services.prompt_cache import get_prompt_cache
+    from services.registry import registry
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -12,27 +19,65 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 
-def call_llm(prompt: str, model: Optional[str] = None, temperature: float = 0.0, max_tokens: int = 512, **kwargs) -> str:
-    if not prompt:
+def _build_google_client():
+    from google import genai
+    # Instantiate client. Some google-genai SDKs accept an api_key argument.
+    return genai.Client(api_key=GOOGLE_API_KEY) if GOOGLE_API_KEY else genai.Client()
+
+
+registry.register("google_llm_client", _build_google_client)
+
+
+def _google_client():
+    client = registry.get("google_llm_client")
+    if client is None:
+        raise ImportError("google-genai SDK not installed. Please add it to requirements.")
+    return client
+
+
+def _with_config(kwargs: dict, extra: dict) -> dict:
+    if not extra:
+        return kwargs
+    kwargs = dict(kwargs)
+    config = kwargs.get("config")
+    if hasattr(config, "model_copy"):  # a types.GenerateContentConfig
+        kwargs["config"] = config.model_copy(update=extra)
+    else:
+        kwargs["config"] = {**(config or {}), **extra}
+    return kwargs
+
+
+def call_llm(prompt: str, model: Optional[str] = None, temperature: float = 0.0, max_tokens: int = 512,
+             cached_prefix: Optional[str] = None, **kwargs) -> str:
+    """
+    Send ``prompt`` to the configured provider. ``cached_prefix`` is a static
+    instruction block that precedes it; with Gemini it is registered as
+    cached content once and referenced by handle, so repeated calls send
+    only ``prompt`` (falling back to the full text when caching is
+    unavailable). Other providers receive ``cached_prefix + prompt``.
+    """
+    if not prompt and not cached_prefix:
         raise ValueError("prompt must not be empty")
 
     provider = LLM_PROVIDER
 
     if provider == "google":
-        try:
-            from google import genai
-        except ImportError as e:
-            raise ImportError("google-genai SDK not installed. Please add it to requirements.") from e
-
-        # Instantiate client. Some google-genai SDKs accept an api_key argument.
-        client = genai.Client(api_key=GOOGLE_API_KEY) if GOOGLE_API_KEY else genai.Client()
+        client = _google_client()
         chosen_model = model or "gemini-2.5-flash"
-        # Call the SDK - adapt to your installed SDK version if needed
-        resp = client.models.generate_content(model=chosen_model, contents=prompt, **kwargs)
+
+        def generate(prefix_text, config):
+            # Call the SDK - adapt to your installed SDK version if needed
+            return client.models.generate_content(model=chosen_model, contents=prefix_text + prompt,
+                                                  **_with_config(kwargs, config))
+
+        resp = get_prompt_cache("llm", _google_client).generate(chosen_model, cached_prefix, generate)
         # Common SDKs expose text on resp.text, but adapt if different
         return getattr(resp, "text", str(resp))
 
-    elif provider == "openai":
+    # Static text first, so the provider's automatic prefix caching can apply
+    prompt = (cached_prefix or "") + prompt
+
+    if provider == "openai":
         try:
             from openai import OpenAI
         except ImportError as e:
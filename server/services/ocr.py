@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+try:
+    import pytesseract
+except ImportError:  # optional; without it the vision path is used
+    pytesseract = None
+
+# Which model reads screenshot tiles: gemini (vision), ocr (Tesseract + text LLM), or
+# auto (OCR when it finds the product details, Gemini otherwise). A request may override it.
+VISION_MODE = os.getenv("VISION_MODE", "auto").lower()
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Page segmentation mode 3 (automatic); 11 ("sparse text") suits scattered labels better on some pages
+OCR_CONFIG = os.getenv("OCR_CONFIG", "--oem 1 --psm 3")
+# Budget for the OCR text handed to the text LLM
+OCR_MAX_TEXT_CHARS = int(os.getenv("OCR_MAX_TEXT_CHARS", 4000))
+# In auto mode, OCR is trusted when it yields a price and at least this many relevant characters
+OCR_MIN_RELEVANT_CHARS = int(os.getenv("OCR_MIN_RELEVANT_CHARS", 300))
+OCR_LLM_MAX_TOKENS = int(os.getenv("OCR_LLM_MAX_TOKENS", 1024))
+
+# Lines worth keeping from a product page, plus a line of context either side
+_RELEVANT = re.compile(
+    r"materials?|fabric|composition|made (?:of|from|in)|weight|dimensions?|\bsize\b|capacity|"
+    r"\bbrand\b|manufacturer|\bmodel\b|colou?r|ship|deliver|returns?|warranty|origin|"
+    r"\b\d[\d.,]*\s*(?:kg|g|lbs?|pounds|oz|ounces|cm|mm|in|inches)\b|[$€£]\s?\d|\bstars?\b|ratings?|reviews?",
+    re.I)
+# The first lines of the first tile hold the title, brand and price
+_HEADER_LINES = 12
+PRICE_RE = re.compile(r"[$€£]\s?\d[\d,]*(?:\.\d{2})?")
+
+OCR_ANALYSIS_PROMPT = """Below is text read by OCR from screenshots of a product page (it may contain recognition errors).
+Produce a structured product analysis with these sections, using bullet points:
+
+**BASIC INFORMATION:** product name, brand, price, rating, availability
+**PRODUCT DETAILS:** materials, dimensions and weight, key features, description, color options
+**REVIEWS & FEEDBACK:** pros, cons and a short review summary if present
+**ADDITIONAL INFORMATION:** shipping (costs, delivery time, shipping-from location), seller, warranty/returns
+
+Only report what the text states; correct obvious OCR errors. Write "not stated" for anything missing.
+"""
+
+
+def ocr_available() -> bool:
+    """pytesseract is installed and can run the tesseract binary."""
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def _ocr_file(path: str, lang: str = OCR_LANG, config: str = OCR_CONFIG) -> str:
+    # Runs in a worker process
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return pytesseract.image_to_string(image.convert("L"), lang=lang, config=config)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _ocr_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a threaded server process is unsafe
+                _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def ocr_images(image_paths: Sequence[str]) -> List[str]:
+    """Tesseract text of each image, in order, computed in the process pool."""
+    return list(_ocr_pool().map(_ocr_file, image_paths))
+
+
+def _line_key(line: str) -> str:
+    return re.sub(r"[^a-z0-9$€£.]", "", line.lower())
+
+
+def clean_lines(texts: Sequence[str]) -> List[str]:
+    """
+    OCR output of all tiles as one list of lines: whitespace collapsed,
+    recognition noise (short or mostly non-alphanumeric lines) dropped, and
+    lines repeated by overlapping tiles or sticky headers kept once.
+    """
+    lines, seen = [], set()
+    for text in texts:
+        for raw in (text or "").splitlines():
+            line = re.sub(r"\s+", " ", raw).strip()
+            if len(line) < 3:
+                continue
+            alnum = sum(ch.isalnum() for ch in line)
+            if alnum < 3 or alnum / len(line) < 0.5:
+                continue
+            key = _line_key(line)
+            if key in seen:
+                continue
+            seen.add(key)
+            lines.append(line)
+    return lines
+
+
+def relevant_text(lines: Sequence[str], max_chars: int = OCR_MAX_TEXT_CHARS) -> str:
+    """The header lines plus the product-detail lines (with one line of context), within ``max_chars``."""
+    keep = set(range(min(_HEADER_LINES, len(lines))))
+    for index, line in enumerate(lines):
+        if _RELEVANT.search(line):
+            keep.update(i for i in (index - 1, index, index + 1) if 0 <= i < len(lines))
+    out, used = [], 0
+    for index in sorted(keep):
+        if used + len(lines[index]) + 1 > max_chars:
+            break
+        out.append(lines[index])
+        used += len(lines[index]) + 1
+    return "\n".join(out)
+
+
+def analyze_with_ocr(image_paths: Sequence[str], product_name: Optional[str] = None,
+                     llm: Optional[Callable[..., str]] = None,
+                     ocr: Optional[Callable[[Sequence[str]], List[str]]] = None,
+                     require_sufficient: bool = False) -> dict:
+    """
+    OCR the screenshot tiles and have the text LLM structure the relevant
+    lines; returns the same shape as ``analyze_product_images``, plus
+    ``sufficient`` (a price and enough relevant text were found).
+
+    With ``require_sufficient`` (auto mode, where an insufficient result is
+    replaced by vision analysis anyway) the LLM is not called unless the OCR
+    text is sufficient.
+    """
+    if not image_paths:
+        return {"success": False, "error": "No image paths provided"}
+    started = time.perf_counter()
+    try:
+        texts = (ocr or ocr_images)(image_paths)
+    except Exception as e:
+        return {"success": False, "error": f"OCR failed: {e}"}
+    ocr_ms = round((time.perf_counter() - started) * 1000)
+
+    lines = clean_lines(texts)
+    text = relevant_text(lines)
+    sufficient = bool(PRICE_RE.search(text)) and len(text) >= OCR_MIN_RELEVANT_CHARS
+    result = {
+        "success": bool(text),
+        "source": "ocr",
+        "images_analyzed": len(image_paths),
+        "ocr_ms": ocr_ms,
+        "ocr_chars": sum(len(t or "") for t in texts),
+        "relevant_chars": len(text),
+        "sufficient": sufficient,
+    }
+    if not text:
+        result["error"] = "OCR found no text"
+        return result
+    if require_sufficient and not sufficient:
+        result.update(success=False, error="OCR text lacks the product details")
+        return result
+
+    prompt = OCR_ANALYSIS_PROMPT
+    if product_name:
+        prompt += f"\nThe product being searched for is: {product_name}\n"
+    prompt += "\n**OCR TEXT:**\n" + text
+
+    if llm is None:
+        try:
+            from server.services.llm import call_llm as llm
+        except ImportError:
+            from services.llm import call_llm as llm
+    try:
+        result["analysis"] = llm(prompt, max_tokens=OCR_LLM_MAX_TOKENS)
+        result.update(source="ocr+llm", input_chars=len(prompt))
+    except Exception as e:
+        print(f"  Text analysis of OCR output failed ({e}), using the OCR text as is")
+        result.update(analysis=text, input_chars=0, llm_error=str(e))
+    return result
@@ -0,0 +1,149 @@
+import os
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+# One budget for navigating to a page and waiting for it to be ready
+NAV_BUDGET_MS = int(os.getenv("NAV_BUDGET_MS", 30000))
+# How long to wait for the platform's title and price before falling back to DOM stability
+READY_SELECTOR_TIMEOUT_MS = int(os.getenv("READY_SELECTOR_TIMEOUT_MS", 10000))
+# The DOM counts as stable after this long without mutations...
+READY_QUIET_MS = int(os.getenv("READY_QUIET_MS", 500))
+# ...and the stability wait gives up after this long
+READY_STABLE_MAX_MS = int(os.getenv("READY_STABLE_MAX_MS", 5000))
+# Extra wait for images before screenshots, after the page is ready
+READY_LOAD_TIMEOUT_MS = int(os.getenv("READY_LOAD_TIMEOUT_MS", 5000))
+
+# Title and price selectors per platform, as read by the extension (extension/content.js);
+# the domains match detectPlatform() in extension/platforms.js
+PLATFORM_SELECTORS: Dict[str, Dict[str, object]] = {
+    "amazon.com": {
+        "platform": "Amazon",
+        "title": ["#productTitle", "h1.a-size-large"],
+        "price": [".a-price-whole", "#priceblock_ourprice"],
+    },
+    "walmart.com": {
+        "platform": "Walmart",
+        "title": ['h1[itemprop="name"]', "h1.prod-ProductTitle"],
+        "price": ['[itemprop="price"]', ".price-current"],
+    },
+    "etsy.com": {
+        "platform": "Etsy",
+        "title": ["h1[data-buy-box-listing-title]", "h1.listing-page-title"],
+        "price": [".currency-value"],
+    },
+    "bestbuy.com": {
+        "platform": "Best Buy",
+        "title": [".sku-title h1", '[data-testid="product-title"]'],
+        "price": [".priceView-customer-price span"],
+    },
+    "target.com": {
+        "platform": "Target",
+        "title": ['h1[data-test="product-title"]', "h1.styles__ProductTitle"],
+        "price": ['[data-test="product-price"]'],
+    },
+    "ebay.com": {
+        "platform": "eBay",
+        "title": ["#x-item-title-label", "h1.it-ttl", "h1.x-item-title__mainTitle"],
+        "price": ["#prcIsum", ".x-price-primary"],
+    },
+}
+
+# True once one title selector and one price selector hold text
+SELECTORS_READY_JS = """
+({title, price}) => {
+    const rendered = (selectors) => selectors.some((selector) => {
+        const el = document.querySelector(selector);
+        return el !== null && el.textContent.trim().length > 0;
+    });
+    return rendered(title) && rendered(price);
+}
+"""
+
+# Resolves once the DOM has not changed for quietMs, or after maxMs
+DOM_STABLE_JS = """
+({quietMs, maxMs}) => new Promise((resolve) => {
+    const started = performance.now();
+    let quiet = null;
+    let cap = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(quiet);
+        quiet = setTimeout(() => done(true), quietMs);
+    });
+    const done = (stable) => {
+        observer.disconnect();
+        clearTimeout(quiet);
+        clearTimeout(cap);
+        resolve({stable, waited_ms: Math.round(performance.now() - started)});
+    };
+    observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+    quiet = setTimeout(() => done(true), quietMs);
+    cap = setTimeout(() => done(false), maxMs);
+})
+"""
+
+
+def platform_for(url: str) -> Optional[Dict[str, object]]:
+    host = (urlparse(url).hostname or "").lower()
+    for domain, spec in PLATFORM_SELECTORS.items():
+        if host == domain or host.endswith("." + domain):
+            return spec
+    return None
+
+
+def wait_until_ready(page, url: str, budget_ms: int = NAV_BUDGET_MS,
+                     selector_timeout_ms: int = READY_SELECTOR_TIMEOUT_MS, quiet_ms: int = READY_QUIET_MS,
+                     stable_max_ms: int = READY_STABLE_MAX_MS,
+                     on_navigated: Optional[Callable[[], None]] = None) -> dict:
+    """
+    Navigate ``page`` to ``url`` and return as soon as it is ready to read:
+    when the platform's title and price have rendered, or (for other sites,
+    or if they never appear) when the DOM stops changing. Everything shares
+    one ``budget_ms``. A navigation that times out after the document has
+    started loading is not fatal; the page is read as far as it got.
+
+    Returns ``{"platform", "strategy", "navigation_ms", "ready_ms"}`` where
+    strategy is "selectors", "dom_stable" or "budget".
+    """
+    started = time.monotonic()
+    deadline = started + budget_ms / 1000.0
+
+    def remaining_ms() -> int:
+        return max(0, int((deadline - time.monotonic()) * 1000))
+
+    def elapsed_ms() -> int:
+        return round((time.monotonic() - started) * 1000)
+
+    spec = platform_for(url)
+    result = {"platform": spec["platform"] if spec else None, "strategy": "budget"}
+
+    previous_url = page.url
+    try:
+        page.goto(url, wait_until="domcontentloaded", timeout=max(1, remaining_ms()))
+    except Exception as e:
+        # Slow subresources can hold back domcontentloaded; carry on if the document itself arrived
+        if not page.url or page.url in ("about:blank", previous_url):
+            raise
+        print(f"  Navigation did not finish within the budget ({e.__class__.__name__}), reading the page as loaded")
+    result["navigation_ms"] = elapsed_ms()
+    if on_navigated:
+        on_navigated()
+
+    if spec and remaining_ms() > 0:
+        try:
+            page.wait_for_function(SELECTORS_READY_JS, arg={"title": spec["title"], "price": spec["price"]},
+                                   timeout=max(1, min(selector_timeout_ms, remaining_ms())))
+            result["strategy"] = "selectors"
+        except Exception:
+            print(f"  {spec['platform']} title/price did not render, waiting for the page to settle instead")
+
+    if result["strategy"] != "selectors" and remaining_ms() > 0:
+        try:
+            stable = page.evaluate(DOM_STABLE_JS, {"quietMs": quiet_ms, "maxMs": min(stable_max_ms, remaining_ms())})
+            if stable and stable.get("stable"):
+                result["strategy"] = "dom_stable"
+        except Exception as e:
+            print(f"  DOM stability check failed: {e}")
+
+    result["ready_ms"] = elapsed_ms()
+    return result
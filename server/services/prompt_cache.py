@@ -0,0 +1,310 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# gemini: register static prompt prefixes as Gemini cached content; local: an in-process
+# stand-in with the same lifecycle (tests, development); off: always send the full prompt.
+# Off by default: today's prefixes (~1.7-2.6k chars) are below Gemini's minimum cacheable size
+PROMPT_CACHE_BACKEND = os.getenv("PROMPT_CACHE_BACKEND", "off").lower()
+PROMPT_CACHE_TTL_S = float(os.getenv("PROMPT_CACHE_TTL_S", 3600))
+# Extend a cached prefix's TTL once it is this close to expiring
+PROMPT_CACHE_REFRESH_MARGIN_S = float(os.getenv("PROMPT_CACHE_REFRESH_MARGIN_S", 300))
+# Prefixes shorter than this are sent inline without asking the provider. Gemini will not cache
+# fewer than 1024 tokens (more on some models), about 4096 characters of English text
+PROMPT_CACHE_MIN_CHARS = int(os.getenv("PROMPT_CACHE_MIN_CHARS", 4096))
+# After the provider refuses a prefix (too short for the model, caching unsupported), send it
+# inline for this long before trying to register it again
+PROMPT_CACHE_RETRY_AFTER_S = float(os.getenv("PROMPT_CACHE_RETRY_AFTER_S", 3600))
+
+
+def prefix_key(model: str, prefix: str) -> str:
+    return hashlib.sha256(model.encode("utf-8") + b"\0" + prefix.encode("utf-8")).hexdigest()
+
+
+def _expiry_of(cached, ttl_s: float) -> float:
+    expires = getattr(cached, "expire_time", None)
+    if isinstance(expires, datetime):
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        return expires.timestamp()
+    return time.time() + ttl_s
+
+
+def is_missing_cache_error(error: Exception) -> bool:
+    """Whether a request failed because its cached content is gone (deleted, expired, unknown name)."""
+    code = getattr(error, "code", None)
+    status = str(getattr(error, "status", "") or "").upper()
+    if code == 404 or status == "NOT_FOUND":
+        return True
+    if code == 400 or status == "INVALID_ARGUMENT":
+        text = str(error).lower()
+        return "cached content" in text or "cachedcontent" in text or "cached_content" in text
+    return False
+
+
+class GeminiCacheBackend:
+    """Static prefixes as Gemini cached content (``client.caches``), referenced by name."""
+
+    name = "gemini"
+
+    def __init__(self, get_client: Callable[[], object]):
+        self.get_client = get_client
+
+    def create(self, model: str, prefix: str, ttl_s: float) -> Tuple[str, float]:
+        cached = self.get_client().caches.create(model=model, config={
+            "system_instruction": prefix,
+            "ttl": f"{int(ttl_s)}s",
+            "display_name": f"prefix-{prefix_key(model, prefix)[:16]}",
+        })
+        return cached.name, _expiry_of(cached, ttl_s)
+
+    def refresh(self, handle: str, ttl_s: float) -> float:
+        cached = self.get_client().caches.update(name=handle, config={"ttl": f"{int(ttl_s)}s"})
+        return _expiry_of(cached, ttl_s)
+
+    def delete(self, handle: str) -> None:
+        self.get_client().caches.delete(name=handle)
+
+    def request(self, handle: str, prefix: str) -> Tuple[str, dict]:
+        # The model reads the prefix from the cache; only the dynamic part is sent
+        return "", {"cached_content": handle}
+
+    @staticmethod
+    def is_missing(error: Exception) -> bool:
+        return is_missing_cache_error(error)
+
+
+class LocalCacheBackend:
+    """
+    In-process stand-in for provider-side caching: handles are registered,
+    expire and are refreshed like Gemini's, and a request re-inserts the
+    registered text, so the model sees the same prompt either way.
+    """
+
+    name = "local"
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}  # handle -> {"model", "prefix", "expires_at"}
+        self.calls = {"create": 0, "refresh": 0, "delete": 0}
+
+    def create(self, model: str, prefix: str, ttl_s: float) -> Tuple[str, float]:
+        with self._lock:
+            self.calls["create"] += 1
+            handle = f"cachedContents/local-{self.calls['create']}"
+            expires_at = self.clock() + ttl_s
+            self._entries[handle] = {"model": model, "prefix": prefix, "expires_at": expires_at}
+        return handle, expires_at
+
+    def refresh(self, handle: str, ttl_s: float) -> float:
+        with self._lock:
+            self.calls["refresh"] += 1
+            entry = self._live(handle)
+            entry["expires_at"] = self.clock() + ttl_s
+            return entry["expires_at"]
+
+    def delete(self, handle: str) -> None:
+        with self._lock:
+            self.calls["delete"] += 1
+            self._entries.pop(handle, None)
+
+    def request(self, handle: str, prefix: str) -> Tuple[str, dict]:
+        with self._lock:
+            return self._live(handle)["prefix"], {}
+
+    @staticmethod
+    def is_missing(error: Exception) -> bool:
+        return isinstance(error, KeyError) or is_missing_cache_error(error)
+
+    def _live(self, handle: str) -> dict:
+        # Caller holds self._lock
+        entry = self._entries.get(handle)
+        if entry is None or entry["expires_at"] <= self.clock():
+            self._entries.pop(handle, None)
+            raise KeyError(f"{handle} not found or expired")
+        return entry
+
+
+class PromptCache:
+    """
+    Registers the static instruction prefix of a prompt with the provider
+    once per model and refers to it by handle afterwards, so each call sends
+    only its dynamic part. Handles are refreshed shortly before they expire;
+    concurrent first calls for a prefix wait for a single registration.
+
+    Cache failures degrade to the uncached request: a prefix the provider
+    refuses is sent inline (and not offered again for ``retry_after_s``),
+    and a request that fails because its cached content is missing or
+    expired is retried once with the full prompt after the handle is
+    dropped. Any other error (rate limits, timeouts, bad requests) is
+    raised as is, so it is not doubled.
+    """
+
+    def __init__(self, backend=None, ttl_s: float = PROMPT_CACHE_TTL_S,
+                 refresh_margin_s: float = PROMPT_CACHE_REFRESH_MARGIN_S, min_chars: int = PROMPT_CACHE_MIN_CHARS,
+                 retry_after_s: float = PROMPT_CACHE_RETRY_AFTER_S, clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.refresh_margin_s = refresh_margin_s
+        self.min_chars = min_chars
+        self.retry_after_s = retry_after_s
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, list] = {}  # key -> [handle, expires_at]
+        self._refused: Dict[str, float] = {}  # key -> retry at
+        self._inflight: Dict[str, threading.Event] = {}
+        self._metrics = {"hits": 0, "created": 0, "refreshed": 0, "create_errors": 0, "inline": 0,
+                         "fallbacks": 0, "chars_saved": 0}
+
+    def handle(self, model: str, prefix: str) -> Optional[str]:
+        """A live handle for ``prefix`` on ``model``, registering or refreshing it as needed; None to send it inline."""
+        if self.backend is None or not prefix or len(prefix) < self.min_chars:
+            return None
+        key = prefix_key(model, prefix)
+        while True:
+            with self._lock:
+                now = self.clock()
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is not None and entry[1] - self.refresh_margin_s > now:
+                    return entry[0]
+                if entry is None and self._refused.get(key, 0) > now:
+                    return None
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    done = threading.Event()
+                    self._inflight[key] = done
+                    break
+            # Another thread is registering or refreshing this prefix
+            waiter.wait()
+
+        try:
+            if entry is not None:
+                try:
+                    expires_at = self.backend.refresh(entry[0], self.ttl_s)
+                    with self._lock:
+                        entry[1] = expires_at
+                        self._metrics["refreshed"] += 1
+                    return entry[0]
+                except Exception as e:
+                    logger.info("Refreshing cached prefix %s failed (%s), registering it again", entry[0], e)
+                    with self._lock:
+                        self._entries.pop(key, None)
+                    self._delete(entry[0])
+            try:
+                handle, expires_at = self.backend.create(model, prefix, self.ttl_s)
+            except Exception as e:
+                logger.warning("Could not cache a %d-char prompt prefix for %s: %s", len(prefix), model, e)
+                with self._lock:
+                    self._metrics["create_errors"] += 1
+                    self._refused[key] = self.clock() + self.retry_after_s
+                return None
+            with self._lock:
+                self._entries[key] = [handle, expires_at]
+                self._refused.pop(key, None)
+                self._metrics["created"] += 1
+            return handle
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def invalidate(self, model: str, prefix: str) -> None:
+        """Forget the handle for ``prefix`` and delete its cached content from the provider."""
+        with self._lock:
+            entry = self._entries.pop(prefix_key(model, prefix), None)
+        if entry is not None:
+            self._delete(entry[0])
+
+    def _delete(self, handle: str) -> None:
+        delete = getattr(self.backend, "delete", None)
+        if delete is None:
+            return
+        try:
+            delete(handle)
+        except Exception as e:
+            # Usually already gone; otherwise it is removed when its TTL runs out
+            logger.info("Could not delete cached prefix %s: %s", handle, e)
+
+    def _is_missing(self, error: Exception) -> bool:
+        is_missing = getattr(self.backend, "is_missing", is_missing_cache_error)
+        return is_missing(error)
+
+    def generate(self, model: str, prefix: Optional[str], call: Callable[[str, dict], object]):
+        """
+        Run ``call(prefix_text, config)`` for a prompt whose static part is
+        ``prefix``. With a live handle, ``prefix_text`` is what still has to
+        be sent before the dynamic part ("" for provider caches) and
+        ``config`` carries the handle; otherwise it is the prefix itself and
+        ``config`` is empty.
+        """
+        prefix = prefix or ""
+        handle = self.handle(model, prefix)
+        if handle is not None:
+            try:
+                prefix_text, config = self.backend.request(handle, prefix)
+                response = call(prefix_text, config)
+            except Exception as e:
+                if not self._is_missing(e):
+                    raise
+                # The handle was deleted or expired server-side
+                logger.info("Cached prefix %s is gone (%s), sending the full prompt", handle, e)
+                self.invalidate(model, prefix)
+                with self._lock:
+                    self._metrics["fallbacks"] += 1
+            else:
+                with self._lock:
+                    self._metrics["hits"] += 1
+                    self._metrics["chars_saved"] += len(prefix) - len(prefix_text)
+                return response
+        elif prefix:
+            with self._lock:
+                self._metrics["inline"] += 1
+        return call(prefix, {})
+
+    def metrics(self) -> dict:
+        with self._lock:
+            out = dict(self._metrics)
+            out["entries"] = len(self._entries)
+            out["backend"] = getattr(self.backend, "name", None)
+        return out
+
+
+_caches: Dict[str, PromptCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_prompt_cache(name: str, get_client: Callable[[], object], backend: str = PROMPT_CACHE_BACKEND) -> PromptCache:
+    """
+    Process-wide cache per client (cached content belongs to the API key that
+    created it), e.g. one for ``call_llm`` and one for image analysis.
+    """
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                if backend == "gemini":
+                    cache = PromptCache(GeminiCacheBackend(get_client))
+                elif backend == "local":
+                    cache = PromptCache(LocalCacheBackend())
+                else:
+                    cache = PromptCache(None)
+                _caches[name] = cache
+    return cache
+
+
+def all_metrics() -> Dict[str, dict]:
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.metrics() for name, cache in caches.items()}
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class Registry:
+    """
+    Named, lazily built components (agent modules, SDK clients, database
+    clients). A factory runs on the first get() of its name and the result is
+    kept for the life of the process; concurrent first calls build it once.
+
+    A factory that raises ImportError (an optional dependency that is not
+    installed) yields None, so callers can keep their ``if x is None`` checks.
+    Other errors propagate and the factory is retried on the next get().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._values: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._load_ms: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._values.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        value = self._values.get(name, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            factory = self._factories[name]
+            name_lock = self._locks[name]
+        with name_lock:
+            value = self._values.get(name, _MISSING)
+            if value is not _MISSING:
+                return value
+            started = time.perf_counter()
+            try:
+                value = factory()
+            except ImportError as e:
+                logger.warning("%s is unavailable: %s", name, e)
+                value = None
+            self._load_ms[name] = (time.perf_counter() - started) * 1000.0
+            self._values[name] = value
+            return value
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def warm_up(self, names: Optional[Iterable[str]] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Build the given (default: all) components now, in a daemon thread unless
+        ``background`` is False. Without explicit names, components registered
+        while warming up (e.g. by a module the warm-up imported) are built too.
+        """
+        explicit = list(names) if names is not None else None
+
+        def run():
+            attempted = set()
+            while True:
+                with self._lock:
+                    pending = [n for n in (explicit if explicit is not None else self._factories) if n not in attempted]
+                if not pending:
+                    return
+                for name in pending:
+                    attempted.add(name)
+                    try:
+                        self.get(name)
+                    except Exception:
+                        logger.exception("warm-up of %s failed", name)
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="registry-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        with self._lock:
+            names = list(self._factories)
+        return {
+            name: {"loaded": name in self._values, "load_ms": self._load_ms.get(name)}
+            for name in names
+        }
+
+
+# Shared by the app, the routes and the agents
+registry = Registry()
@@ -0,0 +1,166 @@
+import os
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+# Route interception for page captures: what the browser is allowed to download
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES", "true").lower() == "true"
+# Playwright resource types aborted on every host
+BLOCK_RESOURCE_TYPES = [t.strip() for t in os.getenv("BLOCK_RESOURCE_TYPES", "media,font").split(",") if t.strip()]
+BLOCK_THIRD_PARTY_SCRIPTS = os.getenv("BLOCK_THIRD_PARTY_SCRIPTS", "true").lower() == "true"
+# Ad, analytics and tracking hosts (and their subdomains), aborted whatever the resource type
+BLOCK_DOMAINS = [d.strip().lower() for d in os.getenv("BLOCK_DOMAINS", ",".join([
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "googletagmanager.com",
+    "googletagservices.com", "google-analytics.com", "amazon-adsystem.com", "adsrvr.org", "criteo.com",
+    "criteo.net", "taboola.com", "outbrain.com", "scorecardresearch.com", "facebook.net", "connect.facebook.net",
+    "hotjar.com", "bat.bing.com", "ct.pinterest.com", "analytics.tiktok.com", "nr-data.net", "segment.io",
+    "quantserve.com", "adnxs.com", "rubiconproject.com", "pubmatic.com", "mathtag.com",
+])).split(",") if d.strip()]
+
+# Hosts a retailer serves its own assets from; their scripts are not third-party on that retailer's pages.
+# Format of RESOURCE_ALLOW_DOMAINS: "site:host|host,site:host", added to the defaults below.
+DEFAULT_ALLOW_DOMAINS: Dict[str, List[str]] = {
+    "amazon.com": ["media-amazon.com", "ssl-images-amazon.com", "images-amazon.com"],
+    "walmart.com": ["walmartimages.com", "wal.co"],
+    "target.com": ["scene7.com", "targetimg1.com"],
+    "bestbuy.com": ["bbystatic.com", "bbycastatic.ca"],
+    "etsy.com": ["etsystatic.com"],
+    "ebay.com": ["ebayimg.com", "ebaystatic.com", "ebayrtm.com"],
+}
+
+
+def _parse_allow_domains(value: str) -> Dict[str, List[str]]:
+    allow = {site: list(hosts) for site, hosts in DEFAULT_ALLOW_DOMAINS.items()}
+    for entry in value.split(","):
+        site, _, hosts = entry.partition(":")
+        site = site.strip().lower()
+        if site and hosts:
+            allow.setdefault(site, []).extend(h.strip().lower() for h in hosts.split("|") if h.strip())
+    return allow
+
+
+RESOURCE_ALLOW_DOMAINS = _parse_allow_domains(os.getenv("RESOURCE_ALLOW_DOMAINS", ""))
+
+# Second-level labels under which registrations happen one level deeper (example.co.uk)
+_SECOND_LEVEL = {"co", "com", "org", "net", "ac", "gov", "edu"}
+
+
+def site_of(host: str) -> str:
+    """Registrable part of a host name: www.shop.example.co.uk -> example.co.uk."""
+    labels = (host or "").lower().rstrip(".").split(".")
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _host_in(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class ResourcePolicy:
+    """
+    Decides which sub-resources of a captured page the browser may fetch:
+    nothing from ad and analytics hosts, no resources of the blocked types
+    (videos and fonts by default), and no scripts from other sites than the
+    page's own and the hosts allow-listed for it. Images and styles load, so
+    screenshots still show the product.
+    """
+
+    def __init__(self, enabled: bool = BLOCK_RESOURCES, block_types=None,
+                 block_third_party_scripts: bool = BLOCK_THIRD_PARTY_SCRIPTS, block_domains=None,
+                 allow_domains: Optional[Dict[str, List[str]]] = None):
+        self.enabled = enabled
+        self.block_types = set(BLOCK_RESOURCE_TYPES if block_types is None else block_types)
+        self.block_third_party_scripts = block_third_party_scripts
+        self.block_domains = list(BLOCK_DOMAINS if block_domains is None else block_domains)
+        self.allow_domains = RESOURCE_ALLOW_DOMAINS if allow_domains is None else allow_domains
+
+    def decide(self, url: str, resource_type: str, page_url: Optional[str]) -> Optional[str]:
+        """The reason to abort the request, or None to let it through."""
+        if not self.enabled or resource_type == "document":
+            return None
+        host = (urlparse(url).hostname or "").lower()
+        if not host:
+            return None
+        if _host_in(host, self.block_domains):
+            return "blocked_domain"
+
+        if resource_type in self.block_types:
+            return resource_type
+        if resource_type == "script" and self.block_third_party_scripts:
+            page_site = site_of(urlparse(page_url).hostname or "") if page_url else ""
+            if site_of(host) != page_site and not _host_in(host, self.allow_domains.get(page_site, ())):
+                return "third_party_script"
+        return None
+
+    def host_resolver_rules(self) -> str:
+        """Chromium switch that makes the blocked domains unresolvable, for contexts without routing."""
+        rules = []
+        for domain in self.block_domains:
+            rules.extend([f"MAP {domain} ~NOTFOUND", f"MAP *.{domain} ~NOTFOUND"])
+        return "--host-resolver-rules=" + ", ".join(rules)
+
+
+class CaptureMonitor:
+    """
+    Applies a ResourcePolicy to a Playwright context and measures one capture
+    at a time: requests made and aborted, response bytes (from Content-Length,
+    so chunked responses are counted as requests but not bytes) and
+    navigation time.
+    """
+
+    def __init__(self, policy: ResourcePolicy):
+        self.policy = policy
+        self.page_url = None
+        self.reset()
+
+    def attach(self, context, page, intercept: bool = True) -> None:
+        # Routing turns off Chromium's HTTP cache, so callers relying on the disk cache pass intercept=False
+        if self.policy.enabled and intercept:
+            context.route("**/*", self.handle_route)
+        page.on("request", self.on_request)
+        page.on("response", self.on_response)
+
+    def reset(self, page_url: Optional[str] = None) -> None:
+        self.page_url = page_url
+        self.started = time.perf_counter()
+        self.navigation_ms = None
+        self.requests = 0
+        self.blocked: Dict[str, int] = {}
+        self.bytes = 0
+
+    def handle_route(self, route) -> None:
+        request = route.request
+        reason = self.policy.decide(request.url, request.resource_type, self.page_url)
+        if reason:
+            self.blocked[reason] = self.blocked.get(reason, 0) + 1
+            route.abort("blockedbyclient")
+        else:
+            route.continue_()
+
+    def on_request(self, request) -> None:
+        self.requests += 1
+
+    def on_response(self, response) -> None:
+        try:
+            self.bytes += int(response.headers.get("content-length") or 0)
+        except ValueError:
+            pass
+
+    def navigated(self) -> None:
+        self.navigation_ms = round((time.perf_counter() - self.started) * 1000)
+
+    def summary(self) -> dict:
+        return {
+            "navigation_ms": self.navigation_ms,
+            "capture_ms": round((time.perf_counter() - self.started) * 1000),
+            "requests": self.requests,
+            "blocked": sum(self.blocked.values()),
+            "blocked_by_reason": dict(self.blocked),
+            "bytes": self.bytes,
+        }
+
+
+def describe(summary: dict) -> str:
+    return (f"navigation {summary['navigation_ms']} ms, {summary['requests']} requests "
+            f"({summary['blocked']} blocked), {summary['bytes']:,} bytes received")
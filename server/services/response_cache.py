@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class CachedBody:
+    """A response body serialized once, with its gzip variant and ETag precomputed."""
+
+    __slots__ = ("body", "gzip_body", "etag")
+
+    def __init__(self, body: bytes, gzip_body: Optional[bytes], etag: str):
+        self.body = body
+        self.gzip_body = gzip_body
+        self.etag = etag
+
+    @property
+    def gzip_etag(self) -> str:
+        """Strong ETag of the gzip variant; it differs byte-for-byte from the identity body."""
+        return self.etag + "-gz"
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + (len(self.gzip_body) if self.gzip_body else 0)
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU of ready-to-send response bodies, bounded by total bytes.
+
+    Bodies larger than ``gzip_min_bytes`` are gzipped once when stored (and
+    only kept compressed if that actually saves space). The ETag is a hash of
+    the body, so every worker process computes the same tag for the same
+    output. Entries larger than ``max_entry_bytes`` are not cached.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entry_bytes: int = 1024 * 1024,
+                 gzip_min_bytes: int = 1024, gzip_level: int = 6):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.gzip_min_bytes = gzip_min_bytes
+        self.gzip_level = gzip_level
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def etag_for(body: bytes) -> str:
+        return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+    def build(self, body: bytes) -> CachedBody:
+        body = bytes(body)
+        gzip_body = None
+        if len(body) >= self.gzip_min_bytes:
+            compressed = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+            if len(compressed) < len(body):
+                gzip_body = compressed
+        return CachedBody(body, gzip_body, self.etag_for(body))
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics["hits"] += 1
+            return entry
+
+    def put(self, key: str, body: bytes) -> CachedBody:
+        """Store ``body`` under ``key`` (replacing any previous entry) and return the cached entry."""
+        entry = self.build(body)
+        with self._lock:
+            self._discard(key)
+            if entry.size > self.max_entry_bytes:
+                return entry
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._metrics["evictions"] += 1
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, key: str) -> None:
+        # Caller holds self._lock
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+
+    def metrics(self) -> dict:
+        with self._lock:
+            out = dict(self._metrics)
+            out.update({"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes})
+        return out
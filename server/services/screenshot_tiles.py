@@ -0,0 +1,77 @@
+import os
+from io import BytesIO
+from typing import Optional
+from urllib.parse import urlparse
+
+from PIL import Image
+
+try:
+    from server.services.artifact_store import get_artifact_store
+    from server.services.tiling import TILE_OVERLAP, plan_tiles
+except ImportError:
+    from services.artifact_store import get_artifact_store
+    from services.tiling import TILE_OVERLAP, plan_tiles
+
+
+def split_and_store(screenshot_bytes: bytes, store, tile_filter, product: Optional[str], url: str) -> dict:
+    """
+    Cut a page screenshot into tiles, drop the tiles the filter rejects and
+    put the rest in the artifact store. Tiles are returned as references
+    (artifact key, path, size, dimensions), never as image data, so search
+    results stay small however long the caller keeps them; use
+    load_screenshot() to read a tile back.
+    """
+    with Image.open(BytesIO(screenshot_bytes)) as image:
+        image.load()
+        width, height = image.size
+        tiles = plan_tiles(height, width)
+
+        print(f"  Dividing image into {len(tiles)} tiles...")
+        print(f"    Image size: {width}x{height} pixels")
+        print(f"    Tile height: {tiles[0][1] - tiles[0][0]} pixels, overlap {TILE_OVERLAP}px")
+
+        part_images = []
+        for top, bottom in tiles:
+            part_image = image.crop((0, top, width, bottom))
+            buffer = BytesIO()
+            part_image.save(buffer, format="PNG")
+            part_images.append((part_image, buffer.getvalue()))
+
+    # Skip blank tiles and tiles repeating this page or other recent pages of the same site
+    decisions = tile_filter.filter(
+        [(part_image, len(part_bytes)) for part_image, part_bytes in part_images],
+        domain=urlparse(url).netloc.lower() or None,
+        url=url,
+    )
+    screenshots, skipped_tiles = [], []
+
+    for part_num, ((top, bottom), (part_image, part_bytes), (keep, reason)) in enumerate(zip(tiles, part_images, decisions)):
+        if not keep:
+            skipped_tiles.append({"screenshot_number": part_num + 1, "reason": reason,
+                                  "screenshot_size_bytes": len(part_bytes)})
+            print(f"    Part {part_num + 1} skipped ({reason}, {len(part_bytes)} bytes)")
+            continue
+
+        part_ref = store.put_bytes(part_bytes, "screenshot_part", product=product, url=url, ext=".png")
+        filename_part = os.path.basename(part_ref["path"])
+        screenshots.append({
+            "screenshot_number": part_num + 1,
+            "scroll_position": f"part_{part_num + 1}_of_{len(tiles)}",
+            "artifact_key": part_ref["key"],
+            "filepath": part_ref["path"],
+            "filename": filename_part,
+            "screenshot_size_bytes": len(part_bytes),
+            "width": width,
+            "height": bottom - top,
+            "mime_type": "image/png",
+            "crop_coordinates": {"top": top, "bottom": bottom, "left": 0, "right": width}
+        })
+        print(f"    Part {part_num + 1} stored: {filename_part} ({len(part_bytes)} bytes"
+              f"{', already stored' if part_ref['deduped'] else ''})")
+
+    return {"screenshots": screenshots, "skipped_tiles": skipped_tiles, "tile_count": len(tiles)}
+
+
+def load_screenshot(ref: dict, store=None) -> Optional[bytes]:
+    """Image bytes of a tile reference from split_and_store(), or None if it was evicted."""
+    return (store or get_artifact_store()).get_bytes(ref["artifact_key"])
@@ -0,0 +1,463 @@
+import json
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Optional
+
+from bs4 import BeautifulSoup, Tag
+
+# auto: read the DOM and fall back to screenshots when it yields too little;
+# structured: never take screenshots; vision: always take screenshots
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "auto").lower()
+# Character budget for the main text handed to the text LLM
+EXTRACT_MAX_TEXT_CHARS = int(os.getenv("EXTRACT_MAX_TEXT_CHARS", 4000))
+# Without complete fields, at least this much main text is needed to skip screenshots
+EXTRACT_MIN_TEXT_CHARS = int(os.getenv("EXTRACT_MIN_TEXT_CHARS", 400))
+EXTRACT_LLM_MAX_TOKENS = int(os.getenv("EXTRACT_LLM_MAX_TOKENS", 1024))
+
+# Fields the carbon pipeline needs; with all of them the text LLM is skipped
+REQUIRED_FIELDS = ("name", "price", "materials")
+SIZE_FIELDS = ("weight", "dimensions")
+
+FIELD_LABELS = [
+    ("name", "Product Name"),
+    ("brand", "Brand"),
+    ("price", "Price"),
+    ("availability", "Availability"),
+    ("rating", "Rating"),
+    ("materials", "Materials"),
+    ("weight", "Weight"),
+    ("dimensions", "Dimensions"),
+    ("color", "Color"),
+    ("origin", "Country of Origin"),
+    ("shipping", "Shipping"),
+    ("seller", "Seller"),
+    ("sku", "SKU/GTIN"),
+    ("description", "Description"),
+]
+
+# Removed before looking for the main text
+_NOISE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "nav", "header", "footer", "aside", "form"]
+_NOISE_ATTR = re.compile(
+    r"(^|[\s_-])(nav|menu|footer|header|sidebar|banner|cookie|consent|modal|popup|promo|sponsor|advert|ads?|"
+    r"related|recommend|carousel|breadcrumb|social|share)([\s_-]|$)", re.I)
+_TEXT_BLOCKS = ["p", "li", "td", "th", "dd", "dt", "pre", "h1", "h2", "h3", "h4"]
+
+_MATERIAL_RE = re.compile(
+    r"\b(?:(?:upper |outer |frame |shell |lining |sole )?materials?|fabric(?: type)?|composition)\s*[:\-]\s*"
+    r"([^\n;|]{3,160})|\bmade (?:of|from)\s+([^\n.;|]{3,120})", re.I)
+_WEIGHT_RE = re.compile(
+    r"\b(?:item |product |net |unit )?weight\s*[:\-]?\s*"
+    r"(\d[\d.,]*\s*(?:kilograms?|kg|grams?|g|pounds?|lbs?|ounces?|oz))\b", re.I)
+_DIMENSIONS_RE = re.compile(
+    r"\b(?:product |item |package |assembled )?dimensions?\s*(?:\([^)]{0,20}\))?\s*[:\-]?\s*"
+    r"(\d[\d.]*\s*(?:\"|in|cm|mm)?\s*[x×]\s*\d[\d.]*(?:\s*(?:\"|in|cm|mm)?\s*[x×]\s*\d[\d.]*)?"
+    r"\s*(?:inches|inch|in|cm|mm|centimeters|\")?)", re.I)
+_SHIPPING_RE = re.compile(
+    r"\b(free (?:shipping|delivery)[^\n]{0,80}|ships from[^\n]{0,80}|(?:shipping|delivery)\s*:\s*[^\n]{3,80})", re.I)
+_ORIGIN_RE = re.compile(r"\b(?:country of origin|made in)\s*[:\-]?\s*([A-Z][A-Za-z .]{1,40})")
+
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, list):
+        parts = [_clean(v) for v in value]
+        return ", ".join(p for p in parts if p) or None
+    if isinstance(value, dict):
+        return _clean(value.get("name") or value.get("@value") or value.get("value"))
+    text = re.sub(r"\s+", " ", str(value)).strip()
+    return text or None
+
+
+def _schema_value(value) -> Optional[str]:
+    """'https://schema.org/InStock' -> 'InStock'."""
+    text = _clean(value)
+    return text.rsplit("/", 1)[-1] if text else None
+
+
+def _quantity(value) -> Optional[str]:
+    """A QuantitativeValue (or plain string) as "<value> <unit>"."""
+    if isinstance(value, dict):
+        amount = _clean(value.get("value"))
+        unit = _clean(value.get("unitText") or value.get("unitCode"))
+        if amount is None:
+            return None
+        return f"{amount} {unit}" if unit else amount
+    return _clean(value)
+
+
+def _first(value):
+    return value[0] if isinstance(value, list) and value else value
+
+
+# ---------------------------------------------------------------------------
+# JSON-LD
+# ---------------------------------------------------------------------------
+
+def _json_ld_products(soup: BeautifulSoup) -> Iterator[dict]:
+    for script in soup.find_all("script", attrs={"type": re.compile(r"ld\+json", re.I)}):
+        try:
+            data = json.loads(script.string or script.get_text() or "")
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+                continue
+            if not isinstance(node, dict):
+                continue
+            types = node.get("@type")
+            types = types if isinstance(types, list) else [types]
+            if "Product" in types or "ProductGroup" in types:
+                yield node
+            for key in ("@graph", "mainEntity", "hasVariant"):
+                if key in node:
+                    stack.append(node[key])
+
+
+def _from_json_ld(soup: BeautifulSoup) -> Dict[str, str]:
+    fields: Dict[str, str] = {}
+    for product in _json_ld_products(soup):
+        found = {
+            "name": _clean(product.get("name")),
+            "brand": _clean(product.get("brand")),
+            "description": _clean(product.get("description")),
+            "color": _clean(product.get("color")),
+            "materials": _clean(product.get("material")),
+            "weight": _quantity(product.get("weight")),
+            "sku": _clean(product.get("gtin13") or product.get("gtin12") or product.get("gtin") or product.get("sku")),
+            "origin": _clean(product.get("countryOfOrigin")),
+        }
+        dims = [_quantity(product.get(k)) for k in ("width", "depth", "height")]
+        if any(dims):
+            found["dimensions"] = " x ".join(d or "?" for d in dims)
+
+        offer = _first(product.get("offers"))
+        if isinstance(offer, dict):
+            spec = _first(offer.get("priceSpecification"))
+            price = _clean(offer.get("price") or offer.get("lowPrice") or (spec.get("price") if isinstance(spec, dict) else None))
+            currency = _clean(offer.get("priceCurrency"))
+            if price:
+                found["price"] = f"{price} {currency}" if currency else price
+            found["availability"] = _schema_value(offer.get("availability"))
+            found["seller"] = _clean(offer.get("seller"))
+            shipping = _first(offer.get("shippingDetails"))
+            if isinstance(shipping, dict):
+                rate = shipping.get("shippingRate")
+                origin_node = shipping.get("shippingOrigin")
+                origin = _clean(origin_node.get("addressCountry")) if isinstance(origin_node, dict) else None
+                parts = []
+                if isinstance(rate, dict) and rate.get("value") is not None:
+                    parts.append(f"rate {_clean(rate.get('value'))} {_clean(rate.get('currency')) or ''}".strip())
+                if origin:
+                    parts.append(f"from {origin}")
+                if parts:
+                    found["shipping"] = ", ".join(parts)
+
+        rating = product.get("aggregateRating")
+        if isinstance(rating, dict) and rating.get("ratingValue") is not None:
+            count = _clean(rating.get("reviewCount") or rating.get("ratingCount"))
+            found["rating"] = f"{_clean(rating.get('ratingValue'))}/{_clean(rating.get('bestRating')) or 5}" + (
+                f" ({count} reviews)" if count else "")
+
+        # Retailers often put materials and weights in additionalProperty name/value pairs
+        properties = product.get("additionalProperty") or []
+        for prop in properties if isinstance(properties, list) else [properties]:
+            if not isinstance(prop, dict):
+                continue
+            name = (_clean(prop.get("name")) or "").lower()
+            value = _quantity(prop) if "value" in prop else None
+            if not value:
+                continue
+            if "material" in name or "fabric" in name:
+                found["materials"] = found.get("materials") or value
+            elif "weight" in name:
+                found["weight"] = found.get("weight") or value
+            elif "dimension" in name or name == "size":
+                found["dimensions"] = found.get("dimensions") or value
+
+        for key, value in found.items():
+            if value and not fields.get(key):
+                fields[key] = value
+    return fields
+
+
+# ---------------------------------------------------------------------------
+# Microdata and meta tags
+# ---------------------------------------------------------------------------
+
+_MICRODATA_FIELDS = {
+    "name": "name", "brand": "brand", "description": "description", "color": "color", "material": "materials",
+    "weight": "weight", "sku": "sku", "gtin13": "sku", "price": "price", "lowPrice": "price",
+    "priceCurrency": "currency", "availability": "availability", "ratingValue": "rating_value",
+    "reviewCount": "review_count", "countryOfOrigin": "origin",
+}
+
+
+def _itemprop_value(el: Tag) -> Optional[str]:
+    if el.has_attr("content"):
+        return _clean(el["content"])
+    for attr in ("href", "src", "value"):
+        if el.name in ("link", "a", "img", "data", "input") and el.has_attr(attr):
+            return _clean(el[attr])
+    return _clean(el.get_text(" ", strip=True))
+
+
+def _from_microdata(soup: BeautifulSoup) -> Dict[str, str]:
+    scope = soup.find(attrs={"itemtype": re.compile(r"schema\.org/Product\b", re.I)})
+    root = scope if scope is not None else soup
+    raw: Dict[str, str] = {}
+    for el in root.find_all(attrs={"itemprop": True}):
+        if scope is not None:
+            # Only properties of the product itself, its offers and its rating
+            owner = el.find_parent(attrs={"itemscope": True})
+            if owner is not scope and (owner is None or owner.get("itemprop") not in ("offers", "aggregateRating")):
+                continue
+        for prop in el["itemprop"].split() if isinstance(el["itemprop"], str) else el["itemprop"]:
+            key = _MICRODATA_FIELDS.get(prop)
+            if not key or key in raw:
+                continue
+            if prop == "brand" and el.has_attr("itemscope"):
+                inner = el.find(attrs={"itemprop": "name"})
+                value = _itemprop_value(inner) if inner is not None else None
+            elif el.has_attr("itemscope"):
+                continue
+            else:
+                value = _itemprop_value(el)
+            if value:
+                raw[key] = value
+
+    fields = {k: v for k, v in raw.items() if k in ("name", "brand", "description", "color", "materials", "weight", "sku", "origin")}
+    if raw.get("price"):
+        fields["price"] = f"{raw['price']} {raw['currency']}" if raw.get("currency") else raw["price"]
+    if raw.get("availability"):
+        fields["availability"] = _schema_value(raw["availability"])
+    if raw.get("rating_value"):
+        fields["rating"] = f"{raw['rating_value']}/5" + (f" ({raw['review_count']} reviews)" if raw.get("review_count") else "")
+    return fields
+
+
+def _from_meta(soup: BeautifulSoup) -> Dict[str, str]:
+    meta = {}
+    for tag in soup.find_all("meta"):
+        key = (tag.get("property") or tag.get("name") or "").lower()
+        if key and tag.get("content") and key not in meta:
+            meta[key] = tag["content"]
+
+    def pick(*keys):
+        for key in keys:
+            if meta.get(key):
+                return _clean(meta[key])
+        return None
+
+    fields = {
+        "name": pick("og:title", "twitter:title"),
+        "description": pick("og:description", "description", "twitter:description"),
+        "brand": pick("product:brand", "og:brand"),
+        "availability": _schema_value(pick("product:availability", "og:availability")),
+        "color": pick("product:color"),
+        "materials": pick("product:material"),
+    }
+    price = pick("product:price:amount", "og:price:amount")
+    if price:
+        currency = pick("product:price:currency", "og:price:currency")
+        fields["price"] = f"{price} {currency}" if currency else price
+    weight = pick("product:weight:value")
+    if weight:
+        unit = pick("product:weight:units")
+        fields["weight"] = f"{weight} {unit}" if unit else weight
+    return {k: v for k, v in fields.items() if v}
+
+
+# ---------------------------------------------------------------------------
+# Main text
+# ---------------------------------------------------------------------------
+
+def _link_density(el: Tag, text_len: int) -> float:
+    if not text_len:
+        return 1.0
+    link_len = sum(len(a.get_text(" ", strip=True)) for a in el.find_all("a"))
+    return min(1.0, link_len / text_len)
+
+
+def _block_text(el: Tag) -> str:
+    lines, seen = [], set()
+    for line in el.get_text("\n", strip=True).split("\n"):
+        line = re.sub(r"\s+", " ", line).strip()
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def main_text(soup: BeautifulSoup, max_chars: int = EXTRACT_MAX_TEXT_CHARS) -> str:
+    """
+    Readability-style main text: drop scripts, navigation and boilerplate,
+    score containers by the text blocks they hold (less their share of link
+    text), and keep the best non-overlapping containers up to ``max_chars``,
+    in page order. Modifies ``soup``.
+    """
+    for tag in soup.find_all(_NOISE_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(True):
+        if tag.decomposed or tag.name in ("html", "body"):
+            continue
+        marker = " ".join(tag.get("class") or []) + " " + (tag.get("id") or "") + " " + (tag.get("role") or "")
+        if _NOISE_ATTR.search(marker):
+            tag.decompose()
+
+    order = {id(el): index for index, el in enumerate(soup.find_all(True))}
+    scores: Dict[int, float] = {}
+    elements: Dict[int, Tag] = {}
+    for block in soup.find_all(_TEXT_BLOCKS):
+        text = block.get_text(" ", strip=True)
+        if len(text) < 20:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = block.parent
+        for ancestor, share in ((parent, 1.0), (parent.parent if parent is not None else None, 0.5)):
+            if ancestor is None or ancestor.name in ("[document]", "html"):
+                continue
+            scores[id(ancestor)] = scores.get(id(ancestor), 0.0) + score * share
+            elements[id(ancestor)] = ancestor
+
+    ranked = []
+    for key, score in scores.items():
+        el = elements[key]
+        text = _block_text(el)
+        ranked.append((score * (1 - _link_density(el, len(text))), el, text))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+
+    chosen: List[Tag] = []
+    texts: Dict[int, str] = {}
+    used = 0
+    title = soup.find("h1")
+    if title is not None and title.get_text(strip=True):
+        chosen.append(title)
+        texts[id(title)] = _block_text(title)
+        used += len(texts[id(title)])
+    for score, el, text in ranked:
+        if used >= max_chars or score <= 0:
+            break
+        # Containers may not nest, except that a container may hold the title
+        if any(el is other or el in other.parents or (other is not title and other in el.parents) for other in chosen):
+            continue
+        chosen.append(el)
+        texts[id(el)] = text
+        used += len(text)
+
+    chosen.sort(key=lambda el: order.get(id(el), 0))
+    return "\n\n".join(texts[id(el)] for el in chosen)[:max_chars].strip()
+
+
+def _from_text(text: str) -> Dict[str, str]:
+    fields = {}
+    match = _MATERIAL_RE.search(text)
+    if match:
+        fields["materials"] = _clean(match.group(1) or match.group(2))
+    for key, pattern in (("weight", _WEIGHT_RE), ("dimensions", _DIMENSIONS_RE), ("shipping", _SHIPPING_RE),
+                         ("origin", _ORIGIN_RE)):
+        match = pattern.search(text)
+        if match:
+            fields[key] = _clean(match.group(1))
+    return {k: v for k, v in fields.items() if v}
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def extract_product(html: str, url: Optional[str] = None, max_chars: int = EXTRACT_MAX_TEXT_CHARS) -> dict:
+    """
+    Product facts from a rendered page: JSON-LD ``Product`` blocks first, then
+    microdata, then OpenGraph/product meta tags, then patterns in the main
+    text. Returns ``{"url", "fields", "sources", "text"}`` where ``sources``
+    names where each field came from.
+    """
+    soup = BeautifulSoup(html or "", "html.parser")
+    fields: Dict[str, str] = {}
+    sources: Dict[str, str] = {}
+    # The structured sources must be read before main_text() strips scripts and meta tags
+    for source, found in (("json_ld", _from_json_ld(soup)), ("microdata", _from_microdata(soup)),
+                          ("meta", _from_meta(soup))):
+        for key, value in found.items():
+            if value and key not in fields:
+                fields[key] = value
+                sources[key] = source
+
+    text = main_text(soup, max_chars=max_chars)
+    for key, value in _from_text(text).items():
+        if key not in fields:
+            fields[key] = value
+            sources[key] = "text"
+    return {"url": url, "fields": fields, "sources": sources, "text": text}
+
+
+def is_complete(fields: dict) -> bool:
+    """All the facts the carbon pipeline needs, so no LLM pass is required."""
+    return all(fields.get(k) for k in REQUIRED_FIELDS) and any(fields.get(k) for k in SIZE_FIELDS)
+
+
+def is_sufficient(extraction: dict, min_text_chars: int = EXTRACT_MIN_TEXT_CHARS) -> bool:
+    """Enough to skip screenshots: complete fields, or a product name plus a usable amount of main text."""
+    fields = extraction.get("fields") or {}
+    if is_complete(fields):
+        return True
+    return bool(fields.get("name")) and len(extraction.get("text") or "") >= min_text_chars
+
+
+def format_fields(fields: dict) -> str:
+    lines = [f"- {label}: {fields[key]}" for key, label in FIELD_LABELS if fields.get(key)]
+    return "**EXTRACTED PRODUCT INFORMATION:**\n" + "\n".join(lines)
+
+
+TEXT_ANALYSIS_PROMPT = """Below are facts read from the structured data of a product page, followed by the main text of the page.
+Produce a structured product analysis with these sections, using bullet points:
+
+**BASIC INFORMATION:** product name, brand, price, rating, availability
+**PRODUCT DETAILS:** materials, dimensions and weight, key features, description, color options
+**REVIEWS & FEEDBACK:** pros, cons and a short review summary if present
+**ADDITIONAL INFORMATION:** shipping (costs, delivery time, shipping-from location), seller, warranty/returns
+
+Only report what the page states. Write "not stated" for anything missing.
+"""
+
+
+def analyze_extraction(extraction: dict, product_name: Optional[str] = None,
+                       llm: Optional[Callable[..., str]] = None) -> dict:
+    """
+    Analysis text in the shape ``analyze_product_images`` returns. Complete
+    fields are formatted directly; otherwise the fields and main text go to
+    the text LLM (``llm``, default ``call_llm``), which is far cheaper than
+    sending screenshots to the vision model.
+    """
+    fields = extraction.get("fields") or {}
+    result = {"success": True, "fields": fields, "sources": extraction.get("sources") or {}}
+
+    if is_complete(fields):
+        result.update(analysis=format_fields(fields), source="structured", llm_used=False, input_chars=0)
+        return result
+
+    compact = format_fields(fields) + "\n\n**PAGE TEXT:**\n" + (extraction.get("text") or "")
+    prompt = TEXT_ANALYSIS_PROMPT
+    if product_name:
+        prompt += f"\nThe product being searched for is: {product_name}\n"
+    prompt += "\n" + compact
+
+    if llm is None:
+        try:
+            from server.services.llm import call_llm as llm
+        except ImportError:
+            from services.llm import call_llm as llm
+    try:
+        analysis = llm(prompt, max_tokens=EXTRACT_LLM_MAX_TOKENS)
+        result.update(analysis=analysis, source="structured+llm", llm_used=True, input_chars=len(prompt))
+    except Exception as e:
+        # The raw facts and text are still far better than nothing for the downstream prompts
+        print(f"  Text analysis failed ({e}), using the extracted text as is")
+        result.update(analysis=compact, source="structured", llm_used=False, input_chars=0, llm_error=str(e))
+    return result
@@ -0,0 +1,44 @@
+import os
+from datetime import datetime, timedelta
+
+
+def test_identical_content_is_stored_once(make_store):
+    store, _ = make_store()
+    first = store.put_bytes(b"\x89PNG fake screenshot", "screenshot", product="chair", url="https://a", ext=".png")
+    again = store.put_bytes(b"\x89PNG fake screenshot", "screenshot", product="chair", url="https://a", ext=".png")
+    other_url = store.put_bytes(b"\x89PNG fake screenshot", "screenshot", product="chair", url="https://b", ext=".png")
+
+    assert not first["deduped"] and again["deduped"] and other_url["deduped"]
+    assert first["key"] == again["key"] == other_url["key"]
+    assert store.get_bytes(first["key"]) == b"\x89PNG fake screenshot"
+    stats = store.stats()
+    assert stats["blobs"] == 1 and stats["artifacts"] == 2
+
+
+def test_json_is_compressed_and_round_trips(make_store):
+    store, _ = make_store()
+    doc = {"product_name": "chair", "results": [{"analysis": "mesh back " * 200}]}
+    ref = store.put_json(doc, "product_analysis", product="chair")
+
+    assert ref["stored_size"] < ref["size"]
+    assert store.get_json(ref["key"]) == doc
+    assert store.find(kind="product_analysis")[0]["key"] == ref["key"]
+
+
+def test_evicts_by_age_then_size(make_store):
+    store, connect = make_store()
+    old = store.put_bytes(b"old" * 100, "screenshot")
+    mid = store.put_bytes(b"mid" * 100, "screenshot")
+    new = store.put_bytes(b"new" * 100, "screenshot")
+    conn = connect()
+    with conn:
+        conn.execute("UPDATE artifacts SET created_at = ? WHERE hash = ?", (datetime.now() - timedelta(days=30), old["key"]))
+        conn.execute("UPDATE artifacts SET created_at = ? WHERE hash = ?", (datetime.now() - timedelta(hours=1), mid["key"]))
+    conn.close()
+
+    assert store.evict(max_bytes=10_000, max_age_days=7) == 1
+    assert store.get_bytes(old["key"]) is None and not os.path.exists(old["path"])
+
+    assert store.evict(max_bytes=300, max_age_days=7) == 1
+    assert store.get_bytes(mid["key"]) is None
+    assert store.get_bytes(new["key"]) == b"new" * 100
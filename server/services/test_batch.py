@@ -0,0 +1,121 @@
+import json
+import os
+
+from server.agents import transform
+from server.services.batch import (BatchRunner, CategoryTask, LocalBatchBackend, read_jsonl, request_text,
+                                   response_text, run_backfill, items_from_products)
+
+CATEGORIES = ["tshirts", "shoes_and_sneakers"]
+
+TRANSFORMED = {
+    "materials": [{"name": "cotton", "weight": 0.2, "weight_source": "product description",
+                   "emission_factor": 5.0, "emission_factor_source": "model-based estimate"}],
+    "manufacturing_factor": {"value": 0.3, "source": "model-based estimate"},
+    "transport": {"origin": None, "distance_km": None, "mode": None, "emission_factor_ton_km": None, "source": None},
+    "packaging": {"weight": 0.05, "emission_factor": 1.5, "source": "model-based estimate"},
+    "product_weight": {"value": 0.25, "source": "sum of material weights"},
+}
+
+class FakeModel:
+    """Answers batch requests like the model would, with scripted failures."""
+
+    def __init__(self, fail_once=(), bad_category=()):
+        self.fail_once = set(fail_once)
+        self.bad_category = set(bad_category)
+        self.seen = []
+
+    def __call__(self, request):
+        system, text = request_text(request)
+        if system == transform.PROMPT_PREFIX:
+            sku = json.loads(text)["sku"]
+            self.seen.append(("transform", sku))
+            if sku in self.fail_once:
+                self.fail_once.discard(sku)
+                raise RuntimeError("RESOURCE_EXHAUSTED")
+            return "```json\n" + json.dumps(TRANSFORMED) + "\n```"
+        if text.startswith("You are a data completion agent"):
+            self.seen.append(("fill_missing", None))
+            filled = json.loads(json.dumps(TRANSFORMED))
+            filled["transport"] = {"origin": "India", "distance_km": 12000, "mode": "ship",
+                                   "emission_factor_ton_km": 0.01, "source": "estimated_from_analysis"}
+            return json.dumps(filled)
+        name = json.loads(text.split("Product (JSON):\n", 1)[1])["name"]
+        self.seen.append(("category", name))
+        if name in self.bad_category:
+            return "I think it is a shirt."
+        return json.dumps({"category": "tshirts", "reasoning": f"{name} is a tee"})
+
+
+def make_items():
+    return items_from_products([
+        {"sku": "BF-1", "name": "Cotton Tee", "brand": "Loom", "price": "12.50 USD"},
+        {"sku": "BF-2", "name": "Organic Tee", "brand": "Loom", "price": 20,
+         "analysis": "Ships from India. 100% organic cotton."},
+        {"sku": "BF-3", "name": "Plain Tee", "brand": None, "price": None},
+    ])
+
+
+def test_result_lines():
+    assert response_text({"key": "a", "response": {"candidates": [{"content": {"parts": [{"text": "hi"}]}}]}}) == ("hi", None)
+    assert response_text({"key": "a", "error": {"code": 429, "message": "quota"}}) == (None, "quota")
+    assert response_text({"key": "a", "response": {"candidates": []}})[0] is None
+
+
+def test_backfill_retries_failed_lines_and_stores_products(db, tmp_path):
+    model = FakeModel(fail_once={"BF-1"}, bad_category={"Plain Tee"})
+    polls = []
+    runner = BatchRunner(LocalBatchBackend(model, polls_until_done=3), str(tmp_path / "run"),
+                         poll_s=7, sleep=polls.append)
+    items = make_items()
+
+    summary = run_backfill(items, runner, tasks=("transform", "fill_missing", CategoryTask(categories=CATEGORIES)))
+
+    transform_summary, fill_summary, category_summary = summary["tasks"]
+    # BF-1 failed in the first job and was resubmitted alone
+    assert transform_summary == {"task": "transform", "requests": 3, "succeeded": 3, "failed": 0, "jobs": 2}
+    assert [sku for task, sku in model.seen if task == "transform"] == ["BF-1", "BF-2", "BF-3", "BF-1"]
+    assert "transform" not in items[0].get("errors", {})
+    # Only the item with a page analysis needed filling
+    assert fill_summary["requests"] == 1 and fill_summary["succeeded"] == 1
+    # The unparseable category answer was retried up to the limit, then left to the fallback
+    assert category_summary["failed"] == 1 and category_summary["jobs"] == 3
+    assert polls and set(polls) == {7}
+
+    assert summary["stored"] == 3
+    rows = {row["sku"]: row for row in db.query_products(columns=("sku", "category", "cf_value"))}
+    assert rows["BF-1"]["category"] == "tshirts"
+    assert rows["BF-2"]["cf_value"] > rows["BF-1"]["cf_value"]  # filled-in transport adds emissions
+    # Stored anyway, with the token-matching fallback (which finds nothing here)
+    assert rows["BF-3"]["category"] is None
+    assert "Used fallback heuristic" in db.get_cf_detail("BF-3")
+
+    # The run directory holds the items after each task and every job, for resuming
+    saved = list(read_jsonl(os.path.join(runner.run_dir, "items.jsonl")))
+    assert [item["key"] for item in saved] == ["BF-1", "BF-2", "BF-3"]
+    jobs = json.load(open(os.path.join(runner.run_dir, "jobs.json")))
+    assert set(jobs) == {"transform-1", "transform-2", "fill_missing-1", "category-1", "category-2", "category-3"}
+    assert all(job["state"] == "applied" for job in jobs.values())
+
+
+def test_resumed_run_waits_on_submitted_jobs_instead_of_resubmitting(tmp_path):
+    model = FakeModel()
+    backend = LocalBatchBackend(model, polls_until_done=3)
+    submitted = []
+    submit = backend.submit
+    backend.submit = lambda *args: submitted.append(args) or submit(*args)
+    run_dir = str(tmp_path / "run")
+
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+
+    items = make_items()
+    try:
+        run_backfill(items, BatchRunner(backend, run_dir, sleep=interrupt), tasks=("transform",), store=False)
+    except KeyboardInterrupt:
+        pass
+    assert len(submitted) == 1 and not model.seen
+
+    resumed = BatchRunner(backend, run_dir, sleep=lambda s: None)
+    summary = run_backfill(resumed.load_items(), resumed, tasks=("transform",), store=False)
+    assert len(submitted) == 1
+    assert summary["tasks"][0]["succeeded"] == 3 and summary["tasks"][0]["jobs"] == 0
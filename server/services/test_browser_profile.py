@@ -0,0 +1,175 @@
+import json
+import os
+import time
+
+from server.services.browser_profile import BrowserProfile, split_storage_state
+from server.services.resource_policy import ResourcePolicy
+
+
+class FakeContext:
+    def __init__(self, state=None):
+        self.pages = []
+        self.state = state or {"cookies": [], "origins": []}
+        self.closed = False
+
+    def new_page(self):
+        page = object()
+        self.pages.append(page)
+        return page
+
+    def storage_state(self):
+        return self.state
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, context):
+        self.context = context
+        self.context_options = None
+        self.closed = False
+
+    def new_context(self, **options):
+        self.context_options = options
+        return self.context
+
+    def close(self):
+        self.closed = True
+
+
+class FakeChromium:
+    def __init__(self, state=None, persistent_error=None):
+        self.state = state
+        self.persistent_error = persistent_error
+        self.persistent_calls = []
+        self.browser = None
+
+    def launch_persistent_context(self, user_data_dir, headless=True, args=None, **options):
+        self.persistent_calls.append((user_data_dir, args, options))
+        if self.persistent_error:
+            raise self.persistent_error
+        return FakeContext(self.state)
+
+    def launch(self, headless=True, args=None):
+        self.browser = FakeBrowser(FakeContext(self.state))
+        return self.browser
+
+
+class FakePlaywright:
+    def __init__(self, **kwargs):
+        self.chromium = FakeChromium(**kwargs)
+
+
+STATE = {
+    "cookies": [
+        {"name": "session-id", "value": "1", "domain": ".amazon.com", "path": "/"},
+        {"name": "tracker", "value": "2", "domain": ".doubleclick.net", "path": "/"},
+    ],
+    "origins": [{"origin": "https://www.amazon.com", "localStorage": [{"name": "consent", "value": "yes"}]}],
+}
+
+
+def test_storage_state_is_split_per_visited_site():
+    per_site = split_storage_state(STATE, ["amazon.com"])
+
+    assert [c["name"] for c in per_site["amazon.com"]["cookies"]] == ["session-id"]
+    assert per_site["amazon.com"]["origins"][0]["origin"] == "https://www.amazon.com"
+
+
+def test_persistent_profile_uses_disk_cache_and_host_resolver_blocking(tmp_path):
+    profile = BrowserProfile(root=str(tmp_path), mode="persistent", disk_cache_bytes=1000)
+    playwright = FakePlaywright(state=STATE)
+    policy = ResourcePolicy(enabled=True, block_domains=["doubleclick.net"])
+
+    session = profile.open(playwright, ["https://www.amazon.com/dp/1"], args=["--x"], policy=policy,
+                           context_options={"locale": "en-US"})
+    user_data_dir, args, options = playwright.chromium.persistent_calls[0]
+    assert session.disk_cache and user_data_dir == profile.user_data_dir
+    assert "--disk-cache-size=1000" in args
+    assert any(a.startswith("--host-resolver-rules=") and "MAP *.doubleclick.net ~NOTFOUND" in a for a in args)
+    assert options == {"locale": "en-US"}
+
+    # A concurrent capture cannot share the profile directory and gets a fresh, seeded context
+    other = profile.open(FakePlaywright(), ["https://www.amazon.com/dp/2"])
+    assert not other.disk_cache
+    other.close()
+
+    session.close()
+    with open(os.path.join(profile.state_dir, "amazon.com.json")) as f:
+        assert [c["name"] for c in json.load(f)["cookies"]] == ["session-id"]
+    assert profile._profile_lock.acquire(blocking=False)
+
+
+def test_fresh_contexts_are_seeded_with_saved_site_state(tmp_path):
+    profile = BrowserProfile(root=str(tmp_path), mode="storage_state")
+    profile.save_state(STATE, ["amazon.com"])
+    playwright = FakePlaywright()
+
+    session = profile.open(playwright, ["https://www.amazon.com/dp/1", "https://www.etsy.com/listing/1"])
+    seeded = playwright.chromium.browser.context_options["storage_state"]
+    assert [c["name"] for c in seeded["cookies"]] == ["session-id"]
+    session.close()
+    assert playwright.chromium.browser.closed
+
+
+def test_stale_state_is_discarded(tmp_path):
+    profile = BrowserProfile(root=str(tmp_path), mode="storage_state", state_max_age_h=1)
+    profile.save_state(STATE, ["amazon.com"])
+    path = os.path.join(profile.state_dir, "amazon.com.json")
+    old = time.time() - 2 * 3600
+    os.utime(path, (old, old))
+
+    assert profile.load_state(["amazon.com"]) == {"cookies": [], "origins": []}
+    assert not os.path.exists(path)
+
+
+def test_maintenance_clears_caches_when_too_large_and_recreates_when_expired(tmp_path):
+    profile = BrowserProfile(root=str(tmp_path), max_bytes=1000, max_age_h=24)
+    profile.maintain()
+    cache = os.path.join(profile.user_data_dir, "Default", "Cache")
+    os.makedirs(cache)
+    with open(os.path.join(cache, "blob"), "wb") as f:
+        f.write(b"x" * 5000)
+    with open(os.path.join(profile.user_data_dir, "Default", "Cookies"), "wb") as f:
+        f.write(b"c" * 10)
+
+    assert profile.maintain()["caches_cleared"]
+    assert not os.path.exists(cache)
+    assert os.path.exists(os.path.join(profile.user_data_dir, "Default", "Cookies"))
+
+    marker = os.path.join(profile.user_data_dir, ".created")
+    old = time.time() - 48 * 3600
+    os.utime(marker, (old, old))
+    assert profile.maintain()["recreated"]
+    assert not os.path.exists(os.path.join(profile.user_data_dir, "Default"))
+
+
+def test_unavailable_profile_falls_back_to_a_fresh_context(tmp_path):
+    profile = BrowserProfile(root=str(tmp_path), mode="persistent")
+    session = profile.open(FakePlaywright(persistent_error=RuntimeError("SingletonLock")), ["https://www.amazon.com/"])
+
+    assert not session.disk_cache and session.browser is not None
+    session.close()
+    assert profile._profile_lock.acquire(blocking=False)
+
+
+def test_profile_in_use_by_another_process_is_left_alone(tmp_path):
+    # A second BrowserProfile on the same root stands in for another worker process
+    owner = BrowserProfile(root=str(tmp_path), mode="persistent")
+    session = owner.open(FakePlaywright(), ["https://www.amazon.com/"])
+    marker = os.path.join(owner.user_data_dir, ".created")
+    old = time.time() - 1000 * 3600
+    os.utime(marker, (old, old))
+
+    other = BrowserProfile(root=str(tmp_path), mode="persistent", max_age_h=1)
+    playwright = FakePlaywright()
+    fresh = other.open(playwright, ["https://www.amazon.com/"])
+    assert not fresh.disk_cache and not playwright.chromium.persistent_calls
+    assert os.path.exists(marker)  # not recreated under the running browser
+    fresh.close()
+
+    session.close()
+    reopened = other.open(FakePlaywright(), ["https://www.amazon.com/"])
+    assert reopened.disk_cache
+    reopened.close()
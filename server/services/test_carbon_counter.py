@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from server.services.carbon_counter import CarbonCounter
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def _collection():
+    return mongomock.MongoClient().db.TotalCarbonReduced
+
+
+def test_direct_increments_are_atomic():
+    collection = _collection()
+    counter = CarbonCounter(lambda: collection)
+
+    threads = [threading.Thread(target=lambda: [counter.increment(0.5) for _ in range(50)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert collection.count_documents({}) == 1
+    assert counter.total() == 8 * 50 * 0.5
+
+
+def test_existing_total_document_is_reused():
+    collection = _collection()
+    collection.insert_one({"Total": 10.0})
+    counter = CarbonCounter(lambda: collection)
+    assert counter.increment(2.5) == 12.5
+    assert collection.count_documents({}) == 1
+
+
+def test_record_reports_the_first_total_document():
+    collection = _collection()
+    counter = CarbonCounter(lambda: collection)
+    assert counter.record(3.0) == (3.0, True)
+    assert counter.record(1.5) == (4.5, False)
+
+    sharded = CarbonCounter(lambda: collection, shards=4)
+    collection.delete_many({})
+    assert sharded.record(1.0, shard_key="a") == (1.0, True)
+    assert sharded.record(1.0, shard_key="a")[1] is False
+
+
+def test_write_behind_flushes_by_count_and_on_close():
+    collection = _collection()
+    counter = CarbonCounter(lambda: collection, write_behind=True, flush_interval_ms=60000, flush_max_events=10)
+
+    for _ in range(10):
+        counter.increment(1.0)
+    deadline = time.monotonic() + 2
+    while counter.total() != 10.0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert counter.total() == 10.0
+
+    for _ in range(3):
+        counter.increment(1.0)
+    assert counter.metrics()["pending_events"] == 3
+    counter.close()
+    assert counter.total() == 13.0
+
+    metrics = counter.metrics()
+    assert metrics["pending_events"] == 0
+    assert metrics["flushed_events"] == 13
+    assert metrics["last_flush_lag_ms"] is not None
+
+
+def test_failed_flush_keeps_pending_savings():
+    collection = _collection()
+    broken = {"fail": True}
+
+    def get_collection():
+        if broken["fail"]:
+            raise RuntimeError("mongo unavailable")
+        return collection
+
+    counter = CarbonCounter(get_collection, write_behind=True, flush_interval_ms=60000, flush_max_events=1000)
+    counter.increment(4.0)
+    counter.flush()
+    assert counter.metrics()["flush_errors"] == 1
+    assert counter.metrics()["pending_amount"] == 4.0
+
+    broken["fail"] = False
+    counter.close()
+    assert counter.total() == 4.0
+
+
+def test_snapshot_is_cached_and_refreshed_by_writes():
+    collection = _collection()
+    counter = CarbonCounter(lambda: collection)
+
+    total, version = counter.snapshot(max_age_s=60)
+    assert total == 0
+
+    # an out-of-band change is not seen until the TTL expires...
+    collection.insert_one({"Total": 5.0})
+    assert counter.snapshot(max_age_s=60) == (0, version)
+    # ...but a write through the counter refreshes the cache immediately
+    counter.increment(1.0)
+    total, new_version = counter.snapshot(max_age_s=60)
+    assert total == 6.0 and new_version > version
+    assert counter.snapshot(max_age_s=0)[0] == 6.0
+
+
+def test_sharded_counter_sums_shards_and_compacts_legacy_doc():
+    collection = _collection()
+    users = mongomock.MongoClient().db.CarbonReducedByUser
+    collection.insert_one({"Total": 10.0})  # pre-sharding single document
+    counter = CarbonCounter(lambda: collection, shards=4, get_user_collection=lambda: users)
+
+    threads = [
+        threading.Thread(target=lambda k=k: [counter.increment(1.0, shard_key=f"s{k}", user_key=f"u{k % 2}")
+                                             for _ in range(25)])
+        for k in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert counter.total() == 10.0 + 200.0
+    assert counter.user_total("u0") == 100.0 and counter.user_total("u1") == 100.0
+    assert collection.count_documents({}) <= 5
+
+    assert counter.compact() == 1
+    assert collection.count_documents({"_id": {"$regex": "^shard-"}}) == collection.count_documents({})
+    assert counter.total() == 210.0
+    # the cached aggregate follows local writes without re-reading every shard
+    assert counter.increment(1.0) == 211.0
+
+
+def main():
+    test_direct_increments_are_atomic()
+    test_existing_total_document_is_reused()
+    test_record_reports_the_first_total_document()
+    test_write_behind_flushes_by_count_and_on_close()
+    test_failed_flush_keeps_pending_savings()
+    test_snapshot_is_cached_and_refreshed_by_writes()
+    test_sharded_counter_sums_shards_and_compacts_legacy_doc()
+    print("All carbon counter checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from server.services.carbon_stream import TotalBroadcaster, TooManySubscribers
+
+
+def test_bursts_are_coalesced():
+    broadcaster = TotalBroadcaster(max_subscribers=5, min_interval_s=0.2, heartbeat_s=5)
+    broadcaster.publish(1.0)
+    events = broadcaster.subscribe()
+
+    assert next(events).startswith("retry:")
+    assert '"total": 1.0' in next(events)
+
+    # ten checkouts land while the subscriber is inside its coalescing window
+    def burst():
+        for i in range(10):
+            broadcaster.publish(2.0 + i)
+    threading.Thread(target=burst).start()
+
+    started = time.monotonic()
+    event = next(events)
+    assert '"total": 11.0' in event, event
+    assert time.monotonic() - started >= 0.15
+    events.close()
+    assert broadcaster.subscriber_count == 0
+
+
+def test_heartbeat_when_idle():
+    broadcaster = TotalBroadcaster(heartbeat_s=0.05)
+    events = broadcaster.subscribe()
+    next(events)
+    assert next(events) == ": heartbeat\n\n"
+    events.close()
+
+
+def test_subscriber_cap():
+    broadcaster = TotalBroadcaster(max_subscribers=2)
+    first = broadcaster.subscribe()
+    second = broadcaster.subscribe()
+    try:
+        broadcaster.subscribe()
+    except TooManySubscribers:
+        pass
+    else:
+        raise AssertionError("third subscriber should be refused")
+
+    # a slot is returned even if the stream was never started
+    first.close()
+    first.close()
+    third = broadcaster.subscribe()
+    assert broadcaster.subscriber_count == 2
+    second.close()
+    third.close()
+    assert broadcaster.subscriber_count == 0
+
+
+def main():
+    test_bursts_are_coalesced()
+    test_heartbeat_when_idle()
+    test_subscriber_cap()
+    print("All carbon stream checks passed.")
+
+
+if __name__ == "__main__":
+    main()
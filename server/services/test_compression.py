@@ -0,0 +1,55 @@
+import gzip
+
+import zstandard
+from flask import Flask, Response, jsonify
+
+from server.services.compression import ResponseCompressor
+from server.services.fast_json import OrjsonProvider
+
+
+def make_app():
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    ResponseCompressor(min_size=100).init_app(app)
+
+    @app.route("/big")
+    def big():
+        return jsonify({"links": [{"link": "https://example.com", "c0_score": 0.5}] * 50})
+
+    @app.route("/small")
+    def small():
+        return jsonify({"total": 1.0})
+
+    @app.route("/stream")
+    def stream():
+        return Response((f"data: {i}\n\n" * 100 for i in range(3)), mimetype="text/event-stream")
+
+    return app
+
+
+def test_negotiates_encoding():
+    client = make_app().test_client()
+
+    plain = client.get("/big")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.json["links"][0]["c0_score"] == 0.5
+
+    gz = client.get("/big", headers={"Accept-Encoding": "gzip, deflate"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(gz.data) == plain.data
+    assert "Accept-Encoding" in gz.headers["Vary"]
+
+    zs = client.get("/big", headers={"Accept-Encoding": "gzip, zstd"})
+    assert zs.headers["Content-Encoding"] == "zstd"
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(zs.data) == plain.data
+
+    preferred = client.get("/big", headers={"Accept-Encoding": "gzip;q=1.0, zstd;q=0.5"})
+    assert preferred.headers["Content-Encoding"] == "gzip"
+
+
+def test_small_and_streamed_responses_are_untouched():
+    client = make_app().test_client()
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    stream = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in stream.headers
+    assert stream.data.startswith(b"data: 0")
@@ -0,0 +1,72 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from server.services.http_fetch import HttpFetcher, domain_of
+
+PRODUCT_PAGE = ("<html><head><meta charset='utf-8'><title>Mug</title></head><body><h1>Stoneware mug – 350 ml</h1>"
+                + "<p>Glazed stoneware, dishwasher safe.</p>" * 100 + "</body></html>")
+BOT_WALL = "<html><body><h1>Robot Check</h1><p>Type the characters you see below.</p>" + " " * 3000 + "</body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/product":
+            body, status = PRODUCT_PAGE.encode("utf-8"), 200
+        elif self.path == "/blocked":
+            body, status = BOT_WALL.encode("utf-8"), 200
+        else:
+            body, status = b"missing", 404
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_fetch_decodes_html_using_the_meta_charset(base_url):
+    result = HttpFetcher(js_domains=[]).fetch(base_url + "/product")
+
+    assert result.status == 200 and not result.looks_blocked
+    assert "Stoneware mug – 350 ml" in result.html
+
+
+def test_bot_walls_and_errors_look_blocked(base_url):
+    fetcher = HttpFetcher(js_domains=[])
+
+    assert fetcher.fetch(base_url + "/blocked").looks_blocked
+    assert fetcher.fetch(base_url + "/missing").looks_blocked
+
+
+def test_js_domains_always_use_the_browser():
+    fetcher = HttpFetcher(js_domains=["walmart.com"])
+
+    assert not fetcher.should_try_http("https://www.walmart.com/ip/123")
+    assert not fetcher.should_try_http("https://shop.walmart.com/ip/123")
+    assert fetcher.should_try_http("https://www.etsy.com/listing/1")
+    assert domain_of("https://www.etsy.com/listing/1") == "etsy.com"
+
+
+def test_domains_with_a_low_success_rate_switch_to_the_browser_and_reprobe():
+    fetcher = HttpFetcher(js_domains=[], min_samples=3, min_success_rate=0.5, reprobe_every=4)
+    url = "https://shop.example/p/1"
+    for success in (False, False, True):
+        assert fetcher.should_try_http(url)
+        fetcher.record(url, success)
+
+    decisions = [fetcher.should_try_http(url) for _ in range(8)]
+    assert decisions == [False, False, False, True, False, False, False, True]
+    assert fetcher.metrics()["domains"]["shop.example"]["success_rate"] == pytest.approx(0.333)
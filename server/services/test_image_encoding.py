@@ -0,0 +1,46 @@
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from server.services.image_encoding import EncodingStats, encode_image, is_mostly_text
+
+
+def png_bytes(image):
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def text_page(width=1920, height=600):
+    # Light noise stands in for anti-aliasing and image compression artefacts of a real screenshot
+    image = Image.effect_noise((width, height), 6).point(lambda v: 235 + v // 16).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for y in range(20, height, 24):
+        draw.text((40, y), "Materials: 100% cotton flannel. Machine wash cold. " * 6, fill="black")
+    return image
+
+
+def test_text_tile_is_downscaled_greyscale_webp():
+    encoded = encode_image(png_bytes(text_page()), max_width=1280, fmt="webp", quality=80)
+
+    assert encoded.mime_type == "image/webp"
+    assert encoded.greyscale
+    assert (encoded.width, encoded.height) == (1280, 400)
+    assert len(encoded.data) < encoded.original_bytes
+    # WebP has no greyscale mode; the decoded pixels simply carry no colour
+    assert is_mostly_text(Image.open(BytesIO(encoded.data)), saturation_threshold=1)
+
+
+def test_colourful_tile_stays_in_colour():
+    image = text_page()
+    ImageDraw.Draw(image).rectangle((600, 100, 1300, 500), fill=(200, 40, 40))
+    assert not is_mostly_text(image)
+    assert not encode_image(png_bytes(image), fmt="jpeg").greyscale
+
+
+def test_stats_report_bytes_saved():
+    stats = EncodingStats()
+    stats.add(encode_image(png_bytes(text_page())))
+    report = stats.as_dict()
+    assert report["images"] == 1
+    assert report["saved_bytes"] == report["original_bytes"] - report["sent_bytes"] > 0
@@ -0,0 +1,72 @@
+from server.services.ocr import analyze_with_ocr, clean_lines, relevant_text
+
+TILE_1 = """Acme Trail Runner 2 Running Shoe
+Visit the Acme Store
+4.6 out of 5 stars 212 ratings
+$129.99
+~~ ., ;
+Material: Recycled polyester mesh
+"""
+# Overlapping tile repeats the last lines of the first
+TILE_2 = """Material:  Recycled polyester mesh
+Item Weight: 310 g
+Customers also viewed
+Trail Runner 1
+Free delivery Tuesday, ships from Portland, OR
+"""
+
+
+def test_clean_lines_drops_noise_and_overlap_duplicates():
+    lines = clean_lines([TILE_1, TILE_2])
+
+    assert "~~ ., ;" not in lines
+    assert sum(1 for line in lines if "Recycled polyester" in line) == 1
+    assert lines[0] == "Acme Trail Runner 2 Running Shoe"
+
+
+def test_relevant_text_keeps_details_and_respects_the_budget():
+    lines = ["Header"] * 12 + ["filler text"] * 20 + ["Item Weight: 310 g"] + ["filler again"] * 20
+    text = relevant_text(lines)
+    assert "Item Weight: 310 g" in text
+    assert text.count("filler") == 2  # one line of context either side
+
+    assert len(relevant_text(lines, max_chars=40)) <= 40
+
+
+def test_analyze_with_ocr_sends_relevant_text_to_the_llm():
+    prompts = []
+
+    def llm(prompt, **kwargs):
+        prompts.append(prompt)
+        return "structured analysis"
+
+    result = analyze_with_ocr(["a.png", "b.png"], product_name="trail runner", llm=llm,
+                              ocr=lambda paths: [TILE_1, TILE_2])
+
+    assert result["success"] and result["analysis"] == "structured analysis"
+    assert result["source"] == "ocr+llm" and result["images_analyzed"] == 2
+    assert "$129.99" in prompts[0] and "Item Weight: 310 g" in prompts[0]
+
+
+def test_ocr_without_text_is_not_a_success():
+    result = analyze_with_ocr(["a.png"], llm=lambda prompt, **kwargs: "unused", ocr=lambda paths: [""])
+    assert not result["success"] and not result["sufficient"]
+
+
+def test_insufficient_text_skips_the_llm_when_sufficiency_is_required():
+    prompts = []
+    tile = "Acme Trail Runner 2 Running Shoe\nMaterial: Recycled polyester mesh\n"
+
+    def llm(prompt, **kwargs):
+        prompts.append(prompt)
+        return "structured analysis"
+
+    result = analyze_with_ocr(["a.png"], llm=llm, ocr=lambda paths: [tile], require_sufficient=True)
+    assert not result["success"] and not result["sufficient"] and "analysis" not in result
+    assert not prompts
+
+    details = "Product details\nSole: Natural rubber outsole with recycled foam midsole\n" \
+              "Country of Origin: Vietnam\nPackage Dimensions: 33 x 21 x 12 cm\n"
+    result = analyze_with_ocr(["a.png"], llm=llm, ocr=lambda paths: [TILE_1, TILE_2, details],
+                              require_sufficient=True)
+    assert result["success"] and result["sufficient"] and len(prompts) == 1
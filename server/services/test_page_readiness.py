@@ -0,0 +1,72 @@
+import pytest
+
+from server.services.page_readiness import platform_for, wait_until_ready
+
+
+class FakePage:
+    def __init__(self, selectors_render=True, stable=True, goto_error=None, url_after_error="about:blank"):
+        self.url = "about:blank"
+        self.selectors_render = selectors_render
+        self.stable = stable
+        self.goto_error = goto_error
+        self.url_after_error = url_after_error
+        self.calls = []
+
+    def goto(self, url, wait_until=None, timeout=None):
+        self.calls.append(("goto", wait_until, timeout))
+        if self.goto_error:
+            self.url = self.url_after_error
+            raise self.goto_error
+        self.url = url
+
+    def wait_for_function(self, script, arg=None, timeout=None):
+        self.calls.append(("selectors", arg, timeout))
+        if not self.selectors_render:
+            raise TimeoutError("selectors")
+
+    def evaluate(self, script, arg=None):
+        self.calls.append(("stable", arg))
+        return {"stable": self.stable, "waited_ms": 500}
+
+
+def test_platforms_match_the_extension():
+    assert platform_for("https://www.amazon.com/dp/B01")["title"][0] == "#productTitle"
+    assert platform_for("https://www.ebay.com/itm/1")["platform"] == "eBay"
+    assert platform_for("https://shop.example/p/1") is None
+
+
+def test_known_platform_is_ready_when_title_and_price_render():
+    page = FakePage()
+    navigated = []
+    result = wait_until_ready(page, "https://www.etsy.com/listing/1", budget_ms=20000, on_navigated=lambda: navigated.append(1))
+
+    assert result["strategy"] == "selectors" and result["platform"] == "Etsy"
+    assert [c[0] for c in page.calls] == ["goto", "selectors"]
+    assert page.calls[0][1] == "domcontentloaded" and page.calls[0][2] <= 20000
+    assert page.calls[1][1]["price"] == [".currency-value"]
+    assert navigated == [1]
+
+
+def test_missing_selectors_fall_back_to_dom_stability():
+    page = FakePage(selectors_render=False)
+    result = wait_until_ready(page, "https://www.amazon.com/dp/B01", budget_ms=20000, stable_max_ms=3000)
+
+    assert result["strategy"] == "dom_stable"
+    assert [c[0] for c in page.calls] == ["goto", "selectors", "stable"]
+    assert page.calls[2][1]["maxMs"] <= 3000
+
+
+def test_unknown_sites_wait_for_dom_stability_only():
+    page = FakePage(stable=False)
+    result = wait_until_ready(page, "https://shop.example/p/1", budget_ms=20000)
+
+    assert result["strategy"] == "budget" and result["platform"] is None
+    assert [c[0] for c in page.calls] == ["goto", "stable"]
+
+
+def test_navigation_timeout_is_fatal_only_without_a_document():
+    page = FakePage(goto_error=TimeoutError("goto"), url_after_error="https://shop.example/p/1")
+    assert wait_until_ready(page, "https://shop.example/p/1", budget_ms=20000)["strategy"] == "dom_stable"
+
+    with pytest.raises(TimeoutError):
+        wait_until_ready(FakePage(goto_error=TimeoutError("goto")), "https://shop.example/p/1", budget_ms=20000)
@@ -0,0 +1,177 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from server.services.prompt_cache import LocalCacheBackend, PromptCache, get_prompt_cache, is_missing_cache_error
+
+PREFIX = "Static extraction instructions. " * 100
+
+
+class APIError(Exception):
+    """Shaped like google.genai.errors.APIError."""
+
+    def __init__(self, code, status, message):
+        super().__init__(f"{code} {status}. {message}")
+        self.code = code
+        self.status = status
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(**kwargs):
+    clock = FakeClock()
+    backend = LocalCacheBackend(clock=clock)
+    cache = PromptCache(backend, ttl_s=600, refresh_margin_s=60, min_chars=100, retry_after_s=300, clock=clock, **kwargs)
+    return cache, backend, clock
+
+
+def echo(prefix_text, config):
+    return prefix_text + "|dynamic"
+
+
+def test_prefix_is_registered_once_and_referenced_by_handle():
+    cache, backend, _ = make_cache()
+
+    first = cache.generate("gemini-2.5-flash", PREFIX, echo)
+    second = cache.generate("gemini-2.5-flash", PREFIX, echo)
+    cache.generate("gemini-2.5-flash-lite", PREFIX, echo)
+
+    # The local stand-in re-inserts the registered text, so the model sees the same prompt
+    assert first == second == PREFIX + "|dynamic"
+    assert backend.calls["create"] == 2  # once per model
+    metrics = cache.metrics()
+    assert metrics["created"] == 2 and metrics["hits"] == 3 and metrics["entries"] == 2
+
+
+def test_handle_is_refreshed_before_it_expires():
+    cache, backend, clock = make_cache()
+    handle = cache.handle("m", PREFIX)
+
+    clock.now += 550  # inside the 60 s refresh margin of a 600 s TTL
+    assert cache.handle("m", PREFIX) == handle
+    assert backend.calls == {"create": 1, "refresh": 1, "delete": 0}
+
+    clock.now += 500  # the refresh extended it
+    assert cache.handle("m", PREFIX) == handle
+    assert cache.metrics()["refreshed"] == 1
+
+
+def test_expired_handle_is_registered_again():
+    cache, backend, clock = make_cache()
+    handle = cache.handle("m", PREFIX)
+    clock.now += 601
+    assert cache.handle("m", PREFIX) != handle
+    assert backend.calls["create"] == 2
+
+
+def test_short_prefixes_and_disabled_cache_are_sent_inline():
+    cache, backend, _ = make_cache()
+    assert cache.generate("m", "short", echo) == "short|dynamic"
+    assert backend.calls["create"] == 0
+
+    disabled = PromptCache(None)
+    assert disabled.generate("m", PREFIX, echo) == PREFIX + "|dynamic"
+    assert disabled.metrics()["inline"] == 1
+
+
+def test_refused_prefix_falls_back_and_is_not_retried_immediately():
+    clock = FakeClock()
+    attempts = []
+
+    def refuse(model, prefix, ttl_s):
+        attempts.append(model)
+        raise ValueError("Cached content is too small")
+
+    backend = SimpleNamespace(name="gemini", create=refuse)
+    cache = PromptCache(backend, min_chars=100, retry_after_s=300, clock=clock)
+
+    assert cache.generate("m", PREFIX, echo) == PREFIX + "|dynamic"
+    assert cache.generate("m", PREFIX, echo) == PREFIX + "|dynamic"
+    assert len(attempts) == 1
+    clock.now += 301
+    cache.generate("m", PREFIX, echo)
+    assert len(attempts) == 2
+    assert cache.metrics()["create_errors"] == 2
+
+
+def test_missing_cached_content_retries_with_full_prompt_and_deletes_the_handle():
+    cache, backend, _ = make_cache()
+    backend.request = lambda handle, prefix: ("", {"cached_content": handle})
+    sent = []
+
+    def call(prefix_text, config):
+        sent.append((prefix_text, config))
+        if config:
+            raise APIError(404, "NOT_FOUND", "CachedContent not found (or permission denied)")
+        return "ok"
+
+    assert cache.generate("m", PREFIX, call) == "ok"
+    assert sent[0][0] == "" and sent[0][1]["cached_content"].startswith("cachedContents/")
+    assert sent[1] == (PREFIX, {})
+    assert cache.metrics()["fallbacks"] == 1 and cache.metrics()["entries"] == 0
+    assert backend.calls["delete"] == 1
+
+
+def test_other_errors_with_handle_are_raised_not_resent():
+    cache, backend, _ = make_cache()
+    backend.request = lambda handle, prefix: ("", {"cached_content": handle})
+    sent = []
+
+    errors = [APIError(429, "RESOURCE_EXHAUSTED", "Quota exceeded"),
+              APIError(400, "INVALID_ARGUMENT", "Request contains an invalid argument.")]
+
+    def call(prefix_text, config):
+        sent.append(config)
+        raise errors[len(sent) - 1]
+
+    for _ in errors:
+        with pytest.raises(APIError):
+            cache.generate("m", PREFIX, call)
+    # Each failure was sent once, with the handle
+    assert len(sent) == 2 and all(sent)
+    # The handle is still good and kept
+    assert cache.metrics()["entries"] == 1 and cache.metrics()["fallbacks"] == 0
+    assert backend.calls["delete"] == 0
+
+
+def test_missing_cache_errors_are_recognised():
+    assert is_missing_cache_error(APIError(404, "NOT_FOUND", "not found"))
+    assert is_missing_cache_error(APIError(400, "INVALID_ARGUMENT", "Cached content has expired"))
+    assert not is_missing_cache_error(APIError(400, "INVALID_ARGUMENT", "Unsupported MIME type"))
+    assert not is_missing_cache_error(APIError(503, "UNAVAILABLE", "overloaded"))
+    assert not is_missing_cache_error(TimeoutError("timed out"))
+
+
+def test_concurrent_first_calls_share_one_registration():
+    clock = FakeClock()
+    backend = LocalCacheBackend(clock=clock)
+    create = backend.create
+
+    def slow_create(model, prefix, ttl_s):
+        time.sleep(0.1)
+        return create(model, prefix, ttl_s)
+
+    backend.create = slow_create
+    cache = PromptCache(backend, min_chars=100, clock=clock)
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(cache.handle("m", PREFIX))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(handles)) == 1 and backend.calls["create"] == 1
+
+
+def test_get_prompt_cache_is_per_client():
+    a = get_prompt_cache("test-a", lambda: None, backend="local")
+    assert get_prompt_cache("test-a", lambda: None) is a
+    assert get_prompt_cache("test-b", lambda: None, backend="off") is not a
+    assert a.metrics()["backend"] == "local"
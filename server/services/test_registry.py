@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from server.services.registry import Registry
+
+
+def test_factory_runs_once_on_first_use():
+    registry = Registry()
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry.register("client", build)
+    assert not registry.is_loaded("client") and calls == []
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("client"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and all(r is results[0] for r in results)
+    assert registry.status()["client"]["loaded"]
+
+
+def test_missing_dependency_yields_none_and_errors_retry():
+    registry = Registry()
+
+    def missing():
+        raise ImportError("No module named 'playwright'")
+
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("GEMINI_API_KEY not found")
+        return "client"
+
+    registry.register("agent", missing)
+    registry.register("client", flaky)
+    assert registry.get("agent") is None
+    with pytest.raises(ValueError):
+        registry.get("client")
+    assert registry.get("client") == "client"
+
+
+def test_warm_up_builds_components_registered_during_warm_up():
+    registry = Registry()
+    registry.register("module", lambda: registry.register("client", lambda: "client") or "module")
+    registry.warm_up(background=False)
+    assert registry.is_loaded("module") and registry.is_loaded("client")
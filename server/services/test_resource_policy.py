@@ -0,0 +1,85 @@
+from server.services.resource_policy import CaptureMonitor, ResourcePolicy, site_of
+
+PAGE = "https://www.amazon.com/dp/B000TEST"
+
+
+def make_policy(**kwargs):
+    options = dict(enabled=True, block_types=["media", "font"], block_third_party_scripts=True,
+                   block_domains=["doubleclick.net", "google-analytics.com"],
+                   allow_domains={"amazon.com": ["media-amazon.com"]})
+    options.update(kwargs)
+    return ResourcePolicy(**options)
+
+
+def test_site_of_handles_country_second_level_domains():
+    assert site_of("www.shop.example.co.uk") == "example.co.uk"
+    assert site_of("m.media-amazon.com") == "media-amazon.com"
+
+
+def test_ads_media_fonts_and_third_party_scripts_are_blocked():
+    policy = make_policy()
+
+    assert policy.decide("https://stats.g.doubleclick.net/x.gif", "image", PAGE) == "blocked_domain"
+    assert policy.decide("https://www.amazon.com/video.mp4", "media", PAGE) == "media"
+    assert policy.decide("https://fonts.example.net/a.woff2", "font", PAGE) == "font"
+    assert policy.decide("https://cdn.widgets.example/w.js", "script", PAGE) == "third_party_script"
+
+
+def test_product_images_and_allow_listed_scripts_load():
+    policy = make_policy()
+
+    assert policy.decide(PAGE, "document", PAGE) is None
+    assert policy.decide("https://m.media-amazon.com/images/I/product.jpg", "image", PAGE) is None
+    assert policy.decide("https://m.media-amazon.com/js/app.js", "script", PAGE) is None
+    assert policy.decide("https://www.amazon.com/js/app.js", "script", PAGE) is None
+    # The allow-list is per site: the same CDN counts as third-party elsewhere
+    assert policy.decide("https://m.media-amazon.com/js/app.js", "script", "https://www.etsy.com/listing/1") \
+        == "third_party_script"
+
+
+def test_disabled_policy_blocks_nothing():
+    assert make_policy(enabled=False).decide("https://stats.g.doubleclick.net/x.gif", "image", PAGE) is None
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = FakeRequest(url, resource_type)
+        self.outcome = None
+
+    def abort(self, error_code=None):
+        self.outcome = "aborted"
+
+    def continue_(self):
+        self.outcome = "continued"
+
+
+class FakeResponse:
+    def __init__(self, length):
+        self.headers = {"content-length": str(length)} if length is not None else {}
+
+
+def test_monitor_aborts_routes_and_counts_bytes_per_capture():
+    monitor = CaptureMonitor(make_policy())
+    monitor.reset(PAGE)
+    routes = [FakeRoute(PAGE, "document"), FakeRoute("https://www.google-analytics.com/collect", "xhr")]
+    for route in routes:
+        monitor.on_request(route.request)
+        monitor.handle_route(route)
+    monitor.on_response(FakeResponse(5000))
+    monitor.on_response(FakeResponse(None))
+    monitor.navigated()
+
+    assert [r.outcome for r in routes] == ["continued", "aborted"]
+    summary = monitor.summary()
+    assert summary["requests"] == 2 and summary["blocked"] == 1
+    assert summary["blocked_by_reason"] == {"blocked_domain": 1}
+    assert summary["bytes"] == 5000 and summary["navigation_ms"] is not None
+
+    monitor.reset("https://www.etsy.com/listing/1")
+    assert monitor.summary()["requests"] == 0 and monitor.summary()["bytes"] == 0
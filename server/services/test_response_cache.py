@@ -0,0 +1,45 @@
+import gzip
+
+from server.services.response_cache import ResponseCache
+
+
+def test_put_and_get_precompresses_large_bodies():
+    cache = ResponseCache(gzip_min_bytes=100)
+    body = b'{"links":[' + b'{"link":"https://example.com"},' * 50 + b'{}]}'
+    cache.put("abc", body)
+
+    entry = cache.get("abc")
+    assert entry.body == body
+    assert gzip.decompress(entry.gzip_body) == body
+    assert entry.etag == ResponseCache.etag_for(body)
+    assert entry.gzip_etag != entry.etag
+    assert cache.get("missing") is None
+    assert cache.metrics()["hits"] == 1 and cache.metrics()["misses"] == 1
+
+
+def test_small_bodies_are_not_compressed():
+    cache = ResponseCache(gzip_min_bytes=100)
+    assert cache.put("abc", b'{"a":1}').gzip_body is None
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ResponseCache(max_bytes=250, gzip_min_bytes=10_000)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    cache.get("a")
+    cache.put("c", b"c" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.metrics()["bytes"] == 200
+
+
+def test_put_replaces_and_invalidate_removes():
+    cache = ResponseCache()
+    cache.put("a", b"old")
+    cache.put("a", b"new")
+    assert cache.get("a").body == b"new"
+    assert cache.metrics()["bytes"] == 3
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.metrics()["bytes"] == 0
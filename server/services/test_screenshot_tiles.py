@@ -0,0 +1,67 @@
+import os
+import threading
+import tracemalloc
+from io import BytesIO
+
+from PIL import Image
+
+from server.services.screenshot_tiles import load_screenshot, split_and_store
+from server.services.tile_filter import TileFilter
+
+
+def noisy_screenshot(width=640, height=2400) -> bytes:
+    # Noise does not compress, like the photo-heavy pages that made base64 results expensive
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def test_tiles_are_references_that_load_on_demand(make_store):
+    store, _ = make_store()
+    png = noisy_screenshot(height=800)
+    result = split_and_store(png, store, TileFilter(), "chair", "https://shop.example/p/1")
+
+    tile = result["screenshots"][0]
+    assert "screenshot_base64" not in tile
+    assert tile["width"] == 640 and tile["height"] == 800 and tile["screenshot_size_bytes"] > 0
+    with Image.open(BytesIO(load_screenshot(tile, store))) as loaded:
+        assert loaded.size == (640, 800)
+
+
+def test_concurrent_split_results_hold_references_not_tile_bytes(make_store):
+    """
+    Runs split_and_store (the tiling step of the search agent) concurrently,
+    not whole requests through the product route.
+
+    tracemalloc only sees memory allocated through Python's allocator: the
+    encoded PNG tiles, base64 strings and result dicts. Pillow's decoded
+    pixel buffers are not traced, so ``peak`` bounds the Python-level copies
+    of encoded tile bytes, not the process's peak memory.
+    """
+    store, _ = make_store()
+    png = noisy_screenshot()
+    requests = 4
+    results = [None] * requests
+
+    def handle(index):
+        # Separate sites, so the domain-level duplicate filter keeps every tile
+        results[index] = split_and_store(png, store, TileFilter(), "chair", f"https://shop{index}.example/p/1")
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        threads = [threading.Thread(target=handle, args=(i,)) for i in range(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert all(r and r["screenshots"] for r in results)
+    # What the requests keep alive is a few KB of references, not megabytes of base64
+    assert current - baseline < 64 * 1024 * requests
+    # Encoded tile bytes held at once stay under three copies of each screenshot per call
+    assert peak - baseline < 3 * len(png) * requests
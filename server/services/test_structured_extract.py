@@ -0,0 +1,113 @@
+import json
+
+from server.services.structured_extract import analyze_extraction, extract_product, is_complete, is_sufficient
+
+JSON_LD_PAGE = """
+<html><head>
+<meta property="og:title" content="OG title">
+<script type="application/ld+json">%s</script>
+</head><body>
+<nav><a href="/">Home</a><a href="/shoes">Shoes</a></nav>
+<h1>Trail Runner 2</h1>
+<div id="details">
+  <ul>
+    <li>Lightweight trail shoe with a recycled mesh upper, EVA midsole and rubber outsole.</li>
+    <li>Item Weight: 310 g per shoe, measured for a men's size 9.</li>
+  </ul>
+</div>
+<footer>Free shipping on orders over $50, returns within 30 days.</footer>
+</body></html>
+""" % json.dumps({
+    "@context": "https://schema.org",
+    "@graph": [
+        {"@type": "BreadcrumbList", "name": "Shoes"},
+        {
+            "@type": "Product",
+            "name": "Trail Runner 2",
+            "brand": {"@type": "Brand", "name": "Acme"},
+            "material": ["Recycled polyester", "Rubber"],
+            "offers": {"@type": "Offer", "price": 129.99, "priceCurrency": "USD",
+                       "availability": "https://schema.org/InStock"},
+            "aggregateRating": {"ratingValue": 4.6, "reviewCount": 212},
+        },
+    ],
+})
+
+MICRODATA_PAGE = """
+<html><body>
+<div itemscope itemtype="https://schema.org/Product">
+  <h1 itemprop="name">Oak Side Table</h1>
+  <div itemprop="brand" itemscope itemtype="https://schema.org/Brand"><span itemprop="name">Woodco</span></div>
+  <div itemprop="offers" itemscope itemtype="https://schema.org/Offer">
+    <span itemprop="price" content="89.00">$89</span><meta itemprop="priceCurrency" content="USD">
+  </div>
+  <table><tr><th>Material</th><td>Material: Solid oak, water-based lacquer</td></tr>
+  <tr><th>Size</th><td>Dimensions: 45 x 45 x 55 cm</td></tr></table>
+</div>
+</body></html>
+"""
+
+
+def test_json_ld_product_in_graph_is_extracted():
+    extraction = extract_product(JSON_LD_PAGE, url="https://shop.example/p/1")
+    fields = extraction["fields"]
+
+    assert fields["name"] == "Trail Runner 2"
+    assert fields["brand"] == "Acme"
+    assert fields["price"] == "129.99 USD"
+    assert fields["materials"] == "Recycled polyester, Rubber"
+    assert fields["availability"] == "InStock"
+    assert fields["rating"] == "4.6/5 (212 reviews)"
+    assert extraction["sources"]["name"] == "json_ld"
+    # Weight only appears in the page text
+    assert fields["weight"] == "310 g"
+    assert extraction["sources"]["weight"] == "text"
+    assert is_complete(fields)
+
+
+def test_main_text_drops_navigation_and_footer():
+    text = extract_product(JSON_LD_PAGE)["text"]
+
+    assert text.startswith("Trail Runner 2")
+    assert "recycled mesh upper" in text
+    assert "Home" not in text and "Free shipping" not in text
+
+
+def test_microdata_ignores_nested_brand_name():
+    fields = extract_product(MICRODATA_PAGE)["fields"]
+
+    assert fields["name"] == "Oak Side Table"
+    assert fields["brand"] == "Woodco"
+    assert fields["price"] == "89.00 USD"
+    assert fields["materials"].startswith("Solid oak")
+    assert fields["dimensions"] == "45 x 45 x 55 cm"
+
+
+def test_complete_fields_skip_the_llm():
+    def llm(prompt, **kwargs):
+        raise AssertionError("the LLM should not be called")
+
+    result = analyze_extraction(extract_product(JSON_LD_PAGE), llm=llm)
+
+    assert result["success"] and not result["llm_used"]
+    assert "Materials: Recycled polyester, Rubber" in result["analysis"]
+
+
+def test_incomplete_fields_send_compact_text_to_the_llm():
+    prompts = []
+
+    def llm(prompt, **kwargs):
+        prompts.append(prompt)
+        return "analysis"
+
+    extraction = {"fields": {"name": "Mug"}, "sources": {"name": "meta"}, "text": "Stoneware mug, 350 ml."}
+    result = analyze_extraction(extraction, product_name="mug", llm=llm)
+
+    assert result["analysis"] == "analysis" and result["llm_used"]
+    assert "Stoneware mug" in prompts[0] and "Product Name: Mug" in prompts[0]
+
+
+def test_thin_pages_are_not_sufficient():
+    assert not is_sufficient({"fields": {"name": "Mug"}, "text": "Add to cart"})
+    assert not is_sufficient({"fields": {}, "text": "x" * 5000})
+    assert is_sufficient({"fields": {"name": "Mug"}, "text": "x" * 500}, min_text_chars=400)
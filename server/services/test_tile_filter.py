@@ -0,0 +1,45 @@
+from PIL import Image, ImageDraw
+
+from server.services.tile_filter import TileFilter, dhash, hamming
+
+
+def content_tile(seed, size=(960, 400)):
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for i in range(12):
+        x = (seed * 97 + i * 131) % (size[0] - 200)
+        y = (seed * 53 + i * 71) % (size[1] - 60)
+        draw.rectangle((x, y, x + 150 + seed * 7 % 50, y + 40), fill=(seed * 37 + i * 19) % 200)
+    return image
+
+
+def test_dhash_is_stable_under_resize():
+    tile = content_tile(1)
+    assert hamming(dhash(tile), dhash(tile.resize((480, 200)))) <= 4
+    assert hamming(dhash(tile), dhash(content_tile(2))) > 4
+
+
+def test_blank_and_repeated_tiles_are_dropped():
+    tile_filter = TileFilter()
+    blank = Image.new("L", (960, 400), 250)
+    tiles = [(content_tile(1), 100), (blank, 10), (content_tile(2), 100), (content_tile(2), 100)]
+
+    decisions = tile_filter.filter(tiles, domain="shop.example", url="https://shop.example/a")
+
+    assert [reason for _, reason in decisions] == ["kept", "blank", "kept", "duplicate_page"]
+    metrics = tile_filter.metrics()
+    assert metrics["skipped_blank"] == 1 and metrics["skipped_duplicate_page"] == 1
+    assert metrics["bytes_saved"] == 110
+
+
+def test_boilerplate_from_other_pages_of_the_domain_is_dropped():
+    tile_filter = TileFilter()
+    footer = content_tile(9)
+    tile_filter.filter([(content_tile(1), 1), (footer, 1)], domain="shop.example", url="https://shop.example/a")
+
+    other_page = tile_filter.filter([(content_tile(3), 1), (footer, 1)], domain="shop.example", url="https://shop.example/b")
+    assert [reason for _, reason in other_page] == ["kept", "duplicate_domain"]
+
+    # Re-analysing the first page is not affected by its own earlier tiles
+    same_page = tile_filter.filter([(content_tile(1), 1), (footer, 1)], domain="shop.example", url="https://shop.example/a")
+    assert all(keep for keep, _ in same_page)
@@ -0,0 +1,27 @@
+from server.services.tiling import capture_height, plan_tiles
+
+
+def test_short_page_is_one_tile():
+    assert plan_tiles(900, 1920, pixel_budget=1920 * 1600) == [(0, 900)]
+
+
+def test_tall_page_gets_even_overlapping_tiles_within_budget():
+    tiles = plan_tiles(6000, 1920, pixel_budget=1920 * 1600, overlap=80, max_tiles=10)
+
+    assert tiles[0][0] == 0 and tiles[-1][1] == 6000
+    assert len(tiles) == 4
+    heights = [bottom - top for top, bottom in tiles]
+    assert max(heights) <= 1600 and max(heights) - min(heights) <= 1
+    for (_, prev_bottom), (top, _) in zip(tiles, tiles[1:]):
+        assert prev_bottom - top == 80
+
+
+def test_tile_count_is_capped():
+    tiles = plan_tiles(12000, 1920, pixel_budget=1920 * 1000, overlap=0, max_tiles=5)
+    assert len(tiles) == 5 and tiles[-1][1] == 12000
+
+
+def test_capture_height_clips_at_reviews_and_total_cap():
+    assert capture_height(20000, reviews_top=3000, max_total_height=12000, reviews_margin=1000) == 4000
+    assert capture_height(20000, reviews_top=None, max_total_height=12000) == 12000
+    assert capture_height(20000, reviews_top=3000, max_total_height=12000, clip_at_reviews=False) == 12000
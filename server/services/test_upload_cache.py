@@ -0,0 +1,68 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from server.services.upload_cache import UploadCache
+
+
+def fake_uploader(expires_in=timedelta(hours=48), delay=0.0):
+    calls = []
+
+    def upload(data, mime_type):
+        calls.append(data)
+        time.sleep(delay)
+        return SimpleNamespace(name=f"files/{len(calls)}", expiration_time=datetime.now(timezone.utc) + expires_in)
+
+    return upload, calls
+
+
+def test_identical_content_is_uploaded_once():
+    cache = UploadCache()
+    upload, calls = fake_uploader()
+
+    first = cache.get_or_upload(b"tile", "image/webp", upload)
+    second = cache.get_or_upload(b"tile", "image/webp", upload)
+    other = cache.get_or_upload(b"other tile", "image/webp", upload)
+
+    assert first is second and other is not first
+    assert len(calls) == 2
+    assert cache.metrics()["hits"] == 1
+
+
+def test_handles_close_to_expiry_are_uploaded_again():
+    cache = UploadCache(expiry_margin_s=600)
+    upload, calls = fake_uploader(expires_in=timedelta(minutes=5))
+    cache.get_or_upload(b"tile", "image/webp", upload)
+    cache.get_or_upload(b"tile", "image/webp", upload)
+    assert len(calls) == 2
+    assert cache.metrics()["expired"] == 1
+
+
+def test_concurrent_requests_share_one_upload():
+    cache = UploadCache()
+    upload, calls = fake_uploader(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_upload(b"tile", "image/png", upload)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_failed_upload_is_not_cached():
+    cache = UploadCache()
+
+    def broken(data, mime_type):
+        raise RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_upload(b"tile", "image/png", broken)
+    upload, calls = fake_uploader()
+    cache.get_or_upload(b"tile", "image/png", upload)
+    assert len(calls) == 1
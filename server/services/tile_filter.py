@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageStat
+
+# Tiles whose greyscale entropy (bits) or standard deviation fall below these carry no information
+TILE_MIN_ENTROPY = float(os.getenv("TILE_MIN_ENTROPY", 1.0))
+TILE_MIN_STDDEV = float(os.getenv("TILE_MIN_STDDEV", 6.0))
+# Tiles whose 64-bit dHashes differ in at most this many bits are treated as duplicates
+TILE_DUP_DISTANCE = int(os.getenv("TILE_DUP_DISTANCE", 4))
+# Hashes remembered per domain, and how many domains are tracked
+TILE_RECENT_PER_DOMAIN = int(os.getenv("TILE_RECENT_PER_DOMAIN", 64))
+TILE_RECENT_DOMAINS = int(os.getenv("TILE_RECENT_DOMAINS", 256))
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 greyscale thumbnail."""
+    small = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def information(image: Image.Image) -> Tuple[float, float]:
+    """``(entropy, stddev)`` of a downscaled greyscale copy of the tile."""
+    grey = image.convert("L")
+    grey.thumbnail((320, 320))
+    return grey.entropy(), ImageStat.Stat(grey).stddev[0]
+
+
+class TileFilter:
+    """
+    Drops screenshot tiles that are not worth sending to the vision model:
+    blank tiles (whitespace, solid footers), tiles that repeat an earlier tile
+    of the same page, and tiles seen recently on a *different* page of the
+    same domain (shared headers, footers and carousels). Re-analysing the same
+    URL is not affected by its own earlier tiles, and the first tile of a page
+    (title and price) is always kept.
+    """
+
+    def __init__(self, min_entropy: float = TILE_MIN_ENTROPY, min_stddev: float = TILE_MIN_STDDEV,
+                 max_distance: int = TILE_DUP_DISTANCE, recent_per_domain: int = TILE_RECENT_PER_DOMAIN,
+                 max_domains: int = TILE_RECENT_DOMAINS):
+        self.min_entropy = min_entropy
+        self.min_stddev = min_stddev
+        self.max_distance = max_distance
+        self.recent_per_domain = recent_per_domain
+        self.max_domains = max_domains
+
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, deque]" = OrderedDict()  # domain -> deque of (hash, url)
+        self._metrics = {
+            "tiles_seen": 0,
+            "tiles_kept": 0,
+            "skipped_blank": 0,
+            "skipped_duplicate_page": 0,
+            "skipped_duplicate_domain": 0,
+            "bytes_saved": 0,
+        }
+
+    def _seen_on_other_page(self, domain: str, url: Optional[str], value: int) -> bool:
+        # Caller holds self._lock
+        for other, other_url in self._recent.get(domain, ()):
+            if other_url != url and hamming(value, other) <= self.max_distance:
+                return True
+        return False
+
+    def filter(self, tiles: List[Tuple[Image.Image, int]], domain: Optional[str] = None,
+               url: Optional[str] = None) -> List[Tuple[bool, str]]:
+        """
+        Decide for each ``(image, size_bytes)`` tile of one page whether to keep
+        it. Returns ``(keep, reason)`` per tile, reason being "kept", "blank",
+        "duplicate_page" or "duplicate_domain". Kept tiles are remembered for
+        ``domain``.
+        """
+        decisions = []
+        kept_hashes = []
+        for index, (image, size_bytes) in enumerate(tiles):
+            entropy, stddev = information(image)
+            value = dhash(image)
+            if index == 0:
+                reason = "kept"
+            elif entropy < self.min_entropy or stddev < self.min_stddev:
+                reason = "blank"
+            elif any(hamming(value, other) <= self.max_distance for other in kept_hashes):
+                reason = "duplicate_page"
+            else:
+                with self._lock:
+                    reason = "duplicate_domain" if domain and self._seen_on_other_page(domain, url, value) else "kept"
+            if reason == "kept":
+                kept_hashes.append(value)
+            decisions.append((reason == "kept", reason))
+
+            with self._lock:
+                self._metrics["tiles_seen"] += 1
+                if reason == "kept":
+                    self._metrics["tiles_kept"] += 1
+                else:
+                    self._metrics[f"skipped_{reason}"] += 1
+                    self._metrics["bytes_saved"] += size_bytes
+
+        if domain:
+            with self._lock:
+                ring = self._recent.pop(domain, None) or deque(maxlen=self.recent_per_domain)
+                # Replace this URL's previous entries so re-analysis stays unaffected
+                for item in [item for item in ring if item[1] == url]:
+                    ring.remove(item)
+                ring.extend((value, url) for value in kept_hashes)
+                self._recent[domain] = ring
+                while len(self._recent) > self.max_domains:
+                    self._recent.popitem(last=False)
+        return decisions
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self._metrics)
+
+
+_default_filter = None
+_default_lock = threading.Lock()
+
+
+def get_tile_filter() -> TileFilter:
+    """Process-wide filter, so recent hashes are shared across requests."""
+    global _default_filter
+    if _default_filter is None:
+        with _default_lock:
+            if _default_filter is None:
+                _default_filter = TileFilter()
+    return _default_filter
@@ -0,0 +1,75 @@
+import math
+import os
+from typing import List, Optional, Tuple
+
+# Target pixels per tile (width x height); 1920 x 1600 by default
+TILE_PIXEL_BUDGET = int(os.getenv("TILE_PIXEL_BUDGET", 1920 * 1600))
+TILE_MIN_HEIGHT = int(os.getenv("TILE_MIN_HEIGHT", 600))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", 80))
+# Never capture more than this many pixels of page height
+TILE_MAX_TOTAL_HEIGHT = int(os.getenv("TILE_MAX_TOTAL_HEIGHT", 12000))
+TILE_MAX_TILES = int(os.getenv("TILE_MAX_TILES", 8))
+# Stop shortly after the start of the reviews section (the margin keeps the rating summary)
+TILE_CLIP_AT_REVIEWS = os.getenv("TILE_CLIP_AT_REVIEWS", "true").lower() == "true"
+TILE_REVIEWS_MARGIN = int(os.getenv("TILE_REVIEWS_MARGIN", 1200))
+
+# Evaluated in the page: document offset of the first reviews section that is below the fold, or null
+REVIEWS_TOP_JS = """
+(minTop) => {
+    const selectors = [
+        '#reviewsMedley', '#customerReviews', '#cm-cr-dp-review-list', '#reviews',
+        '[data-hook="reviews-medley-footer"]', '[data-testid="reviews-section"]',
+        '[data-test="reviews-section"]', '[itemprop="review"]', 'section[id*="review" i]',
+    ];
+    let best = null;
+    for (const selector of selectors) {
+        for (const el of document.querySelectorAll(selector)) {
+            const top = el.getBoundingClientRect().top + window.scrollY;
+            if (top >= minTop && (best === null || top < best)) best = top;
+        }
+    }
+    return best === null ? null : Math.round(best);
+}
+"""
+
+
+def capture_height(page_height: int, reviews_top: Optional[int] = None,
+                   max_total_height: int = TILE_MAX_TOTAL_HEIGHT, clip_at_reviews: bool = TILE_CLIP_AT_REVIEWS,
+                   reviews_margin: int = TILE_REVIEWS_MARGIN) -> int:
+    """Height of the page region worth capturing."""
+    height = page_height
+    if clip_at_reviews and reviews_top:
+        height = min(height, reviews_top + reviews_margin)
+    if max_total_height and max_total_height > 0:
+        height = min(height, max_total_height)
+    return max(1, height)
+
+
+def plan_tiles(height: int, width: int, pixel_budget: int = TILE_PIXEL_BUDGET, overlap: int = TILE_OVERLAP,
+               min_tile_height: int = TILE_MIN_HEIGHT, max_tiles: int = TILE_MAX_TILES) -> List[Tuple[int, int]]:
+    """
+    Split ``height`` pixels into evenly sized ``(top, bottom)`` tiles of at
+    most ``pixel_budget`` pixels each (never shorter than ``min_tile_height``
+    unless the page is), with ``overlap`` pixels shared between neighbours so
+    text cut by a boundary appears whole in one of them. If more than
+    ``max_tiles`` tiles would be needed they are made taller instead.
+    """
+    if height <= 0 or width <= 0:
+        return []
+    target = max(min_tile_height, pixel_budget // width)
+    if height <= target:
+        return [(0, height)]
+
+    overlap = max(0, min(overlap, target // 2))
+    count = math.ceil((height - overlap) / (target - overlap))
+    count = max(1, min(count, max_tiles))
+    # Spread the page evenly over `count` tiles instead of leaving a short last one
+    tile_height = math.ceil((height + (count - 1) * overlap) / count)
+    step = tile_height - overlap
+
+    tiles = []
+    for index in range(count):
+        top = index * step
+        bottom = height if index == count - 1 else min(height, top + tile_height)
+        tiles.append((top, bottom))
+    return tiles
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+# Gemini keeps uploaded files for 48 hours; stop reusing a handle this long before it expires
+UPLOAD_EXPIRY_MARGIN_S = float(os.getenv("UPLOAD_EXPIRY_MARGIN_S", 600))
+UPLOAD_DEFAULT_TTL_S = float(os.getenv("UPLOAD_DEFAULT_TTL_S", 47 * 3600))
+UPLOAD_CACHE_MAX_ENTRIES = int(os.getenv("UPLOAD_CACHE_MAX_ENTRIES", 2048))
+
+
+def content_key(data: bytes, mime_type: str) -> str:
+    return hashlib.sha256(mime_type.encode("utf-8") + b"\0" + data).hexdigest()
+
+
+def _expiry_of(handle, default_ttl_s: float) -> datetime:
+    expires = getattr(handle, "expiration_time", None)
+    if isinstance(expires, datetime):
+        return expires if expires.tzinfo else expires.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) + timedelta(seconds=default_ttl_s)
+
+
+class UploadCache:
+    """
+    Remembers uploaded file handles by content hash until shortly before their
+    server-side expiry, so identical images are uploaded once. Concurrent
+    requests for the same content wait for a single upload instead of racing.
+    """
+
+    def __init__(self, max_entries: int = UPLOAD_CACHE_MAX_ENTRIES, expiry_margin_s: float = UPLOAD_EXPIRY_MARGIN_S,
+                 default_ttl_s: float = UPLOAD_DEFAULT_TTL_S):
+        self.max_entries = max_entries
+        self.expiry_margin_s = expiry_margin_s
+        self.default_ttl_s = default_ttl_s
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (handle, expires_at)
+        self._inflight = {}  # key -> threading.Event
+        self._metrics = {"hits": 0, "uploads": 0, "upload_errors": 0, "expired": 0, "bytes_uploaded": 0, "bytes_skipped": 0}
+
+    def _lookup(self, key: str):
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        handle, expires_at = entry
+        if expires_at - timedelta(seconds=self.expiry_margin_s) <= datetime.now(timezone.utc):
+            del self._entries[key]
+            self._metrics["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return handle
+
+    def get_or_upload(self, data: bytes, mime_type: str, upload: Callable[[bytes, str], object]):
+        """Return a live handle for ``data``, calling ``upload(data, mime_type)`` only when needed."""
+        key = content_key(data, mime_type)
+        while True:
+            with self._lock:
+                handle = self._lookup(key)
+                if handle is not None:
+                    self._metrics["hits"] += 1
+                    self._metrics["bytes_skipped"] += len(data)
+                    return handle
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    done = threading.Event()
+                    self._inflight[key] = done
+                    break
+            # Another thread is uploading the same bytes; use its result (or retry if it failed)
+            waiter.wait()
+
+        try:
+            handle = upload(data, mime_type)
+        except Exception:
+            with self._lock:
+                self._metrics["upload_errors"] += 1
+            raise
+        else:
+            with self._lock:
+                self._metrics["uploads"] += 1
+                self._metrics["bytes_uploaded"] += len(data)
+                self._entries[key] = (handle, _expiry_of(handle, self.default_ttl_s))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return handle
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def invalidate(self, data: bytes, mime_type: str) -> None:
+        with self._lock:
+            self._entries.pop(content_key(data, mime_type), None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            out = dict(self._metrics)
+            out["entries"] = len(self._entries)
+        return out
@@ -1,4 +1,15 @@
 const STORAGE_KEY = 'carbon0_cart';
+const SESSION_KEY = 'carbon0_session';
+
+// Stable per-browser id so the server can keep a per-session savings tally
+function getSessionId() {
+  let sessionId = localStorage.getItem(SESSION_KEY);
+  if (!sessionId) {
+    sessionId = Date.now().toString(36) + Math.random().toString(36).substr(2, 9);
+    localStorage.setItem(SESSION_KEY, sessionId);
+  }
+  return sessionId;
+}
 
 let cartData = [];
 
@@ -207,7 +218,7 @@ async function finishCheckout() {
       headers: {
         'Content-Type': 'application/json'
       },
-      body: JSON.stringify({ amount: totalCO2Saved })
+      body: JSON.stringify({ amount: totalCO2Saved, session: getSessionId() })
     });
     const data = await response.json();
     if (response.ok) {
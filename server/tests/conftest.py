@@ -0,0 +1,37 @@
+import sys
+
+import pytest
+
+from server import database
+
+
+@pytest.fixture
+def sample_products():
+    return [
+        {"sku": "A-1", "name": "Cotton Tee", "category": "tshirts", "brand": "Loom",
+         "price": 12.5, "cf_value": 4.0, "cf_detail": "material 3.0, transport 1.0 " * 50},
+        {"sku": "A-2", "name": "Hemp Tee", "category": "tshirts", "brand": "Hempco",
+         "price": 20.0, "cf_value": 2.5, "cf_detail": None},
+        {"sku": "B-1", "name": "Trail Shoe", "category": "shoes_and_sneakers", "brand": "Loom",
+         "price": 80.0, "cf_value": 9.0, "cf_detail": "rubber sole " * 20},
+        {"sku": "B-2", "name": "Unknown", "category": "shoes_and_sneakers", "brand": None,
+         "price": None, "cf_value": None, "cf_detail": None},
+    ]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """An initialised, empty SQLite database in tmp_path; yields the database module."""
+    path = str(tmp_path / "test.db")
+    # The utility scripts import the module as top-level ``database``, so it can be loaded twice
+    for module in {database, sys.modules.get("database")} - {None}:
+        monkeypatch.setattr(module, "DB_PATH", path)
+    database.init_db()
+    return database
+
+
+@pytest.fixture
+def products_db(db, sample_products):
+    """``db`` holding ``sample_products``."""
+    db.insert_products(sample_products)
+    return db
@@ -0,0 +1,78 @@
+import pytest
+
+
+def test_cf_detail_is_stored_out_of_row(products_db, sample_products):
+    db = products_db
+    products = db.get_all_products()
+    assert products and all("cf_detail" not in p for p in products)
+
+    assert db.get_cf_detail("A-1") == sample_products[0]["cf_detail"]
+    assert db.get_cf_detail("A-2") is None
+    full = db.get_product_by_sku("B-1", include_detail=True)
+    assert full["cf_detail"] == "rubber sole " * 20
+
+    # re-inserting a product replaces its detail rather than leaving an orphan
+    db.insert_product(dict(sample_products[2], cf_detail="updated"))
+    assert db.get_cf_detail("B-1") == "updated"
+    conn = db.get_connection()
+    orphans = conn.execute(
+        "SELECT COUNT(*) FROM product_details WHERE product_id NOT IN (SELECT id FROM products)").fetchone()[0]
+    conn.close()
+    assert orphans == 0
+
+
+def test_cf_detail_is_compressed(db):
+    text = "material 3.0, transport 1.0 " * 50
+    codec, blob = db.encode_cf_detail(text)
+    if db.zstandard is not None:
+        assert codec == "zstd" and len(blob) < len(text) / 5
+    assert db.decode_cf_detail(codec, blob) == text
+    assert db.decode_cf_detail("raw", "plain".encode("utf-8")) == "plain"
+
+
+def test_inline_cf_detail_is_migrated(db):
+    conn = db.get_connection()
+    with conn:
+        conn.execute("INSERT INTO products (sku, name, cf_detail) VALUES ('D-OLD', 'Legacy row', 'inline detail')")
+    conn.close()
+
+    db.init_db()
+
+    conn = db.get_connection()
+    inline = conn.execute("SELECT cf_detail FROM products WHERE sku = 'D-OLD'").fetchone()[0]
+    conn.close()
+    assert inline is None
+    assert db.get_cf_detail("D-OLD") == "inline detail"
+
+
+def test_dictionary_compression_round_trip(products_db, sample_products, tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    db = products_db
+    # The loaded dictionary is cached per process; give the test its own cache
+    monkeypatch.setattr(db, "_codec_cache", {})
+    db.insert_products([
+        {"sku": f"DICT-{i}", "name": f"Item {i}",
+         "cf_detail": f"=== Category decision (LLM) ===\nItem {i} matched category {i % 7}.\n"
+                      f"Material: cotton weight {i / 10:.2f} kg, emission factor {i % 5 + 1}.0 kgCO2e/kg\n"
+                      f"Transport: {i * 37 % 9000} km by ship, packaging {i % 3 / 10:.2f} kg"}
+        for i in range(300)
+    ])
+    dict_path = str(tmp_path / "cf_detail.dict")
+    db.train_cf_detail_dictionary(dict_path, dict_size=4096)
+    monkeypatch.setattr(db, "CF_DETAIL_DICT_PATH", dict_path)
+
+    db.insert_product({"sku": "DICT-NEW", "name": "New", "cf_detail": "Item new matched category 3."})
+    conn = db.get_connection()
+    codec = conn.execute("SELECT codec FROM product_details WHERE product_id = "
+                         "(SELECT id FROM products WHERE sku = 'DICT-NEW')").fetchone()[0]
+    conn.close()
+    assert codec.startswith("zstd-dict:")
+    assert db.get_cf_detail("DICT-NEW") == "Item new matched category 3."
+    # Details written before the dictionary existed still decode
+    assert db.get_cf_detail("A-1") == sample_products[0]["cf_detail"]
+
+    # Without the dictionary a dictionary-coded detail cannot be read, and says so
+    monkeypatch.setattr(db, "CF_DETAIL_DICT_PATH", None)
+    db._codec_cache.clear()
+    with pytest.raises(RuntimeError):
+        db.get_cf_detail("DICT-NEW")
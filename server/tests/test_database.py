@@ -0,0 +1,27 @@
+import pytest
+
+
+def test_query_products_projection_and_filters(products_db):
+    rows = products_db.query_products(columns=("sku", "cf_value"), category="tshirts", order_by="-cf_value")
+    assert rows == [{"sku": "A-1", "cf_value": 4.0}, {"sku": "A-2", "cf_value": 2.5}]
+
+    rows = products_db.query_products(columns=("sku",), brand=["Loom"], cf_max=5.0, output="tuple")
+    assert rows == [("A-1",)]
+
+    rows = products_db.query_products(columns=("sku",), cf_min=3.0, order_by="sku", limit=1, output="tuple")
+    assert rows == [("A-1",)]
+
+    try:
+        products_db.query_products(columns=("sku", "cf_value; DROP TABLE products"))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown columns must be rejected")
+
+
+def test_query_products_columnar(products_db):
+    np = pytest.importorskip("numpy")
+    cols = products_db.query_products(columns=("sku", "price", "cf_value"), order_by="sku", output="columns")
+    assert list(cols["sku"]) == ["A-1", "A-2", "B-1", "B-2"]
+    assert cols["cf_value"].dtype == np.float64
+    assert np.isnan(cols["price"][3])
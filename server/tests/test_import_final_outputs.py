@@ -0,0 +1,19 @@
+import json
+
+from server.utils import import_final_outputs
+
+
+def test_files_older_than_the_retention_window_survive_the_import(db, tmp_path):
+    directory = tmp_path / "legacy"
+    directory.mkdir()
+    output = {"product": {"name": "Legacy Tee", "url": "https://example.com/tee"}, "carbon": {"total": 4.2}}
+    (directory / "final_output_20251109_071930.json").write_text(json.dumps(output), encoding="utf-8")
+    (directory / "notes.json").write_text("{}", encoding="utf-8")
+
+    assert import_final_outputs.import_directory(str(directory), delete=True) == (1, 0)
+    assert sorted(p.name for p in directory.iterdir()) == ["notes.json"]
+    assert json.loads(db.get_final_output_body("final_output_20251109_071930")) == output
+
+    # Later writes prune by age; the imported row is not already past the cutoff
+    db.save_final_output({"product": {"name": "New"}})
+    assert db.get_final_output_body("final_output_20251109_071930") is not None
@@ -0,0 +1,90 @@
+import io
+import itertools
+import json
+
+import pytest
+
+from server.utils import insert_product
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Small chunks so values straddle chunk boundaries
+    monkeypatch.setattr(insert_product, "READ_CHUNK_SIZE", 32)
+
+
+def make_products(n, prefix="ING"):
+    return [{"sku": f"{prefix}-{i}", "name": f"Product {i} " + "x" * 40, "price": str(i), "cf_value": i / 2}
+            for i in range(n)]
+
+
+@pytest.fixture
+def write(tmp_path):
+    """Writes text to a new file in tmp_path and returns its path."""
+    paths = itertools.count()
+
+    def write(text):
+        path = tmp_path / f"input-{next(paths)}.json"
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+
+    return write
+
+
+def test_iter_records_reads_ndjson_with_skip_and_bad_lines(write):
+    lines = [json.dumps(p) for p in make_products(4)]
+    lines.insert(2, "{not json")
+    path = write("\n".join(lines[:2]) + "\n\n" + "\n".join(lines[2:]) + "\n")
+
+    records = list(insert_product.iter_records(path))
+    assert [index for index, _ in records] == [0, 1, 2, 3, 4]
+    assert records[2] == (2, None)  # counted as a failure, not dropped
+
+    skipped = list(insert_product.iter_records(path, skip=3))
+    assert [(index, value["sku"]) for index, value in skipped] == [(3, "ING-2"), (4, "ING-3")]
+
+
+def test_iter_records_reads_json_arrays_and_single_objects(write):
+    products = make_products(5)
+    path = write(json.dumps(products, indent=2))
+    assert [value for _, value in insert_product.iter_records(path)] == products
+    assert [index for index, _ in insert_product.iter_records(path, skip=3)] == [3, 4]
+
+    # A pretty-printed single object is not NDJSON; it falls back to the JSON reader
+    path = write(json.dumps(products[0], indent=2))
+    assert list(insert_product.iter_records(path)) == [(0, products[0])]
+
+    assert list(insert_product.iter_records(write("  \n"))) == []
+
+
+def test_malformed_array_fails_without_reading_the_rest():
+    text = json.dumps(make_products(2))[:-1] + ', {"sku": "BAD" "name": 1}, ' + json.dumps(make_products(2000))[1:]
+    stream = io.StringIO(text)
+    values = insert_product._iter_json_values(stream)
+    assert next(values)["sku"] == "ING-0"
+    assert next(values)["sku"] == "ING-1"
+    with pytest.raises(json.JSONDecodeError):
+        next(values)
+    assert stream.tell() < 1024 < len(text)
+
+
+def test_ingest_writes_checkpoints_and_resumes_from_offset(db, write):
+    products = make_products(25, prefix="CK")
+    products[7] = {"name": "no sku"}
+    path = write("\n".join(json.dumps(p) for p in products))
+    checkpoint = insert_product.checkpoint_path_for(path)
+
+    stats = insert_product.ingest(path, batch_size=10, workers=0, offset=0, checkpoint_path=checkpoint)
+    assert (stats["inserted"], stats["failed"], stats["offset"]) == (24, 1, 25)
+    assert insert_product.read_checkpoint(checkpoint) == 25
+
+    # Resuming part-way imports only the remaining records
+    insert_product.write_checkpoint(checkpoint, 20)
+    stats = insert_product.ingest(path, batch_size=10, workers=0,
+                                  offset=insert_product.read_checkpoint(checkpoint), checkpoint_path=checkpoint)
+    assert (stats["seen"], stats["offset"]) == (5, 25)
+
+    rows = db.query_products(columns=("sku", "price"), order_by="sku")
+    skus = {row["sku"] for row in rows if row["sku"].startswith("CK-")}
+    assert len(skus) == 24 and "CK-7" not in skus
+    assert next(row for row in rows if row["sku"] == "CK-3")["price"] == 3.0
@@ -0,0 +1,87 @@
+import sys
+import os
+import re
+import json
+import argparse
+
+# Ensure the server directory and project root are on sys.path so imports work
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+for p in (SERVER_DIR, PROJECT_ROOT):
+    if p and p not in sys.path:
+        sys.path.insert(0, p)
+
+try:
+    from server.services.artifact_store import get_artifact_store
+except ImportError:
+    from services.artifact_store import get_artifact_store
+
+# product_analysis_<name>_<YYYYmmdd_HHMMSS>.json in server/
+ANALYSIS_RE = re.compile(r"^product_analysis_(.+)_\d{8}_\d{6}\.json$")
+# <idx>_<title>_<YYYYmmdd_HHMMSS>_{full,partN}.png in server/screenshots/
+SCREENSHOT_RE = re.compile(r"^\d+_(.+)_\d{8}_\d{6}_(full|part\d+)\.png$")
+
+
+def import_legacy(delete=False):
+    """Move the old product_analysis_*.json files and screenshots/*.png into the store."""
+    store = get_artifact_store()
+    imported = deduped = failed = 0
+
+    candidates = []
+    for name in sorted(os.listdir(SERVER_DIR)):
+        match = ANALYSIS_RE.match(name)
+        if match:
+            candidates.append((os.path.join(SERVER_DIR, name), "product_analysis", match.group(1)))
+    screenshots_dir = os.path.join(SERVER_DIR, "screenshots")
+    if os.path.isdir(screenshots_dir):
+        for name in sorted(os.listdir(screenshots_dir)):
+            match = SCREENSHOT_RE.match(name)
+            if match:
+                kind = "screenshot" if match.group(2) == "full" else "screenshot_part"
+                candidates.append((os.path.join(screenshots_dir, name), kind, match.group(1)))
+
+    for path, kind, product in candidates:
+        try:
+            if kind == "product_analysis":
+                with open(path, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+                ref = store.put_json(doc, kind, product=doc.get("product_name") or product)
+            else:
+                with open(path, "rb") as f:
+                    ref = store.put_bytes(f.read(), kind, product=product, ext=".png")
+        except Exception as e:
+            print(f"[WARN] {os.path.basename(path)}: {e}, skipping")
+            failed += 1
+            continue
+        imported += 1
+        deduped += ref["deduped"]
+        if delete:
+            os.remove(path)
+    return imported, deduped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the screenshot / analysis artifact store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show stored, unique and logical sizes")
+    evict = sub.add_parser("evict", help="Apply the size and age limits now")
+    evict.add_argument("--max-bytes", type=int, default=None)
+    evict.add_argument("--max-age-days", type=float, default=None)
+    legacy = sub.add_parser("import-legacy", help="Move product_analysis_*.json and screenshots/*.png into the store")
+    legacy.add_argument("--delete", action="store_true", help="Remove each file after it is imported")
+    args = parser.parse_args()
+
+    store = get_artifact_store()
+    if args.command == "evict":
+        removed = store.evict(max_bytes=args.max_bytes, max_age_days=args.max_age_days)
+        print(f"Deleted {removed} blobs")
+    elif args.command == "import-legacy":
+        imported, deduped, failed = import_legacy(delete=args.delete)
+        print(f"Done. Imported: {imported} ({deduped} already stored), Failed: {failed}")
+    print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import sys
+import os
+import json
+import argparse
+import logging
+from datetime import datetime
+
+# Ensure the server directory and project root are on sys.path so imports work
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+for p in (SERVER_DIR, PROJECT_ROOT):
+    if p and p not in sys.path:
+        sys.path.insert(0, p)
+
+try:
+    from server.services import batch
+except ImportError:
+    from services import batch
+
+
+def load_products(path):
+    """Products from a JSON array or a JSONL file (one product per line)."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1024).lstrip()
+    if head.startswith("["):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return list(batch.read_jsonl(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enrich products with batch jobs (transform, fill-missing, category) and store them in the products table.")
+    parser.add_argument("input", nargs="?", help="JSON array or JSONL file of product data (an optional "
+                                                 "'analysis' field per product enables fill-missing)")
+    parser.add_argument("--resume", metavar="RUN_DIR", help="Continue an interrupted run from its directory")
+    parser.add_argument("--tasks", default="transform,fill_missing,category",
+                        help="Comma-separated tasks, run in this order")
+    parser.add_argument("--backend", default=batch.BATCH_BACKEND, choices=("gemini", "local"),
+                        help="local answers every line with call_llm, for small runs and testing")
+    parser.add_argument("--model", default=batch.BATCH_MODEL)
+    parser.add_argument("--poll", type=float, default=batch.BATCH_POLL_S, help="Seconds between status checks")
+    parser.add_argument("--max-attempts", type=int, default=batch.BATCH_MAX_ATTEMPTS,
+                        help="Jobs per task, counting resubmissions of failed lines")
+    parser.add_argument("--no-store", action="store_true", help="Only enrich; leave the products table alone")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    tasks = [t.strip() for t in args.tasks.split(",") if t.strip()]
+    unknown = [t for t in tasks if t not in batch.TASKS]
+    if unknown:
+        parser.error(f"unknown task(s): {', '.join(unknown)}")
+
+    if args.resume:
+        run_dir = args.resume
+    elif args.input:
+        run_dir = os.path.join(batch.BATCH_DIR, datetime.now().strftime("%Y%m%d_%H%M%S"))
+    else:
+        parser.error("an input file or --resume is required")
+
+    runner = batch.BatchRunner(batch.get_backend(args.backend), run_dir, model=args.model,
+                               poll_s=args.poll, max_attempts=args.max_attempts)
+    items = runner.load_items() if args.resume else None
+    if items is None:
+        if not args.input:
+            parser.error(f"{run_dir} has no saved items; pass the input file again")
+        items = batch.items_from_products(load_products(args.input))
+    print(f"{len(items)} products, run directory {run_dir}")
+
+    if not args.no_store:
+        try:
+            from server import database
+        except ImportError:
+            import database
+        database.init_db()
+
+    summary = batch.run_backfill(items, runner, tasks=tasks, store=not args.no_store)
+
+    print(f"\n{'task':<14} {'requests':>9} {'ok':>6} {'failed':>7} {'jobs':>5}")
+    for task in summary["tasks"]:
+        print(f"{task['task']:<14} {task['requests']:>9} {task['succeeded']:>6} {task['failed']:>7} {task['jobs']:>5}")
+    print(f"\nStored {summary['stored']} products, {summary['not_stored']} not stored")
+    for item in items:
+        for task, error in (item.get("errors") or {}).items():
+            print(f"  [WARN] {item['key']} {task}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import sys
+import os
+import re
+import glob
+import time
+import argparse
+import difflib
+from collections import defaultdict
+
+# Ensure the server directory and project root are on sys.path so imports work
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+for p in (SERVER_DIR, PROJECT_ROOT):
+    if p and p not in sys.path:
+        sys.path.insert(0, p)
+
+try:
+    from server.services.image_encoding import encode_image
+except ImportError:
+    from services.image_encoding import encode_image
+
+# name -> encode_image kwargs; "png" sends the original slices (the old behaviour)
+CONFIGS = {
+    "png": None,
+    "webp-1280-q80": {"max_width": 1280, "fmt": "webp", "quality": 80, "greyscale": "auto"},
+    "webp-1280-q80-colour": {"max_width": 1280, "fmt": "webp", "quality": 80, "greyscale": "never"},
+    "webp-1024-q70": {"max_width": 1024, "fmt": "webp", "quality": 70, "greyscale": "auto"},
+    "jpeg-1280-q80": {"max_width": 1280, "fmt": "jpeg", "quality": 80, "greyscale": "auto"},
+}
+
+PRICE_RE = re.compile(r"\$\s?\d[\d,]*(?:\.\d{2})?")
+
+
+def group_pages(pattern):
+    """Group <idx>_<title>_<timestamp>_partN.png slices by page."""
+    pages = defaultdict(list)
+    for path in sorted(glob.glob(pattern)):
+        pages[os.path.basename(path).rsplit("_part", 1)[0]].append(path)
+    return pages
+
+
+def encode_page(paths, config):
+    """Returns (list of (bytes, mime_type), original_bytes, encode_seconds)."""
+    started = time.perf_counter()
+    parts, original = [], 0
+    for path in paths:
+        if config is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            parts.append((data, "image/png"))
+            original += len(data)
+        else:
+            encoded = encode_image(path, **config)
+            parts.append((encoded.data, encoded.mime_type))
+            original += encoded.original_bytes
+    return parts, original, time.perf_counter() - started
+
+
+def analyze(client, model, parts):
+    from google.genai import types
+
+    contents = ["Extract the product name, brand, price, materials and dimensions shown in these screenshots."]
+    contents += [types.Part.from_bytes(data=data, mime_type=mime) for data, mime in parts]
+    started = time.perf_counter()
+    response = client.models.generate_content(model=model, contents=contents)
+    return response.text or "", time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare screenshot encodings by payload size, latency and analysis agreement.")
+    parser.add_argument("--pattern", default=os.path.join(SERVER_DIR, "screenshots", "*_part*.png"))
+    parser.add_argument("--analyze", type=int, default=0,
+                        help="Also send this many pages to Gemini per config (needs GEMINI_API_KEY)")
+    parser.add_argument("--model", default="gemini-2.0-flash-exp")
+    args = parser.parse_args()
+
+    pages = group_pages(args.pattern)
+    if not pages:
+        print("No screenshot slices matched", args.pattern)
+        sys.exit(1)
+
+    print(f"{len(pages)} pages, {sum(len(v) for v in pages.values())} slices\n")
+    print(f"{'config':<22} {'sent bytes':>12} {'saved':>7} {'encode ms/page':>15}")
+    for name, config in CONFIGS.items():
+        sent = original = 0
+        seconds = 0.0
+        for paths in pages.values():
+            parts, page_original, elapsed = encode_page(paths, config)
+            sent += sum(len(data) for data, _ in parts)
+            original += page_original
+            seconds += elapsed
+        print(f"{name:<22} {sent:>12,} {100.0 * (original - sent) / original:>6.0f}% {1000 * seconds / len(pages):>15.0f}")
+
+    if not args.analyze:
+        return
+
+    from google import genai
+
+    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    print(f"\n{'config':<22} {'latency s':>10} {'similarity':>11} {'prices kept':>12}")
+    baselines = {}
+    for name, config in CONFIGS.items():
+        latency = similarity = 0.0
+        prices_kept = prices_total = 0
+        selected = list(pages.items())[:args.analyze]
+        for page, paths in selected:
+            parts, _, _ = encode_page(paths, config)
+            text, elapsed = analyze(client, args.model, parts)
+            latency += elapsed
+            if config is None:
+                baselines[page] = text
+            baseline = baselines.get(page, text)
+            # Agreement with the PNG baseline: overall text similarity and whether its prices survive
+            similarity += difflib.SequenceMatcher(None, baseline, text).ratio()
+            expected = set(PRICE_RE.findall(baseline))
+            prices_total += len(expected)
+            prices_kept += sum(1 for price in expected if price in text)
+        n = len(selected)
+        kept = f"{prices_kept}/{prices_total}"
+        print(f"{name:<22} {latency / n:>10.2f} {similarity / n:>11.2f} {kept:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import sys
+import os
+import re
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+# Time only the import, in a fresh interpreter each run
+SNIPPET = "import time; t = time.perf_counter(); import server.app; print(time.perf_counter() - t)"
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure(root, runs, env):
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", SNIPPET], cwd=root, env=env,
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def top_imports(root, env, limit):
+    """Slowest top-level imports under server.app, by cumulative microseconds."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server.app"], cwd=root, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        # Two spaces of indent = imported directly by a first-level module
+        if match and len(match.group(3)) <= 2:
+            rows.append((int(match.group(2)), match.group(4)))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def report(label, root, runs, env, limit):
+    times = measure(root, runs, env)
+    print(f"{label}: median {statistics.median(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms over {runs} runs")
+    for cumulative_us, name in top_imports(root, env, limit):
+        print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start time of `import server.app`.")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10, help="Show the N slowest imports")
+    parser.add_argument("--ref", default=None,
+                        help="Also measure this git ref (e.g. HEAD~1) in a temporary worktree, for a before/after comparison")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # server.app needs a Mongo URI to be importable before lazy loading; nothing connects to it
+    env.setdefault("MONGO_URI", "mongodb://localhost:27017/carbon0")
+    env.pop("EAGER_WARMUP", None)
+
+    before = None
+    if args.ref:
+        worktree = tempfile.mkdtemp(prefix="bench_import_")
+        try:
+            subprocess.run(["git", "worktree", "add", "--detach", worktree, args.ref], cwd=PROJECT_ROOT,
+                           check=True, capture_output=True)
+            before = report(f"{args.ref}", worktree, args.runs, env, args.top)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=PROJECT_ROOT, capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    after = report("working tree", PROJECT_ROOT, args.runs, env, args.top)
+    if before:
+        print(f"\n{(before - after) * 1000:.0f} ms faster ({100 * (before - after) / before:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
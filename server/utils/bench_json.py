@@ -0,0 +1,80 @@
+import sys
+import os
+import glob
+import gzip
+import json
+import time
+import argparse
+
+# Ensure the server directory and project root are on sys.path so imports work
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+for p in (SERVER_DIR, PROJECT_ROOT):
+    if p and p not in sys.path:
+        sys.path.insert(0, p)
+
+try:
+    from server.services import fast_json
+except ImportError:
+    from services import fast_json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def load_samples(pattern):
+    samples = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            samples.append((os.path.basename(path), json.load(f)))
+    return samples
+
+
+def per_call_us(fn, obj, min_seconds):
+    """Mean wall time of fn(obj) in microseconds, repeated for at least min_seconds."""
+    fn(obj)
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        fn(obj)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare stdlib json and orjson on stored analysis artifacts.")
+    parser.add_argument("--pattern", default=os.path.join(SERVER_DIR, "*_output_*.json"),
+                        help="Glob of JSON files to use as payloads")
+    parser.add_argument("--seconds", type=float, default=0.5, help="Minimum run time per measurement")
+    args = parser.parse_args()
+
+    samples = load_samples(args.pattern) or load_samples(os.path.join(SERVER_DIR, "product_analysis_*.json"))
+    if not samples:
+        print("No sample JSON files matched", args.pattern)
+        sys.exit(1)
+
+    print(f"orjson available: {fast_json.orjson is not None}, zstandard available: {zstandard is not None}")
+    header = f"{'payload':<50} {'bytes':>8} {'json':>9} {'indent':>9} {'fast':>9} {'saved':>7} {'gzip':>8} {'zstd':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, obj in samples:
+        stdlib_us = per_call_us(lambda o: json.dumps(o, ensure_ascii=False).encode("utf-8"), obj, args.seconds)
+        indent_us = per_call_us(lambda o: json.dumps(o, indent=2, ensure_ascii=False).encode("utf-8"), obj, args.seconds)
+        fast_us = per_call_us(fast_json.dumpb, obj, args.seconds)
+        body = fast_json.dumpb(obj)
+        gz = len(gzip.compress(body, compresslevel=6))
+        zs = len(zstandard.ZstdCompressor(level=3).compress(body)) if zstandard is not None else 0
+        print(f"{name[:50]:<50} {len(body):>8} {stdlib_us:>7.1f}us {indent_us:>7.1f}us {fast_us:>7.1f}us "
+              f"{indent_us - fast_us:>5.0f}us {gz:>8} {zs:>8}")
+    print("\njson/indent: stdlib json.dumps compact / indent=2 (the old jsonify and artifact paths); "
+          "fast: fast_json.dumpb; saved: indent - fast per call; gzip/zstd: compressed body bytes")
+
+
+if __name__ == "__main__":
+    main()
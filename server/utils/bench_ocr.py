@@ -0,0 +1,93 @@
+import sys
+import os
+import glob
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# Ensure the server directory and project root are on sys.path so imports work
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+for p in (SERVER_DIR, PROJECT_ROOT):
+    if p and p not in sys.path:
+        sys.path.insert(0, p)
+
+try:
+    from server.services import ocr
+except ImportError:
+    from services import ocr
+
+
+def group_pages(pattern):
+    """Group <idx>_<title>_<timestamp>_partN.png slices by page."""
+    pages = defaultdict(list)
+    for path in sorted(glob.glob(pattern)):
+        pages[os.path.basename(path).rsplit("_part", 1)[0]].append(path)
+    return pages
+
+
+def run_ocr(pages, workers):
+    """Returns ({page: [text per tile]}, seconds)."""
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {page: pool.map(ocr._ocr_file, paths) for page, paths in pages.items()}
+        texts = {page: list(result) for page, result in futures.items()}
+    return texts, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Tesseract OCR throughput with the Gemini vision path on saved screenshots.")
+    parser.add_argument("--pattern", default=os.path.join(SERVER_DIR, "screenshots", "*_part*.png"))
+    parser.add_argument("--workers", default=f"1,{ocr.OCR_WORKERS}",
+                        help="Comma-separated process pool sizes to time")
+    parser.add_argument("--analyze", type=int, default=0,
+                        help="Also analyze this many pages with OCR + text LLM and with Gemini vision (needs API keys)")
+    args = parser.parse_args()
+
+    if not ocr.ocr_available():
+        print("pytesseract or the tesseract binary is not installed")
+        sys.exit(1)
+    pages = group_pages(args.pattern)
+    if not pages:
+        print("No screenshot slices matched", args.pattern)
+        sys.exit(1)
+    tiles = sum(len(v) for v in pages.values())
+    print(f"{len(pages)} pages, {tiles} slices\n")
+
+    print(f"{'workers':>8} {'seconds':>9} {'tiles/s':>9} {'pages/s':>9}")
+    texts = None
+    for workers in sorted({int(w) for w in args.workers.split(",") if w.strip()}):
+        texts, seconds = run_ocr(pages, workers)
+        print(f"{workers:>8} {seconds:>9.2f} {tiles / seconds:>9.2f} {len(pages) / seconds:>9.2f}")
+
+    print(f"\n{'page':<48} {'ocr chars':>10} {'relevant':>9} {'price':>6}")
+    for page, page_texts in texts.items():
+        relevant = ocr.relevant_text(ocr.clean_lines(page_texts))
+        found = "yes" if ocr.PRICE_RE.search(relevant) else "no"
+        print(f"{page[:48]:<48} {sum(len(t) for t in page_texts):>10,} {len(relevant):>9,} {found:>6}")
+
+    if not args.analyze:
+        return
+
+    try:
+        from server.agents.gemini_image import analyze_product_images
+    except ImportError:
+        from agents.gemini_image import analyze_product_images
+
+    print(f"\n{'page':<48} {'ocr+llm s':>10} {'vision s':>9}")
+    for page, paths in list(pages.items())[:args.analyze]:
+        started = time.perf_counter()
+        ocr_result = ocr.analyze_with_ocr(paths)
+        ocr_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        vision_result = analyze_product_images(paths)
+        vision_seconds = time.perf_counter() - started
+        status = "" if ocr_result.get("success") and vision_result.get("success") else "  (failed)"
+        print(f"{page[:48]:<48} {ocr_seconds:>10.2f} {vision_seconds:>9.2f}{status}")
+
+
+if __name__ == "__main__":
+    main()
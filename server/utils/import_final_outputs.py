@@ -0,0 +1,80 @@
+import sys
+import os
+import re
+import json
+import argparse
+
+# Ensure the server directory and project root are on sys.path so imports work
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
+SERVER_DIR = os.path.dirname(SCRIPT_DIR)                    # .../server
+PROJECT_ROOT = os.path.dirname(SERVER_DIR)
+
+for p in (SERVER_DIR, PROJECT_ROOT):
+    if p and p not in sys.path:
+        sys.path.insert(0, p)
+
+try:
+    import database as db
+except Exception:
+    try:
+        from server import database as db
+    except Exception as e:
+        print("Failed to import database module. sys.path:", sys.path[:5])
+        raise
+
+# final_output_20251109_071249.json
+FILENAME_RE = re.compile(r"^final_output_(\d{8}_\d{6})\.json$")
+
+
+def import_directory(directory, delete=False):
+    """
+    Import every final_output_<timestamp>.json file in ``directory`` into the
+    final_outputs table. The file stem becomes the id, so links handed out
+    before the migration keep resolving. Rows are stamped with the import
+    time, not the timestamp in the file name, so the retention window starts
+    now instead of the next prune deleting everything that was imported.
+    Returns ``(imported, failed)``.
+    """
+    db.init_db()
+    imported = failed = 0
+    for name in sorted(os.listdir(directory)):
+        if not FILENAME_RE.match(name):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                output = json.load(f)
+            product = output.get("product", {}) if isinstance(output, dict) else {}
+            db.save_final_output(
+                output,
+                url=product.get("url") if isinstance(product, dict) else None,
+                output_id=name[:-len(".json")],
+                prune=False,
+            )
+        except Exception as e:
+            print(f"[WARN] {name}: {e}, skipping")
+            failed += 1
+            continue
+        imported += 1
+        if delete:
+            os.remove(path)
+    return imported, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move final_output_*.json files into the database.")
+    parser.add_argument("directory", nargs="?", default=SERVER_DIR,
+                        help="Directory holding the JSON files (default: server/)")
+    parser.add_argument("--delete", action="store_true", help="Remove each file after it is imported")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print("Directory not found:", args.directory)
+        sys.exit(1)
+
+    imported, failed = import_directory(args.directory, delete=args.delete)
+    print(f"Done. Imported: {imported}, Failed: {failed}")
+
+
+if __name__ == "__main__":
+    main()
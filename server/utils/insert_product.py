@@ -1,6 +1,10 @@
 import sys
 import os
 import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 # Ensure the server directory and project root are on sys.path so imports work
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))    # .../server/utils
@@ -24,30 +28,123 @@ except Exception:
         print("Failed to import database module. sys.path:", sys.path[:5])
         raise
 
-def load_json(path):
+READ_CHUNK_SIZE = 1 << 16
+# A single record larger than this is treated as malformed input rather than buffered further
+MAX_RECORD_CHARS = 64 << 20
+DEFAULT_BATCH_SIZE = 1000
+PROGRESS_EVERY_SECONDS = 2.0
+
+
+def _first_significant_char(path):
     with open(path, "r", encoding="utf-8") as f:
-        text = f.read().strip()
-        if not text:
-            return []
-        # Try full JSON array/object first
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return ""
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped[0]
+
+
+def _iter_json_values(f):
+    """
+    Incrementally decode a JSON array, a single object, or concatenated JSON
+    values from a text stream, keeping at most one value plus one read chunk
+    in memory.
+
+    A value that cannot be decoded is only completed with more input while
+    that could still fix it: if the decoder fails at the same place after
+    another chunk has been appended (or the value outgrows
+    ``MAX_RECORD_CHARS``), the input is malformed and the error is raised
+    at once instead of after buffering the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    last_error = None  # (position relative to the value, message) of the previous failed attempt
+    while True:
+        # Skip whitespace and array punctuation between values
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                return
+            buf = f.read(READ_CHUNK_SIZE)
+            pos = 0
+            eof = not buf
+            continue
         try:
-            data = json.loads(text)
-            # If it's a single object, wrap to list
-            if isinstance(data, dict):
-                return [data]
-            elif isinstance(data, list):
-                return data
-        except json.JSONDecodeError:
-            # Fallback to newline-delimited JSON (NDJSON)
-            items = []
-            f.seek(0)
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                items.append(json.loads(line))
-            return items
-    return []
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise
+            error = (e.pos - pos, e.msg)
+            # An unterminated string legitimately fails at its start until its closing quote arrives
+            if (error == last_error and not e.msg.startswith("Unterminated string")) \
+                    or len(buf) - pos > MAX_RECORD_CHARS:
+                raise
+            last_error = error
+            more = f.read(READ_CHUNK_SIZE)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        last_error = None
+        yield value
+        pos = end
+        if pos > READ_CHUNK_SIZE:
+            buf = buf[pos:]
+            pos = 0
+
+
+def iter_records(path, skip=0):
+    """
+    Stream raw records from a JSON array / object file or an NDJSON file.
+
+    Yields ``(index, record)`` where index is the 0-based position of the record
+    in the file. The first ``skip`` records are passed over without being
+    returned; for NDJSON they are skipped without being decoded at all.
+    Undecodable NDJSON lines are yielded as ``(index, None)`` so they can be
+    counted as failures.
+    """
+    first = _first_significant_char(path)
+    if not first:
+        return
+
+    if first == "[":
+        with open(path, "r", encoding="utf-8") as f:
+            for index, value in enumerate(_iter_json_values(f)):
+                if index >= skip:
+                    yield index, value
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        index = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if index < skip:
+                index += 1
+                continue
+            try:
+                value = json.loads(line)
+            except json.JSONDecodeError:
+                if index == 0:
+                    # Not NDJSON after all (e.g. a pretty-printed single object)
+                    break
+                value = None
+            yield index, value
+            index += 1
+        else:
+            return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for index, value in enumerate(_iter_json_values(f)):
+            if index >= skip:
+                yield index, value
+
 
 def normalize_product(p):
     out = {}
@@ -64,40 +161,165 @@ def normalize_product(p):
     out["cf_detail"] = p.get("cf_detail")
     return out
 
+
+def normalize_batch(batch):
+    """
+    Validate and normalize a list of ``(index, raw)`` records.
+    Returns ``(products, errors)`` where errors is a list of ``(index, message)``.
+    Runs inside worker processes, so it must stay a top-level function.
+    """
+    products = []
+    errors = []
+    for index, raw in batch:
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError("record is not a JSON object")
+            prod = normalize_product(raw)
+            if not prod.get("sku"):
+                raise ValueError("no sku")
+            products.append(prod)
+        except Exception as e:
+            errors.append((index, str(e)))
+    return products, errors
+
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _map_bounded(executor, fn, batches, window):
+    """Like executor.map, but never holds more than ``window`` batches in flight."""
+    pending = []
+    for batch in batches:
+        pending.append(executor.submit(fn, batch))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for fut in pending:
+        yield fut.result()
+
+
+def checkpoint_path_for(json_path):
+    return json_path + ".checkpoint"
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("offset", 0))
+    except (OSError, ValueError, TypeError):
+        return 0
+
+
+def write_checkpoint(path, offset):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset, "updated_at": time.time()}, f)
+    os.replace(tmp, path)
+
+
+def ingest(json_path, batch_size=DEFAULT_BATCH_SIZE, workers=None, offset=0, checkpoint_path=None):
+    """
+    Stream products from ``json_path`` into the database.
+
+    Records are validated/normalized in a process pool (``workers=0`` runs inline)
+    and committed ``batch_size`` rows per transaction over a single connection.
+    After each commit the number of consumed source records is written to
+    ``checkpoint_path`` so an interrupted import can be resumed with ``offset``.
+    Returns a stats dict.
+    """
+    # Ensure DB/tables exist
+    db.init_db()
+
+    conn = db.get_connection()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    stats = {"inserted": 0, "failed": 0, "seen": 0, "offset": offset}
+    started = time.monotonic()
+    last_report = started
+
+    batches = _batched(iter_records(json_path, skip=offset), batch_size)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 0 else None
+    try:
+        if executor is not None:
+            window = 2 * (workers or os.cpu_count() or 1)
+            results = _map_bounded(executor, normalize_batch, batches, window)
+        else:
+            results = (normalize_batch(b) for b in batches)
+
+        for products, errors in results:
+            for index, message in errors:
+                print(f"[WARN] item #{index + 1}: {message}, skipping")
+            if products:
+                db.insert_products(products, conn=conn)
+            stats["inserted"] += len(products)
+            stats["failed"] += len(errors)
+            stats["seen"] += len(products) + len(errors)
+            stats["offset"] = offset + stats["seen"]
+            if checkpoint_path:
+                write_checkpoint(checkpoint_path, stats["offset"])
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_EVERY_SECONDS:
+                rate = stats["seen"] / max(now - started, 1e-9)
+                print(f"  offset={stats['offset']} inserted={stats['inserted']} "
+                      f"failed={stats['failed']} ({rate:,.0f} rows/s)")
+                last_report = now
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        conn.close()
+
+    stats["elapsed_seconds"] = time.monotonic() - started
+    stats["rows_per_second"] = stats["seen"] / max(stats["elapsed_seconds"], 1e-9)
+    return stats
+
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: insert_product.py /path/to/products.json")
-        sys.exit(2)
+    parser = argparse.ArgumentParser(description="Stream a JSON / NDJSON product catalog into the database.")
+    parser.add_argument("json_path", help="Path to a JSON array, JSON object or NDJSON file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per commit")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Normalization worker processes (0 = inline, default = CPU count)")
+    parser.add_argument("--offset", type=int, default=None,
+                        help="Number of source records to skip before importing")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume from the offset stored in the checkpoint file")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file (default: <json_path>.checkpoint)")
+    args = parser.parse_args()
 
-    json_path = sys.argv[1]
+    json_path = args.json_path
     if not os.path.isfile(json_path):
         print("File not found:", json_path)
         sys.exit(1)
 
-    items = load_json(json_path)
-    if not items:
+    checkpoint = args.checkpoint or checkpoint_path_for(json_path)
+    offset = args.offset if args.offset is not None else 0
+    if args.resume and args.offset is None:
+        offset = read_checkpoint(checkpoint)
+        print(f"Resuming from offset {offset}")
+
+    stats = ingest(json_path, batch_size=max(1, args.batch_size), workers=args.workers,
+                   offset=offset, checkpoint_path=checkpoint)
+
+    if stats["seen"] == 0:
         print("No items found in JSON.")
         sys.exit(0)
 
-    # Ensure DB/tables exist
-    db.init_db()
+    print(f"Done. Inserted: {stats['inserted']}, Failed: {stats['failed']}, "
+          f"Total source items: {stats['seen']} (from offset {offset}) "
+          f"in {stats['elapsed_seconds']:.1f}s ({stats['rows_per_second']:,.0f} rows/s)")
 
-    inserted = 0
-    failed = 0
-    for i, raw in enumerate(items, start=1):
-        try:
-            prod = normalize_product(raw)
-            if not prod.get("sku"):
-                print(f"[WARN] item #{i} has no sku, skipping")
-                failed += 1
-                continue
-            db.insert_product(prod)
-            inserted += 1
-        except Exception as e:
-            print(f"[ERROR] failed to insert item #{i}: {e}")
-            failed += 1
+    # The import ran to completion, so there is nothing left to resume
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
 
-    print(f"Done. Inserted: {inserted}, Failed: {failed}, Total source items: {len(items)}")
 
 if __name__ == "__main__":
     main()